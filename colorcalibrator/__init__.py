@@ -1,33 +1,16 @@
 # -*- coding: utf-8 -*-
-# pylint:disable=logging-format-interpolation
-"""Calling the layout of the app as a function of the path"""
-import dash_core_components as dcc
-import dash_html_components as html
-from dash.dependencies import Input, Output, State
-from flask import session
+"""Calibration of images with colour checkers, as web app (``app`` and
+``server``, set up in web.py on first access) and on the command line
+(``python -m colorcalibrator``), which hence does not import Dash and Flask"""
 
-from . import layout
-from .app import app, server
-from .dash_reusable_components import pil_to_b64
+_WEB = ("app", "server")
 
-app.layout = html.Div(
-    [dcc.Location(id="url", refresh=False), html.Div(id="page-content")]
-)
 
+def __getattr__(name):
+    if name not in _WEB:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    from . import web  # pylint:disable=import-outside-toplevel
 
-@app.callback(
-    Output("page-content", "children"),
-    [Input("url", "pathname")],
-)
-def display_page(_):
-    """Display the layout as function of the url"""
-    # session.clear()
-    # IM_PLACEHOLDER = pil_to_b64(Image.open('./images/default.jpg'))
-    # session['image_string'] = IM_PLACEHOLDER
-    # del IM_PLACEHOLDER
-
-    return layout.serve_layout()
-
-
-if __name__ == "__main__":
-    app.run_server(debug=True, host="0.0.0.0")
+    # importing web.py binds the submodule colorcalibrator.app to ``app``
+    globals().update({attribute: getattr(web, attribute) for attribute in _WEB})
+    return globals()[name]
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""Command line interface, ``python -m colorcalibrator <command>``"""
+import argparse
+import sys
+
+
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("{} is not a positive integer".format(value))
+    return number
+
+
+def _add_calibration_arguments(parser):
+    parser.add_argument(
+        "--card",
+        default="spyder24",
+        help="calibration card, a chart name of colorcalibrator/data/charts or "
+        "CHART_PATHS, or auto to identify it in every image (default: spyder24)",
+    )
+    parser.add_argument(
+        "--algorithm",
+        default="finlayson",
+        choices=["finlayson", "cheung", "vandermonde"],
+        help="colour correction algorithm (default: finlayson)",
+    )
+    parser.add_argument(
+        "--exclude",
+        type=int,
+        nargs="+",
+        default=None,
+        help="indices of the patches that are not used for the calibration",
+    )
+    parser.add_argument(
+        "--only-white-point",
+        action="store_true",
+        help="only correct the white point",
+    )
+    parser.add_argument(
+        "--tile-rows",
+        type=int,
+        default=None,
+        help="calibrate in bands of that many rows to bound the memory",
+    )
+    parser.add_argument(
+        "--dtype",
+        default="float64",
+        choices=["float32", "float64"],
+        help="float precision, float32 looks up the sRGB curves (default: float64)",
+    )
+    parser.add_argument(
+        "--detection-width",
+        type=int,
+        default=None,
+        help="locate the card on a copy with that many pixels on the longer side "
+        "(at most 1440, where the segmentation runs) and sample the swatches at "
+        "full resolution",
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="colorcalibrator", description=__doc__)
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    batch = subparsers.add_parser("batch", help="calibrate many images")
+    batch.add_argument(
+        "inputs", nargs="+", help="image files, directories or glob patterns"
+    )
+    batch.add_argument("-o", "--output", required=True, help="output directory")
+    _add_calibration_arguments(batch)
+    batch.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of cores)",
+    )
+    batch.add_argument(
+        "--image-format",
+        default="png",
+        choices=["png", "jpg", "tiff"],
+        help="format of the calibrated images (default: png)",
+    )
+    batch.add_argument(
+        "--report-format",
+        default="csv",
+        choices=["csv", "parquet"],
+        help="format of the swatch reports (default: csv)",
+    )
+    batch.add_argument(
+        "--profile",
+        default=None,
+        help="apply this calibration profile instead of detecting the card in every image",
+    )
+    batch.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="ignore the checkpoint in the output directory and start over",
+    )
+    batch.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="calibrate the images that failed in a previous run again",
+    )
+
+    profile = subparsers.add_parser(
+        "profile", help="fit a calibration profile on a reference image"
+    )
+    profile.add_argument("image", help="image with the calibration card")
+    profile.add_argument("-o", "--output", required=True, help="profile file (JSON)")
+    _add_calibration_arguments(profile)
+
+    video = subparsers.add_parser(
+        "video", help="calibrate a video or an image sequence with the card in it"
+    )
+    video.add_argument(
+        "input", help="video file, or directory or glob pattern of the frames"
+    )
+    video.add_argument("-o", "--output", required=True, help="calibrated video")
+    _add_calibration_arguments(video)
+    video.add_argument(
+        "--roi",
+        type=int,
+        nargs=4,
+        default=None,
+        metavar=("X0", "Y0", "X1", "Y1"),
+        help="box in pixels (origin top left) whose colour is measured in every frame",
+    )
+    video.add_argument(
+        "--refit-delta-e",
+        type=float,
+        default=1.0,
+        help="fit the calibration again if the mean ΔE of the swatches grew by "
+        "more than this since the last fit (default: 1.0)",
+    )
+    video.add_argument(
+        "--keyframe-interval",
+        type=_positive_int,
+        default=30,
+        help="locate the card again every that many frames, it is tracked in "
+        "between (default: 30)",
+    )
+    video.add_argument(
+        "--fps",
+        type=float,
+        default=None,
+        help="frame rate of image sequences (default: 10) or of the output",
+    )
+    video.add_argument(
+        "--codec", default="mp4v", help="fourcc of the output video (default: mp4v)"
+    )
+    video.add_argument(
+        "--series",
+        default=None,
+        help="CSV file of the time series (default: the output with .csv)",
+    )
+
+    codecs = subparsers.add_parser(
+        "codecs", help="compare the codecs of the image store on some images"
+    )
+    codecs.add_argument(
+        "images", nargs="*", default=["images/default.jpg"], help="image files"
+    )
+    codecs.add_argument(
+        "--repeat", type=int, default=3, help="repetitions, the best time is reported"
+    )
+    codecs.add_argument("--json", action="store_true", help="print the results as JSON")
+
+    bench = subparsers.add_parser(
+        "benchmark", help="time the hot paths on synthetic images"
+    )
+    bench.add_argument(
+        "--sizes",
+        type=float,
+        nargs="+",
+        default=[1, 12, 50],
+        help="image sizes in megapixels (default: 1 12 50)",
+    )
+    bench.add_argument("--repeat", type=int, default=3, help="repetitions")
+    bench.add_argument(
+        "--only", nargs="+", default=None, help="names of the benchmarks to run"
+    )
+    bench.add_argument(
+        "--no-callback",
+        action="store_true",
+        help="do not benchmark the dash callback",
+    )
+    bench.add_argument(
+        "-o", "--output", default=None, help="write the results to this JSON file"
+    )
+    bench.add_argument(
+        "--compare",
+        default=None,
+        help="JSON file with the results of an earlier run to compare with",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "batch":
+        # pylint:disable=import-outside-toplevel
+        from .batch import run_batch
+        from .profile import CalibrationProfile
+
+        records = run_batch(
+            args.inputs,
+            args.output,
+            card=args.card,
+            excluded=args.exclude,
+            algorithm=args.algorithm,
+            only_white_point=args.only_white_point,
+            workers=args.workers,
+            image_format=args.image_format,
+            report_format=args.report_format,
+            resume=not args.no_resume,
+            retry_failed=args.retry_failed,
+            profile=CalibrationProfile.load(args.profile) if args.profile else None,
+            tile_rows=args.tile_rows,
+            dtype=args.dtype,
+            detection_width=args.detection_width,
+        )
+        return int(any(record["status"] != "ok" for record in records))
+
+    if args.command == "profile":
+        # pylint:disable=import-outside-toplevel
+        import numpy as np
+        from PIL import Image
+
+        from .utils import fit_profile
+
+        fit_profile(
+            np.asarray(Image.open(args.image).convert("RGB")),
+            args.card,
+            args.exclude,
+            args.algorithm,
+            args.only_white_point,
+            tile_rows=args.tile_rows,
+            dtype=args.dtype,
+            detection_width=args.detection_width,
+        ).save(args.output)
+
+    if args.command == "video":
+        # pylint:disable=import-outside-toplevel
+        from .detection import WORKING_WIDTH
+        from .video import calibrate_video
+
+        summary = calibrate_video(
+            args.input,
+            args.output,
+            roi=args.roi,
+            card=args.card,
+            excluded=args.exclude,
+            algorithm=args.algorithm,
+            only_white_point=args.only_white_point,
+            refit_delta_e=args.refit_delta_e,
+            keyframe_interval=args.keyframe_interval,
+            fps=args.fps,
+            dtype=args.dtype,
+            detection_width=args.detection_width or WORKING_WIDTH,
+            tile_rows=args.tile_rows,
+            codec=args.codec,
+            series=args.series,
+        )
+        print(
+            "{frames} frames ({keyframes} keyframes, {detections} detections, "
+            "{refits} refits) written to {output}, time series in {series}".format(
+                **summary
+            )
+        )
+
+    if args.command == "benchmark":
+        # pylint:disable=import-outside-toplevel
+        import json
+
+        from . import benchmark
+
+        sizes = [int(size) if size.is_integer() else size for size in args.sizes]
+        report = benchmark.report(
+            benchmark.run(
+                sizes, args.repeat, callback=not args.no_callback, only=args.only
+            )
+        )
+        if args.output:
+            with open(args.output, "w") as handle:
+                json.dump(report, handle, indent=2)
+        for result in report["results"]:
+            print(
+                "{}\t{}\t{:.4f} s".format(
+                    result["name"], json.dumps(result["params"]), result["best_s"]
+                )
+            )
+        if args.compare:
+            with open(args.compare) as handle:
+                comparison = benchmark.compare(json.load(handle), report)
+            print("\nCompared with {}".format(args.compare))
+            for result in comparison:
+                print(
+                    "{}\t{}\t{:.4f} s -> {:.4f} s ({:.2f}x)".format(
+                        result["name"],
+                        json.dumps(result["params"]),
+                        result["old_s"],
+                        result["new_s"],
+                        result["ratio"],
+                    )
+                )
+
+    if args.command == "codecs":
+        # pylint:disable=import-outside-toplevel
+        import json
+
+        from PIL import Image
+
+        from .image_codecs import benchmark
+
+        results = benchmark([Image.open(path) for path in args.images], args.repeat)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print("image\tcodec\tencode [ms]\tdecode [ms]\tMB")
+            for result in results:
+                print(
+                    "{}\t{}\t{:.1f}\t{:.1f}\t{:.2f}".format(
+                        args.images[result["image"]],
+                        result["codec"],
+                        result["encode_s"] * 1000,
+                        result["decode_s"] * 1000,
+                        result["bytes"] / 1024**2,
+                    )
+                )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
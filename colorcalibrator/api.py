@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""REST/JSON endpoints for programmatic use, next to the Dash UI.
+
+POST /api/upload      the image file as request body (not multipart), streamed
+                      to the store, returns its id
+POST /api/calibrate   multipart ``image`` (+ form fields card, algorithm,
+                      exclude, only_white_point), returns the calibrated PNG with
+                      a summary (image_id, card, mean_delta_e) in the
+                      ``X-Calibration-Stats`` header, or JSON with the statistics
+                      of every swatch if the client prefers application/json, the
+                      card is a chart name (see charts.py) or "auto"
+POST /api/measure     multipart ``image`` or form field ``image_id`` and the box
+                      x0, y0, x1, y1 in pixels (origin top left)
+POST /api/name        JSON {"colors": [[r, g, b], ...]} in the range 0-255
+GET  /api/images/<id> an image from the server-side store
+GET  /api/cache       hit and miss counters of the calibration cache
+"""
+import json
+from io import BytesIO as _BytesIO
+from urllib.parse import unquote
+
+import numpy as np
+from flask import Blueprint, current_app, jsonify, request, send_file, url_for
+from PIL import Image
+
+from .calibration_cache import get_calibration_cache
+from .image_codecs import to_transport
+from .image_store import ImageNotFoundError, get_image_store
+from .utils import closest_name, closest_names
+from .workers import calibrate_image, region_statistics
+
+api = Blueprint("api", __name__, url_prefix="/api")  # pylint:disable=invalid-name
+
+
+class ApiError(Exception):
+    """Error that is returned to the client as JSON"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api.errorhandler(ApiError)
+def handle_api_error(error):
+    return jsonify({"error": error.message}), error.status
+
+
+def _truthy(value):
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+def _uploaded_image():
+    """Store the uploaded image (or look up ``image_id``) and return id and image"""
+    store = get_image_store()
+    if "image" in request.files:
+        data = request.files["image"].read()
+        try:
+            image = Image.open(_BytesIO(data))
+        except Image.DecompressionBombError:
+            raise ApiError("The image has too many pixels", 413)
+        except OSError:
+            raise ApiError("Could not read the image")
+        _image_info(image)
+        return store.put(data), image
+
+    image_id = request.form.get("image_id")
+    if not image_id:
+        raise ApiError("Upload an image (field 'image') or give an 'image_id'")
+    try:
+        return image_id, store.get_pil(image_id)
+    except ImageNotFoundError:
+        raise ApiError("Unknown image id {}".format(image_id), 404)
+
+
+def _excluded():
+    values = request.form.getlist("exclude")
+    if len(values) == 1:
+        values = values[0].split(",")
+    try:
+        return [int(value) for value in values if value.strip()] or None
+    except ValueError:
+        raise ApiError("'exclude' has to be a list of integers")
+
+
+def _wants_json():
+    best = request.accept_mimetypes.best_match(["image/png", "application/json"])
+    return best == "application/json"
+
+
+def _image_info(image):
+    if Image.MAX_IMAGE_PIXELS and image.size[0] * image.size[1] > Image.MAX_IMAGE_PIXELS:
+        raise ApiError("The image has too many pixels", 413)
+    return {
+        "format": image.format,
+        "width": image.size[0],
+        "height": image.size[1],
+        "mode": image.mode,
+    }
+
+
+class _HeaderCheck:
+    """Passes the chunks of an upload through and identifies the image from the
+    first ``max_header`` bytes, without decoding the pixels"""
+
+    def __init__(self, chunks, max_bytes, max_header=1024**2):
+        self.chunks = chunks
+        self.max_bytes = max_bytes
+        self.max_header = max_header
+        self.header = b""
+        self.info = None
+        self.size = 0
+
+    def _identify(self):
+        try:
+            image = Image.open(_BytesIO(self.header))
+        except Image.DecompressionBombError:
+            raise ApiError("The image has too many pixels", 413)
+        except Exception:  # pylint:disable=broad-except
+            return  # unknown format or the header is not complete yet
+        self.info = _image_info(image)
+        self.header = None
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.size += len(chunk)
+            if self.size > self.max_bytes:
+                raise ApiError(
+                    "The file is larger than {} bytes".format(self.max_bytes), 413
+                )
+            if self.info is None and len(self.header) < self.max_header:
+                self.header += chunk[: self.max_header - len(self.header)]
+                self._identify()
+            yield chunk
+
+
+def _request_chunks(chunk_size):
+    while True:
+        chunk = request.stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+@api.route("/upload", methods=["POST"])
+def upload():
+    """Stream the request body into the store, the image is identified on the
+    way from its header. Images whose header is not within the first MB (e.g.
+    TIFFs with the directory at the end) are identified afterwards."""
+    store = get_image_store()
+    check = _HeaderCheck(
+        _request_chunks(int(current_app.config.get("UPLOAD_CHUNK_BYTES", 1024**2))),
+        int(current_app.config.get("UPLOAD_MAX_BYTES", 100 * 1024**2)),
+    )
+    image_id = store.put_stream(check)
+    if check.info is None:
+        try:
+            check.info = _image_info(store.get_pil(image_id))
+        except ApiError:
+            store.delete(image_id)
+            raise
+        except Image.DecompressionBombError:
+            store.delete(image_id)
+            raise ApiError("The image has too many pixels", 413)
+        except Exception:  # pylint:disable=broad-except
+            store.delete(image_id)
+            raise ApiError("Could not read the image")
+    return jsonify(
+        {
+            "image_id": image_id,
+            # URI-encoded, as headers are latin-1
+            "filename": unquote(request.headers.get("X-Filename", "")) or None,
+            "bytes": check.size,
+            **check.info,
+        }
+    )
+
+
+@api.route("/calibrate", methods=["POST"])
+def calibrate():
+    """Calibrate the uploaded image"""
+    _, image = _uploaded_image()
+    try:
+        img, merged_df, profile = calibrate_image(
+            np.asarray(image.convert("RGB")),
+            request.form.get("card", "spyder24"),
+            _excluded(),
+            request.form.get("algorithm", "finlayson"),
+            _truthy(request.form.get("only_white_point", False)),
+            tile_rows=current_app.config.get("CALIBRATION_TILE_ROWS") or None,
+            dtype=current_app.config.get("CALIBRATION_DTYPE", "float64"),
+            cache=get_calibration_cache(),
+            detection_width=current_app.config.get("CALIBRATION_DETECTION_WIDTH")
+            or None,
+            return_profile=True,
+        )
+    except NotImplementedError:
+        raise ApiError("Unknown card {}".format(request.form.get("card")))
+    except ValueError as e:  # pylint:disable=invalid-name
+        raise ApiError("Could not calibrate image: {}".format(e), 422)
+
+    calibrated_id = get_image_store().put_image(img)
+    summary = {
+        "image_id": calibrated_id,
+        "card": profile.card,
+        "mean_delta_e": float(merged_df["delta_e"].mean()),
+    }
+
+    if _wants_json():
+        return jsonify(
+            dict(
+                summary,
+                swatches=merged_df.to_dict(orient="records"),
+                image_url=url_for("api.get_image", image_id=calibrated_id),
+            )
+        )
+
+    data, mimetype = to_transport(get_image_store().get(calibrated_id))
+    response = send_file(_BytesIO(data), mimetype=mimetype)
+    response.headers["X-Image-Id"] = calibrated_id
+    # headers are limited to a few KB, the swatches are only in the JSON
+    response.headers["X-Calibration-Stats"] = json.dumps(
+        summary, separators=(",", ":")
+    )
+    return response
+
+
+@api.route("/measure", methods=["POST"])
+def measure():
+    """Colour statistics of a rectangle of the image"""
+    image_id, image = _uploaded_image()
+    width, height = image.size
+    try:
+        x_0 = int(request.form.get("x0", 0))
+        y_0 = int(request.form.get("y0", 0))
+        x_1 = int(request.form.get("x1", width))
+        y_1 = int(request.form.get("y1", height))
+    except ValueError:
+        raise ApiError("The box coordinates x0, y0, x1, y1 have to be integers")
+
+    box = (max(x_0, 0), max(y_0, 0), min(x_1, width), min(y_1, height))
+    try:
+        stats = region_statistics(np.asarray(image.crop(box).convert("RGB")))
+    except ValueError as e:  # pylint:disable=invalid-name
+        raise ApiError(str(e))
+
+    return jsonify(
+        {
+            "image_id": image_id,
+            "box": box,
+            "n_pixels": stats["n_pixels"],
+            "mean": stats["mean"].tolist(),
+            "std": stats["std"].tolist(),
+            "median": stats["median"].tolist(),
+            "percentiles": {
+                str(key): value.tolist() for key, value in stats["percentiles"].items()
+            },
+            "name": closest_name(stats["mean"]),
+        }
+    )
+
+
+@api.route("/name", methods=["POST"])
+def name_colors():
+    """Closest xkcd names for a list of RGB colours"""
+    payload = request.get_json(silent=True) or {}
+    colors = np.asarray(payload.get("colors", []), dtype=np.float64)
+    if colors.ndim != 2 or colors.shape[1] != 3:
+        raise ApiError("'colors' has to be a list of [r, g, b] values")
+    return jsonify({"names": closest_names(colors)})
+
+
+@api.route("/images/<image_id>", methods=["GET"])
+def get_image(image_id):
+    """Serve an image from the store"""
+    try:
+        data = get_image_store().get(image_id)
+    except ImageNotFoundError:
+        raise ApiError("Unknown image id {}".format(image_id), 404)
+    data, mimetype = to_transport(data)
+    return send_file(_BytesIO(data), mimetype=mimetype)
+
+
+@api.route("/cache", methods=["GET"])
+def cache_stats():
+    """Hit and miss counters of the calibration cache of this worker"""
+    cache = get_calibration_cache()
+    if cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **cache.stats()})
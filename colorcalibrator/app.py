@@ -3,6 +3,8 @@
 import dash
 import dash_bootstrap_components as dbc
 
+from .settings import load_config_class
+
 # from flask_session import Session
 
 __version__ = "v0.1-alpha"
@@ -32,6 +34,7 @@ server = app.server  # pylint:disable=invalid-name
 app.config.suppress_callback_exceptions = True
 app.title = "colorcalibrator"
 
-server.config.from_object("config.Config")
+if load_config_class() is not None:
+    server.config.from_object(load_config_class())
 
 # sess.init_app(server)
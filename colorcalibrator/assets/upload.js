@@ -0,0 +1,91 @@
+/*
+ * Streams the selected (or dropped) image as request body to /api/upload, so it
+ * is neither read into a base64 data URI in the browser nor sent through the
+ * Dash callbacks. The returned image id is put into the hidden "uploaded-image"
+ * input, which triggers the main callback.
+ */
+(function () {
+  "use strict";
+
+  function setDashValue(input, value) {
+    // React ignores plain assignments to value, use the native setter
+    var setter = Object.getOwnPropertyDescriptor(
+      window.HTMLInputElement.prototype,
+      "value"
+    ).set;
+    setter.call(input, value);
+    input.dispatchEvent(new Event("input", { bubbles: true }));
+  }
+
+  function showStatus(text) {
+    var status = document.getElementById("stream-upload-status");
+    if (status) {
+      status.textContent = text;
+    }
+  }
+
+  function upload(file) {
+    var request = new XMLHttpRequest();
+    request.open("POST", "/api/upload");
+    request.setRequestHeader("X-Filename", encodeURIComponent(file.name));
+    request.setRequestHeader(
+      "Content-Type",
+      file.type || "application/octet-stream"
+    );
+    request.upload.onprogress = function (event) {
+      if (event.lengthComputable) {
+        showStatus(
+          "Uploading " + Math.round((100 * event.loaded) / event.total) + " %"
+        );
+      }
+    };
+    request.onload = function () {
+      var result;
+      try {
+        result = JSON.parse(request.responseText);
+      } catch (error) {
+        result = { error: "The upload failed (" + request.status + ")" };
+      }
+      if (request.status !== 200) {
+        showStatus(result.error || "The upload failed");
+        return;
+      }
+      showStatus(result.filename + " (" + result.width + " x " + result.height + ")");
+      // the time makes uploading the same file again a change
+      setDashValue(
+        document.getElementById("uploaded-image"),
+        JSON.stringify({
+          image_id: result.image_id,
+          filename: result.filename,
+          time: Date.now(),
+        })
+      );
+    };
+    request.onerror = function () {
+      showStatus("The upload failed");
+    };
+    showStatus("Uploading " + file.name);
+    request.send(file);
+  }
+
+  // the layout is rendered by Dash after this script runs, hence the listeners
+  // are on the document
+  document.addEventListener("change", function (event) {
+    if (event.target.id === "stream-upload-input" && event.target.files.length) {
+      upload(event.target.files[0]);
+      event.target.value = "";
+    }
+  });
+
+  ["dragover", "drop"].forEach(function (type) {
+    document.addEventListener(type, function (event) {
+      if (!event.target.closest || !event.target.closest("#stream-upload")) {
+        return;
+      }
+      event.preventDefault();
+      if (type === "drop" && event.dataTransfer.files.length) {
+        upload(event.dataTransfer.files[0]);
+      }
+    });
+  });
+})();
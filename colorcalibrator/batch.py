@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""Headless calibration of many images, used by ``python -m colorcalibrator batch``"""
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from PIL import Image
+
+from .profile import CalibrationProfile
+from .utils import apply_profile, calibrate_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".webp")
+CHECKPOINT_FILE = "checkpoint.jsonl"
+
+
+def collect_images(patterns):
+    """Image files in the given directories, files or glob patterns, sorted and
+    without duplicates"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            candidates = glob.glob(pattern)
+        paths.extend(
+            path
+            for path in candidates
+            if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    return sorted(set(os.path.abspath(path) for path in paths))
+
+
+def output_names(paths):
+    """Unique output stems for the input paths"""
+    names = {}
+    used = set()
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name = stem
+        i = 1
+        while name in used:
+            name = "{}_{}".format(stem, i)
+            i += 1
+        used.add(name)
+        names[path] = name
+    return names
+
+
+def read_checkpoint(output_dir):
+    """Inputs that were already processed, mapped to their checkpoint record"""
+    done = {}
+    try:
+        with open(os.path.join(output_dir, CHECKPOINT_FILE)) as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:  # interrupted while writing
+                    continue
+                done[record["input"]] = record
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def write_report(df, path, report_format):
+    if report_format == "parquet":
+        df.to_parquet(path + ".parquet", index=False)
+    else:
+        df.to_csv(path + ".csv", index=False)
+
+
+def calibrate_file(
+    path, output_dir, name, options
+):  # pylint:disable=too-many-arguments
+    """Calibrate one image and write the calibrated image and its swatch report.
+    Runs in the worker processes."""
+    start = time.time()
+    image = np.asarray(Image.open(path).convert("RGB"))
+    image_path = os.path.join(output_dir, "{}.{}".format(name, options["image_format"]))
+
+    if options["profile"] is not None:
+        # no card in the image, nothing to report
+        apply_profile(
+            image,
+            CalibrationProfile.from_dict(options["profile"]),
+            options["tile_rows"],
+            options["dtype"],
+        ).save(image_path)
+        return {
+            "input": path,
+            "name": name,
+            "status": "ok",
+            "output": image_path,
+            "seconds": time.time() - start,
+        }
+
+    img, merged_df, profile = calibrate_image(
+        image,
+        options["card"],
+        options["excluded"],
+        options["algorithm"],
+        options["only_white_point"],
+        tile_rows=options["tile_rows"],
+        dtype=options["dtype"],
+        detection_width=options["detection_width"],
+        return_profile=True,
+    )
+    del image
+
+    img.save(image_path)
+
+    merged_df.insert(0, "file", os.path.basename(path))
+    merged_df.insert(1, "card", profile.card)  # the identified one with "auto"
+    write_report(
+        merged_df,
+        os.path.join(output_dir, name + ".swatches"),
+        options["report_format"],
+    )
+
+    return {
+        "input": path,
+        "name": name,
+        "status": "ok",
+        "output": image_path,
+        "card": profile.card,
+        "mean_delta_e": float(merged_df["delta_e"].mean()),
+        "seconds": time.time() - start,
+    }
+
+
+def run_batch(  # pylint:disable=too-many-arguments, too-many-locals
+    patterns,
+    output_dir,
+    card="spyder24",
+    excluded=None,
+    algorithm="finlayson",
+    only_white_point=False,
+    workers=None,
+    image_format="png",
+    report_format="csv",
+    resume=True,
+    retry_failed=False,
+    profile=None,
+    tile_rows=None,
+    dtype="float64",
+    detection_width=None,
+):
+    """Calibrate all images matched by ``patterns`` and write the results to
+    ``output_dir``.
+
+    Every finished image is appended to a checkpoint file in the output
+    directory, with ``resume`` the images in it are skipped (failed ones only if
+    ``retry_failed`` is False). At the end, the swatch reports of all images are
+    combined into one ``swatches`` report. Returns the checkpoint records of this
+    run.
+
+    If a :class:`~colorcalibrator.profile.CalibrationProfile` is given, it is
+    applied to all images instead of detecting the card in every one of them, in
+    this case there are no swatch reports. With the ``card`` "auto", the chart is
+    identified in every image, such that images with different cards can be
+    calibrated in one run.
+
+    The calibration is computed with floats of ``dtype``, with ``tile_rows``
+    every image is calibrated in bands of that many rows to bound the memory of
+    the workers, with ``detection_width`` the card is located on a downscaled
+    copy (see :func:`~colorcalibrator.utils.calibrate_image`).
+    """
+    if report_format == "parquet":
+        try:
+            import pyarrow  # pylint:disable=import-outside-toplevel, unused-import
+        except ImportError:
+            raise ValueError("Writing parquet reports requires pyarrow")
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = collect_images(patterns)
+    names = output_names(paths)
+    done = read_checkpoint(output_dir) if resume else {}
+    todo = [
+        path
+        for path in paths
+        if path not in done or (retry_failed and done[path]["status"] != "ok")
+    ]
+    logger.info(
+        "{} images, {} already done, calibrating {}".format(
+            len(paths), len(paths) - len(todo), len(todo)
+        )
+    )
+
+    options = {
+        "card": card,
+        "excluded": list(excluded) if excluded else None,
+        "algorithm": algorithm,
+        "only_white_point": only_white_point,
+        "image_format": image_format,
+        "report_format": report_format,
+        "profile": None if profile is None else profile.to_dict(),
+        "tile_rows": tile_rows,
+        "dtype": dtype,
+        "detection_width": detection_width,
+    }
+
+    records = []
+    start = time.time()
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as executor, open(
+        os.path.join(output_dir, CHECKPOINT_FILE), "a" if resume else "w"
+    ) as checkpoint:
+        futures = {
+            executor.submit(
+                calibrate_file, path, output_dir, names[path], options
+            ): path
+            for path in todo
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:  # pylint:disable=broad-except, invalid-name
+                record = {
+                    "input": path,
+                    "name": names[path],
+                    "status": "failed",
+                    "error": str(e),
+                }
+            checkpoint.write(json.dumps(record) + "\n")
+            checkpoint.flush()
+            records.append(record)
+            done[path] = record
+
+            elapsed = time.time() - start
+            logger.info(
+                "[{}/{}] {} {} ({:.1f} s elapsed, {:.1f} s remaining)".format(
+                    i,
+                    len(todo),
+                    os.path.basename(path),
+                    record["status"],
+                    elapsed,
+                    elapsed / i * (len(todo) - i),
+                )
+            )
+
+    reports = []
+    for path in paths:
+        record = done.get(path)
+        if record is None or record["status"] != "ok" or "mean_delta_e" not in record:
+            continue
+        report_path = os.path.join(output_dir, record["name"] + ".swatches")
+        if report_format == "parquet":
+            reports.append(pd.read_parquet(report_path + ".parquet"))
+        else:
+            reports.append(pd.read_csv(report_path + ".csv"))
+    if reports:
+        write_report(
+            pd.concat(reports, ignore_index=True),
+            os.path.join(output_dir, "swatches"),
+            report_format,
+        )
+
+    failed = sum(record["status"] != "ok" for record in records)
+    logger.info("Calibrated {} images, {} failed".format(len(records) - failed, failed))
+    return records
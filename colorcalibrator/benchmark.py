@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the hot paths, used by ``python -m colorcalibrator benchmark``.
+
+The images are synthetic: a SpyderCheckr 24 rendered from its reference chart
+with a colour cast and some noise on a grey background, hence the results are
+reproducible without any test images. The results are written as JSON, together
+with the commit and the versions, and can be compared with an earlier run.
+"""
+import json
+import platform
+import subprocess
+import time
+from io import BytesIO as _BytesIO
+
+import numpy as np
+from PIL import Image
+
+from . import transfer
+from .dash_reusable_components import b64_to_pil, pil_to_b64
+from .charts import get_chart
+from .detection import detect_swatch_samples, detect_swatch_samples_coarse
+from .utils import calibrate_image, closest_name, get_average_color
+
+SIZES_MP = (1, 12, 50)
+ALGORITHMS = ("finlayson", "cheung", "vandermonde")
+SELECTION_SIZES = (10, 100, 1000)
+# None: on the full image, otherwise coarse to fine with a copy of that width (the
+# segmentation itself always runs at 1440 pixels, see detection.py)
+DETECTION_WIDTHS = (None, 720, 1440)
+
+# gains of the colour cast, in linear RGB
+CAST = np.array([1.15, 1.0, 0.8])
+
+
+def synthetic_card_image(megapixels, seed=0):
+    """uint8 RGB image (aspect 3:2) with a SpyderCheckr 24 in the centre, in 4 rows
+    of 6 swatches and oriented as the app expects it (black patch on the top left,
+    white patch on the top right)"""
+    width = int(round(np.sqrt(megapixels * 1e6 * 3 / 2)))
+    height = int(round(width * 2 / 3))
+    image = np.full((height, width, 3), 0.45, dtype=np.float32)
+
+    # rows E (greys), F, G, H, each from 6 to 1
+    swatches = get_chart("spyder24").srgb.reshape(4, 6, 3)
+    card_width = width // 2
+    swatch = card_width // 7
+    gap = (card_width - 6 * swatch) // 7
+    card_height = 4 * swatch + 5 * gap
+    x_0 = (width - card_width) // 2
+    y_0 = (height - card_height) // 2
+    image[y_0 : y_0 + card_height, x_0 : x_0 + card_width] = 0.1
+    for row in range(4):
+        for col in range(6):
+            y = y_0 + gap + row * (swatch + gap)  # pylint:disable=invalid-name
+            x = x_0 + gap + col * (swatch + gap)  # pylint:disable=invalid-name
+            image[y : y + swatch, x : x + swatch] = swatches[row, col]
+
+    # colour cast in linear RGB, then some sensor noise
+    linear = np.where(
+        image <= 0.04045, image / 12.92, ((image + 0.055) / 1.055) ** 2.4
+    )
+    linear = np.clip(linear * CAST.astype(np.float32), 0, 1)
+    image = np.where(
+        linear <= 0.0031308, linear * 12.92, 1.055 * linear ** (1 / 2.4) - 0.055
+    )
+    del linear
+    rng = np.random.RandomState(seed)
+    for band in range(0, height, 1024):  # bounded memory for the large images
+        rows = image[band : band + 1024]
+        rows += rng.normal(0, 0.01, rows.shape)
+    return (np.clip(image, 0, 1) * 255 + 0.5).astype(np.uint8)
+
+
+def _time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"best_s": min(times), "mean_s": float(np.mean(times)), "repeat": repeat}
+
+
+def _find_component(tree, component_id):
+    """Find the component with the id in the JSON of a dash layout"""
+    if isinstance(tree, dict):
+        props = tree.get("props", {})
+        if props.get("id") == component_id:
+            return props
+        tree = props.get("children", list(tree.values()))
+    if isinstance(tree, list):
+        for child in tree:
+            found = _find_component(child, component_id)
+            if found is not None:
+                return found
+    return None
+
+
+def _callback(client, storage, changed, values):
+    """Call update_graph_interactive_image through the dash endpoint, returns the
+    new storage and whether a calibration job is pending"""
+    inputs = [
+        ("uploaded-image", "value"),
+        ("button-run-operation", "n_clicks_timestamp"),
+        ("rotate", "n_clicks_timestamp"),
+        ("flip", "n_clicks_timestamp"),
+        ("mirror", "n_clicks_timestamp"),
+        ("crop", "n_clicks_timestamp"),
+        ("undo", "n_clicks_timestamp"),
+        ("redo", "n_clicks_timestamp"),
+        ("show_delta_e", "value"),
+        ("job-poll", "n_intervals"),
+    ]
+    states = [
+        ("interactive-image", "selectedData", None),
+        ("div-storage", "children", storage),
+        ("calibration_card", "value", "spyder24"),
+        ("exclude_dropdown", "value", None),
+        ("algorithm", "value", "finlayson"),
+        ("only_whitepoint", "value", []),
+    ]
+    payload = {
+        "output": "..div-interactive-image.children...error.children..."
+        "job-progress.children...job-poll.disabled..",
+        "outputs": [
+            {"id": "div-interactive-image", "property": "children"},
+            {"id": "error", "property": "children"},
+            {"id": "job-progress", "property": "children"},
+            {"id": "job-poll", "property": "disabled"},
+        ],
+        "inputs": [
+            {"id": id_, "property": prop, "value": values.get(id_)}
+            for id_, prop in inputs
+        ],
+        "state": [
+            {"id": id_, "property": prop, "value": value}
+            for id_, prop, value in states
+        ],
+        "changedPropIds": ["{}.{}".format(*changed)],
+    }
+    response = client.post("/_dash-update-component", json=payload)
+    if response.status_code != 200:
+        raise RuntimeError("The callback failed with {}".format(response.status_code))
+    outputs = response.get_json()["response"]
+    if "div-interactive-image" in outputs:  # not while the job is running
+        storage = _find_component(
+            outputs["div-interactive-image"]["children"], "div-storage"
+        )["children"]
+    return storage, not outputs["job-poll"]["disabled"]
+
+
+def benchmark_callback(image, repeat):
+    """Upload and calibration through the full update_graph_interactive_image
+    callback, including the polling of the calibration job. Every repetition uses
+    a slightly different image, such that the calibration is not served from the
+    caches, ``calibrate_cached`` repeats the last calibration."""
+    # pylint:disable=import-outside-toplevel
+    from . import server  # registers the callbacks
+    from .utils import STORAGE_PLACEHOLDER
+
+    client = server.test_client()
+    times = {"upload": [], "calibrate": [], "calibrate_cached": []}
+    first_pixel = image[0, 0].copy()
+
+    def calibrate(storage):
+        values = {"button-run-operation": int(time.time() * 1000)}
+        storage, pending = _callback(
+            client, storage, ("button-run-operation", "n_clicks_timestamp"), values
+        )
+        while pending:
+            time.sleep(0.02)
+            values["job-poll"] = values.get("job-poll", 0) + 1
+            storage, pending = _callback(
+                client, storage, ("job-poll", "n_intervals"), values
+            )
+        return storage
+
+    for i in range(repeat):
+        image[0, 0] = (first_pixel + i) % 256
+        buff = _BytesIO()
+        Image.fromarray(image).save(buff, format="jpeg", quality=95)
+
+        start = time.perf_counter()
+        uploaded = client.post(
+            "/api/upload",
+            data=buff.getvalue(),
+            headers={"X-Filename": "card{}.jpg".format(i)},
+        ).get_json()
+        storage, _ = _callback(
+            client,
+            STORAGE_PLACEHOLDER,
+            ("uploaded-image", "value"),
+            {"uploaded-image": json.dumps(uploaded)},
+        )
+        times["upload"].append(time.perf_counter() - start)
+        del buff
+
+        start = time.perf_counter()
+        calibrated = calibrate(storage)
+        times["calibrate"].append(time.perf_counter() - start)
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        calibrate(calibrated)
+        times["calibrate_cached"].append(time.perf_counter() - start)
+
+    image[0, 0] = first_pixel
+    return {
+        step: {
+            "best_s": min(values),
+            "mean_s": float(np.mean(values)),
+            "repeat": repeat,
+        }
+        for step, values in times.items()
+    }
+
+
+def run(
+    sizes=SIZES_MP, repeat=3, callback=True, only=None
+):  # pylint:disable=too-many-locals
+    """Run the benchmarks, returns a list of dicts with the name, the parameters
+    and the timings. ``only`` is a list of benchmark names to run."""
+
+    def wanted(name):
+        return only is None or name in only
+
+    results = []
+
+    def record(name, params, timing):
+        results.append({"name": name, "params": params, **timing})
+
+    if wanted("closest_name"):
+        record(
+            "closest_name",
+            {"n": 1},
+            _time(lambda: closest_name((120, 80, 40)), repeat),
+        )
+
+    for megapixels in sizes:
+        image = synthetic_card_image(megapixels)
+        height, width = image.shape[:2]
+        pil = Image.fromarray(image)
+
+        if wanted("calibrate_image"):
+            for algorithm in ALGORITHMS:
+                for only_white_point in (True, False):
+                    record(
+                        "calibrate_image",
+                        {
+                            "megapixels": megapixels,
+                            "algorithm": algorithm,
+                            "only_white_point": only_white_point,
+                        },
+                        _time(
+                            lambda: calibrate_image(  # pylint:disable=cell-var-from-loop
+                                image, "spyder24", None, algorithm, only_white_point
+                            ),
+                            repeat,
+                        ),
+                    )
+
+        if wanted("detection"):
+            for detection_width in DETECTION_WIDTHS:
+                if detection_width is None:
+                    detect = lambda: detect_swatch_samples(  # pylint:disable=cell-var-from-loop
+                        transfer.decode(image, np.float32)
+                    )
+                else:
+                    detect = lambda: detect_swatch_samples_coarse(  # pylint:disable=cell-var-from-loop
+                        image, detection_width, dtype=np.float32
+                    )
+                # the accuracy: ΔE of the calibrated swatches to the reference
+                merged_df = calibrate_image(
+                    image,
+                    "spyder24",
+                    only_white_point=False,
+                    dtype=np.float32,
+                    detection_width=detection_width,
+                )[1]
+                record(
+                    "detection",
+                    {
+                        "megapixels": megapixels,
+                        "detection_width": detection_width or "full",
+                    },
+                    {
+                        **_time(detect, repeat),
+                        "mean_delta_e": float(merged_df["delta_e"].mean()),
+                    },
+                )
+
+        if wanted("get_average_color"):
+            for selection in SELECTION_SIZES + (None,):
+                side_x = width if selection is None else min(selection, width)
+                side_y = height if selection is None else min(selection, height)
+                x_range = ((width - side_x) // 2, (width + side_x) // 2)
+                y_range = ((height - side_y) // 2, (height + side_y) // 2)
+                record(
+                    "get_average_color",
+                    {"megapixels": megapixels, "selection": selection or "full"},
+                    _time(
+                        lambda: get_average_color(  # pylint:disable=cell-var-from-loop
+                            x_range, y_range, pil
+                        ),
+                        repeat,
+                    ),
+                )
+
+        if wanted("pil_to_b64"):
+            encoded = pil_to_b64(pil)
+            record(
+                "pil_to_b64",
+                {"megapixels": megapixels},
+                _time(lambda: pil_to_b64(pil), repeat),  # pylint:disable=cell-var-from-loop
+            )
+            record(
+                "b64_to_pil",
+                {"megapixels": megapixels},
+                _time(
+                    lambda: b64_to_pil(encoded).load(),  # pylint:disable=cell-var-from-loop
+                    repeat,
+                ),
+            )
+
+        if callback and wanted("update_graph_interactive_image"):
+            for step, timing in benchmark_callback(image, repeat).items():
+                record(
+                    "update_graph_interactive_image",
+                    {"megapixels": megapixels, "step": step},
+                    timing,
+                )
+
+        del image, pil
+
+    return results
+
+
+def _commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results):
+    """The results with the commit and the versions, as written to the JSON file"""
+    # pylint:disable=import-outside-toplevel
+    import colour
+    import PIL
+
+    return {
+        "commit": _commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+        "colour": colour.__version__,
+        "pillow": PIL.__version__,
+        "results": results,
+    }
+
+
+def _key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare(old, new):
+    """Ratio of the best times (new / old) of the benchmarks in both reports"""
+    old_results = {_key(result): result for result in old["results"]}
+    comparison = []
+    for result in new["results"]:
+        previous = old_results.get(_key(result))
+        if previous is None:
+            continue
+        comparison.append(
+            {
+                "name": result["name"],
+                "params": result["params"],
+                "old_s": previous["best_s"],
+                "new_s": result["best_s"],
+                "ratio": result["best_s"] / previous["best_s"],
+            }
+        )
+    return comparison
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Cache for the results of :func:`~colorcalibrator.utils.calibrate_image`.
+
+Two kinds of entries are kept, both keyed by a hash of the image content:
+
+- the detected swatch samples, keyed by the image only, so that changing the
+  algorithm, the excluded swatches or the white-point-only mode does not run the
+  detection again
+- the full results (calibrated image, swatch statistics, ΔE map, profile), keyed
+  by the image and all calibration parameters
+
+The entries are pickled into one of the byte backends of the image store, which
+bound the size (``memory`` per process or ``file``, on disk and shared between
+the workers) and evict the least recently used entries. The default directory
+of the file backend is private to the user (see settings.py), as the entries are
+unpickled.
+"""
+import hashlib
+import json
+import os
+import pickle
+import threading
+
+import numpy as np
+
+from .image_store import MemoryBackend, make_backend
+from .settings import get_config, runtime_directory
+
+
+def image_hash(image):
+    """Hash of the pixels (and shape and dtype) of an array"""
+    digest = hashlib.sha256(str((image.shape, image.dtype.str)).encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+def _key(kind, *parts):
+    return hashlib.sha256(
+        json.dumps([kind, *parts], sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def samples_key(image_hash_, dtype, detection_width=None):
+    if detection_width is None:
+        return _key("samples", image_hash_, np.dtype(dtype).str)
+    return _key("samples", image_hash_, np.dtype(dtype).str, detection_width)
+
+
+def result_key(image_hash_, **parameters):
+    if parameters.get("excluded"):
+        parameters["excluded"] = sorted(parameters["excluded"])
+    if "dtype" in parameters:
+        parameters["dtype"] = np.dtype(parameters["dtype"]).str
+    return _key("result", image_hash_, parameters)
+
+
+class CalibrationCache:
+    """Pickled entries in a byte backend, counts hits and misses"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The cached value or None"""
+        data = self.backend.get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return pickle.loads(data)
+
+    def put(self, key, value):
+        self.backend.put(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else None,
+        }
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_calibration_cache():
+    """Return the cache of this process, configured from settings.py, or
+    None if it is disabled"""
+    global _CACHE  # pylint:disable=global-statement
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                config = get_config()
+                backend_name = config.get("CALIBRATION_CACHE_BACKEND", "memory")
+                if not backend_name:
+                    return None
+                max_bytes = int(config.get("CALIBRATION_CACHE_BYTES", 0) or 0)
+                if backend_name == "memory":
+                    backend = MemoryBackend(max_bytes)
+                else:
+                    backend_kwargs = {"max_bytes": max_bytes or None}
+                    if backend_name == "file":
+                        # not the directory of the image store, which evicts
+                        # everything in it
+                        backend_kwargs["directory"] = config.get(
+                            "CALIBRATION_CACHE_PATH"
+                        ) or os.path.join(runtime_directory(), "cache")
+                    backend = make_backend(backend_name, **backend_kwargs)
+                _CACHE = CalibrationCache(backend)
+    return _CACHE
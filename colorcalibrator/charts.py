@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""Registry of the reference charts (colour checkers).
+
+A chart is a JSON file, see data/charts/: its label, the grid of the landscape
+card (columns and rows), the sRGB reference colours (0-255) of the swatches in
+the order of the detection (black first, see detection.py), the swatch used for
+the white balance and the neutral swatches. A file with ``alias_of`` is another
+name for a chart with the same colours and layout.
+
+The charts of data/charts/ and of the directories in ``CHART_PATHS`` (separated
+by ":") are found by their name, the file name without .json. The files are only
+read when a chart is first used, and every chart is loaded once per process. A
+chart holds its references in sRGB, linear RGB, CIE XYZ and CIELAB, computed when
+it is loaded, and the references without the excluded swatches, computed once
+per set of excluded swatches, such that all calibrations of a process share
+them. Charts can also be added with :func:`register_chart`, for the process that
+calls it.
+
+With the card ``"auto"``, the chart is identified from the detected swatches,
+see :func:`identify_chart`.
+"""
+import glob
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from .delta_e import SRGB_TO_XYZ, delta_e, srgb_to_linear, xyz_to_lab
+from .settings import get_config
+
+AUTO = "auto"
+DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "charts")
+
+
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+class ReferenceChart:  # pylint:disable=too-many-instance-attributes
+    """Reference colours and swatch layout of a colour checker, the colours are
+    sRGB in the range 0-1, ordered black first. The arrays are read-only."""
+
+    FORMS = ("srgb", "linear", "xyz", "lab")
+
+    def __init__(  # pylint:disable=too-many-arguments
+        self,
+        name,
+        label,
+        srgb,
+        columns,
+        rows,
+        white_balance_swatch,
+        neutrals=(),
+        swatch_names=None,
+        alias_of=None,
+    ):
+        srgb = np.array(srgb, dtype=np.float64)
+        if srgb.shape != (columns * rows, 3):
+            raise ValueError(
+                "Chart {} has {} swatches, its grid {} x {} needs {}".format(
+                    name, len(srgb), columns, rows, columns * rows
+                )
+            )
+        self.name = name
+        self.label = label
+        self.columns = columns
+        self.rows = rows
+        self.white_balance_swatch = white_balance_swatch
+        self.neutrals = list(neutrals)
+        self.swatch_names = list(swatch_names or range(len(srgb)))
+        self.alias_of = alias_of
+        self.srgb = _read_only(srgb)
+        self.linear = _read_only(srgb_to_linear(srgb))
+        self.xyz = _read_only(self.linear @ SRGB_TO_XYZ.T)
+        self.lab = _read_only(xyz_to_lab(self.xyz))
+        self._masks = {}
+        self._subsets = {}
+
+    def __len__(self):
+        return len(self.srgb)
+
+    def __repr__(self):
+        return "ReferenceChart({!r})".format(self.name)
+
+    @property
+    def grid(self):
+        return (self.columns, self.rows)
+
+    def mask(self, excluded=None):
+        """Boolean mask of the swatches that are not ``excluded`` (indices, negative
+        ones count from the end), memoized per set of excluded swatches"""
+        key = tuple(sorted(set(excluded))) if excluded else ()
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = np.ones(len(self), dtype=bool)
+            mask[list(key)] = False  # IndexError for indices beyond the swatches
+            mask = self._masks[key] = _read_only(mask)
+        return mask
+
+    def subset(self, excluded=None, form="linear"):
+        """The references in ``form`` (one of :attr:`FORMS`) without the
+        ``excluded`` swatches, memoized per set of excluded swatches"""
+        if form not in self.FORMS:
+            raise ValueError(
+                "Unknown form {}, available are {}".format(form, ", ".join(self.FORMS))
+            )
+        if not excluded:
+            return getattr(self, form)
+        key = (tuple(sorted(set(excluded))), form)
+        references = self._subsets.get(key)
+        if references is None:
+            references = self._subsets[key] = _read_only(
+                getattr(self, form)[self.mask(excluded)]
+            )
+        return references
+
+    @classmethod
+    def from_dict(cls, name, d):  # pylint:disable=invalid-name
+        swatches = d["swatches"]
+        return cls(
+            name,
+            d.get("label", name),
+            np.array([swatch["srgb"] for swatch in swatches]) / 255,
+            d["columns"],
+            d["rows"],
+            d["white_balance_swatch"],
+            d.get("neutrals", ()),
+            [swatch.get("name", i) for i, swatch in enumerate(swatches)],
+        )
+
+    def aliased(self, name, label):
+        """The same chart under another name"""
+        return ReferenceChart(
+            name,
+            label,
+            self.srgb,
+            self.columns,
+            self.rows,
+            self.white_balance_swatch,
+            self.neutrals,
+            self.swatch_names,
+            alias_of=self.name,
+        )
+
+
+_REGISTERED = {}
+
+
+def _chart_paths():
+    paths = get_config().get("CHART_PATHS", "")
+    return [path for path in paths.split(":") if path]
+
+
+@lru_cache(maxsize=1)
+def _index():
+    """Chart names mapped to their files, later directories take precedence"""
+    files = {}
+    for directory in [DATA_PATH] + _chart_paths():
+        for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+            files[os.path.splitext(os.path.basename(path))[0]] = path
+    return files
+
+
+@lru_cache(maxsize=None)
+def _load(name):
+    with open(_index()[name]) as handle:
+        d = json.load(handle)  # pylint:disable=invalid-name
+    if "alias_of" in d:
+        return get_chart(d["alias_of"]).aliased(name, d.get("label", name))
+    return ReferenceChart.from_dict(name, d)
+
+
+def register_chart(chart):
+    """Make the :class:`ReferenceChart` available under its name in this
+    process"""
+    _REGISTERED[chart.name] = chart
+
+
+def chart_names():
+    return sorted(set(_index()) | set(_REGISTERED))
+
+
+def get_chart(name):
+    """The chart with that name, raises a NotImplementedError for unknown
+    charts"""
+    if name in _REGISTERED:
+        return _REGISTERED[name]
+    if name not in _index():
+        raise NotImplementedError("Unknown card {}".format(name))
+    return _load(name)
+
+
+def chart_options():
+    """Options for a dropdown of the charts"""
+    return [
+        {"label": get_chart(name).label, "value": name} for name in chart_names()
+    ]
+
+
+def identify_chart(swatches, grid):
+    """The chart with the detected ``grid`` of swatches (columns, rows) whose
+    references are closest to the linear mean colours of the swatches (black
+    first): the smallest mean CIEDE2000 difference after the white balance on
+    the white balance swatch of the chart. Aliases are skipped."""
+    candidates = [
+        chart
+        for chart in map(get_chart, chart_names())
+        if chart.grid == tuple(grid) and chart.alias_of is None
+    ]
+    if not candidates:
+        raise NotImplementedError("No chart with {} x {} swatches".format(*grid))
+
+    def distance(chart):
+        swatch = chart.white_balance_swatch
+        balanced = swatches * (chart.linear[swatch] / swatches[swatch])
+        lab = xyz_to_lab(np.clip(balanced, 0, None) @ SRGB_TO_XYZ.T)
+        return float(np.mean(delta_e(chart.lab, lab, space="Lab")))
+
+    return min(candidates, key=distance)
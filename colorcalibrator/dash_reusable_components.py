@@ -9,6 +9,8 @@ import numpy as np
 import plotly.graph_objs as go
 from PIL import Image
 
+from .timing import timed
+
 # Variables
 HTML_IMG_SRC_PARAMETERS = "data:image/png;base64, "
 
@@ -23,6 +25,7 @@ def _omit(omitted_keys, d):  # pylint:disable=invalid-name
 
 
 # Image utility functions
+@timed("pil_to_b64")
 def pil_to_b64(im, enc_format="png", **kwargs):  # pylint:disable=invalid-name
     """
     Converts a PIL Image into base64 string for HTML displaying
@@ -74,14 +77,16 @@ def b64_to_pil(string):
     return im
 
 
-def b64_to_numpy(string, to_scalar=True):
-    """Convert bytes to numpy array"""
+@timed("b64_to_numpy")
+def b64_to_numpy(string, to_scalar=True, dtype=np.float64):
+    """Convert bytes to numpy array, with ``to_scalar`` as ``dtype`` in the range
+    0-1, otherwise as stored (usually uint8)"""
     im = b64_to_pil(string)  # pylint:disable=invalid-name
     np_array = np.array(im)
     del im
 
     if to_scalar:
-        np_array = np_array / 255.0
+        np_array = np.divide(np_array, 255, dtype=dtype)
 
     return np_array
 
@@ -181,9 +186,17 @@ def InteractiveImagePIL(  # pylint: disable=invalid-name
     display_mode="fixed",
     dragmode="select",
     verbose=False,
+    overlay=None,
+    overlay_opacity=0.6,
+    size=None,
     **kwargs,
 ):
-    """Copied from the image editor example from dash"""
+    """Copied from the image editor example from dash.
+
+    ``overlay`` is an optional (small) PIL image that is stretched over the image,
+    e.g. a heatmap. If ``size`` (width, height) is given, the axes span this size
+    and ``image`` is a preview that is stretched over them.
+    """
     if image is not None:  # pylint:disable=no-else-return
         if enc_format == "jpeg":
             if image.mode == "RGBA":
@@ -192,7 +205,34 @@ def InteractiveImagePIL(  # pylint: disable=invalid-name
         else:
             encoded_image = pil_to_b64(image, enc_format=enc_format, verbose=verbose)
 
-        width, height = image.size
+        width, height = image.size if size is None else size
+
+        images = [
+            {
+                "xref": "x",
+                "yref": "y",
+                "x": 0,
+                "y": 0,
+                "yanchor": "bottom",
+                "sizing": "stretch",
+                "sizex": width,
+                "sizey": height,
+                "layer": "below",
+                "source": HTML_IMG_SRC_PARAMETERS + encoded_image,
+            }
+        ]
+        if overlay is not None:
+            images.append(
+                _merge(
+                    images[0],
+                    {
+                        "layer": "above",
+                        "opacity": overlay_opacity,
+                        "source": HTML_IMG_SRC_PARAMETERS
+                        + pil_to_b64(overlay, enc_format="png"),
+                    },
+                )
+            )
 
         if display_mode.lower() in ["scalable", "scale"]:
             display_height = "{}vw".format(round(60 * height / width))
@@ -218,21 +258,10 @@ def InteractiveImagePIL(  # pylint: disable=invalid-name
                         "showgrid": False,
                         "visible": False,
                     },
-                    "images": [
-                        {
-                            "xref": "x",
-                            "yref": "y",
-                            "x": 0,
-                            "y": 0,
-                            "yanchor": "bottom",
-                            "sizing": "stretch",
-                            "sizex": width,
-                            "sizey": height,
-                            "layer": "below",
-                            "source": HTML_IMG_SRC_PARAMETERS + encoded_image,
-                        }
-                    ],
+                    "images": images,
                     "dragmode": dragmode,
+                    # keep the zoom when tiles are added
+                    "uirevision": "{}x{}".format(width, height),
                 },
             },
             style=_merge(
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""Detection of the colour checker and sampling of its swatches.
+
+The segmentation is by far the most expensive step of the calibration, hence it
+runs only once per image. We keep the pixels below the swatch masks of the
+rectified card and push them through the same (per-pixel) operations as the
+image, the swatch colours of every stage are then just means over these pixels.
+
+The segmentation of colour-checker-detection works on a copy with a width of
+1440 pixels and samples the swatches there, from an 8 bit image. The coarse to
+fine mode (:func:`detect_swatch_samples_coarse`) instead downscales the encoded
+image (no full-size linear image is needed), only locates the card on that copy
+and samples the swatches of the full-resolution image, i.e. with more pixels and
+without the interpolation of the working copy. It can also return where the
+swatches are (:func:`detect_swatch_locations`), to sample them again in other
+frames of a video without running the segmentation.
+
+The segmentation itself always runs at its width of 1440 pixels, it resizes
+whatever it gets. The working width of the coarse to fine mode is only the size
+of the copy that is handed to it: it does not change the time of the
+segmentation, a lower one loses detail and a higher one is capped.
+"""
+import cv2
+import numpy as np
+from colour_checker_detection import detect_colour_checkers_segmentation
+from colour_checker_detection.detection.segmentation import (
+    SWATCHES_HORIZONTAL,
+    SWATCHES_VERTICAL,
+    WORKING_WIDTH as SEGMENTATION_WIDTH,
+    colour_checkers_coordinates_segmentation,
+    contour_centroid,
+    crop_and_level_image_with_rectangle,
+    swatch_masks,
+)
+
+from . import transfer
+
+WORKING_WIDTH = SEGMENTATION_WIDTH
+GRID = (SWATCHES_HORIZONTAL, SWATCHES_VERTICAL)  # the only grid that is detected
+SAMPLES = 16  # side of the sampled square of a swatch at SEGMENTATION_WIDTH
+
+
+class SwatchSamples:
+    """Pixels of the swatches of one colour checker, shape (swatches, pixels, 3),
+    ordered black first"""
+
+    def __init__(self, pixels):
+        self.pixels = pixels
+
+    def __len__(self):
+        return len(self.pixels)
+
+    def means(self):
+        """Mean colour of every swatch"""
+        return self.pixels.mean(axis=1)
+
+    def transformed(self, transform):
+        """Samples after applying the per-pixel function ``transform``"""
+        return SwatchSamples(transform(self.pixels))
+
+    def delete(self, excluded):
+        """Samples without the swatches with the indices in ``excluded``"""
+        return SwatchSamples(np.delete(self.pixels, excluded, axis=0))
+
+
+class SwatchLocations:
+    """Centres (x, y) of the swatches in the pixels of an image, black first, and
+    the half side of the sampled squares"""
+
+    def __init__(self, centres, half):
+        self.centres = np.asarray(centres, dtype=np.float64)
+        self.half = int(half)
+
+    def moved(self, centres):
+        """The locations with other centres, e.g. tracked in the next frame"""
+        return SwatchLocations(centres, self.half)
+
+    def sample(self, image, dtype=np.float64):
+        """Linear pixels of the squares around the centres in the encoded (uint8
+        or 0-1) image, squares at the border are moved inside"""
+        height, width = image.shape[:2]
+        half = self.half
+        centres = np.rint(self.centres).astype(int)
+        x_c = np.clip(centres[:, 0], half, width - half)
+        y_c = np.clip(centres[:, 1], half, height - half)
+        masks = np.stack([y_c - half, y_c + half, x_c - half, x_c + half], axis=1)
+        return SwatchSamples(transfer.decode(_swatch_pixels(image, masks), dtype))
+
+
+def _swatch_pixels(checker_image, masks):
+    """Stack the pixels below the (equally sized) swatch masks"""
+    return np.stack(
+        [
+            checker_image[mask[0] : mask[1], mask[2] : mask[3], :3].reshape(-1, 3)
+            for mask in masks
+        ]
+    )
+
+
+def detect_swatch_samples(linear_image, **kwargs):
+    """Detect the colour checker in the linear image and return the pixels of
+    its swatches, black first. Raises an IndexError if no card is found."""
+    data = detect_colour_checkers_segmentation(
+        linear_image, additional_data=True, **kwargs
+    )[0]
+    checker_image = getattr(data, "colour_checker_image", None)
+    if checker_image is None:  # colour-checker-detection >= 0.2
+        checker_image = data.colour_checker
+
+    pixels = _swatch_pixels(
+        np.asarray(checker_image, dtype=linear_image.dtype), data.swatch_masks
+    )
+
+    # the detection reverses the swatch colours (but not the masks) if it thinks
+    # the card is flipped, we follow its decision
+    swatch_colours = np.asarray(data.swatch_colours)[:, :3]
+    means = pixels.mean(axis=1)
+    if (
+        np.abs(means[::-1] - swatch_colours).sum()
+        < np.abs(means - swatch_colours).sum()
+    ):
+        pixels = pixels[::-1]
+
+    return SwatchSamples(pixels[::-1])  # black first
+
+
+def _working_copy(image, working_width):
+    """Encoded image downscaled such that the longer side has ``working_width``
+    pixels (if it is larger, at most ``SEGMENTATION_WIDTH``), as 8 bit BGR like
+    the segmentation expects it"""
+    height, width = image.shape[:2]
+    scale = max(max(height, width) / min(working_width, SEGMENTATION_WIDTH), 1)
+    small = image[..., :3]
+    if scale > 1:
+        small = cv2.resize(
+            np.ascontiguousarray(small),
+            (max(int(round(width / scale)), 1), max(int(round(height / scale)), 1)),
+            interpolation=cv2.INTER_AREA,
+        )
+    if small.dtype != np.uint8:
+        small = (np.clip(small, 0, 1) * 255 + 0.5).astype(np.uint8)
+    return np.ascontiguousarray(small[..., ::-1])
+
+
+def _to_full_resolution(corners, shape):
+    """Map the corners found by the segmentation, which rotates portrait images
+    clockwise and resizes them to a width of ``SEGMENTATION_WIDTH``, to the pixel
+    coordinates of the full image"""
+    height, width = shape[:2]
+    corners = np.asarray(corners, dtype=np.float64) * (
+        max(height, width) / SEGMENTATION_WIDTH
+    )
+    if width < height:
+        corners = np.stack([corners[:, 1], height - 1 - corners[:, 0]], axis=1)
+    return corners
+
+
+def _level_rectangle(rectangle):
+    """The rectangle of ``cv2.minAreaRect`` with its angle in [-45, 45).
+
+    OpenCV before 4.5.1 gives angles in [-90, 0), later versions in (0, 90]. In
+    [-45, 45) both describe the rectangle the same way, and
+    ``crop_and_level_image_with_rectangle`` (written for the old convention)
+    rotates by the angle as it is."""
+    centre, (width, height), angle = rectangle
+    while angle >= 45:
+        angle, width, height = angle - 90, height, width
+    while angle < -45:
+        angle, width, height = angle + 90, height, width
+    return (tuple(centre), (width, height), angle)
+
+
+def _leveled_to_image(points, rectangle, size):
+    """Map points (x, y) of the image cropped and levelled with the rectangle (see
+    :func:`_level_rectangle`) by ``crop_and_level_image_with_rectangle`` (of the
+    given (width, height)) back to the input"""
+    centroid = np.asarray(contour_centroid(cv2.boxPoints(rectangle))).astype(int)
+    angle = rectangle[-1]
+    rotation = cv2.getRotationMatrix2D(tuple(centroid.tolist()), angle, 1)
+    # getRectSubPix puts the centre at (size - 1) / 2
+    rotated = np.asarray(points, dtype=np.float64) + (
+        centroid - (np.asarray(size) - 1) / 2
+    )
+    inverse = cv2.invertAffineTransform(rotation)
+    return rotated @ inverse[:, :2].T + inverse[:, 2]
+
+
+def _coarse_swatches(image, working_width, samples, dtype):
+    """Linear pixels of the swatches in the full-resolution image, their
+    :class:`SwatchLocations`, both black first"""
+    corners = _to_full_resolution(
+        colour_checkers_coordinates_segmentation(
+            _working_copy(image, working_width)
+        )[0],
+        image.shape,
+    )
+
+    # level only the part of the image around the card
+    margin = 0.05 * np.ptp(corners, axis=0)
+    x_0, y_0 = np.maximum(np.floor(corners.min(axis=0) - margin), 0).astype(int)
+    x_1, y_1 = np.ceil(corners.max(axis=0) + margin).astype(int)
+    region = np.ascontiguousarray(image[y_0 : y_1 + 1, x_0 : x_1 + 1, :3])
+    rectangle = _level_rectangle(
+        cv2.minAreaRect((corners - [x_0, y_0]).astype(np.float32))
+    )
+    checker_image = crop_and_level_image_with_rectangle(region, rectangle)
+    leveled_size = (checker_image.shape[1], checker_image.shape[0])
+    rotated = checker_image.shape[1] < checker_image.shape[0]
+    if rotated:
+        checker_image = cv2.rotate(checker_image, cv2.ROTATE_90_CLOCKWISE)
+
+    # the same share of the swatches as the segmentation samples at its width
+    side = samples * max(max(image.shape[:2]) / SEGMENTATION_WIDTH, 1)
+    masks = swatch_masks(
+        checker_image.shape[1],
+        checker_image.shape[0],
+        SWATCHES_HORIZONTAL,
+        SWATCHES_VERTICAL,
+        side,
+    )
+    pixels = _swatch_pixels(transfer.decode(checker_image, dtype), masks)
+
+    centres = np.array(
+        [((mask[2] + mask[3]) / 2, (mask[0] + mask[1]) / 2) for mask in masks]
+    )
+    if rotated:  # back to the levelled image before the clockwise rotation
+        centres = np.stack(
+            [centres[:, 1], leveled_size[1] - 1 - centres[:, 0]], axis=1
+        )
+    centres = _leveled_to_image(centres, rectangle, leveled_size) + [x_0, y_0]
+
+    # the same test for a reversed card as the segmentation: the neutral row
+    # has to get darker
+    neutrals = pixels.mean(axis=1)[18:23].mean(axis=1)
+    if np.any(neutrals[:-1] < neutrals[1:]):
+        pixels, centres = pixels[::-1], centres[::-1]
+
+    # black first
+    return pixels[::-1], SwatchLocations(centres[::-1], int(side / 2))
+
+
+def detect_swatch_samples_coarse(
+    image, working_width=WORKING_WIDTH, samples=SAMPLES, dtype=np.float64
+):
+    """Locate the colour checker on a copy of the encoded (uint8 or 0-1) image
+    with ``working_width`` pixels on the longer side, and return the linear
+    pixels of its swatches in the full-resolution image, black first. Raises an
+    IndexError if no card is found.
+
+    colour-checker-detection 0.1 segments at a width of 1440 pixels whatever the
+    working width, a lower one only loses detail, a higher one is capped."""
+    return SwatchSamples(_coarse_swatches(image, working_width, samples, dtype)[0])
+
+
+def detect_swatch_locations(
+    image, working_width=WORKING_WIDTH, samples=SAMPLES, dtype=np.float64
+):
+    """Like :func:`detect_swatch_samples_coarse`, but also returns the
+    :class:`SwatchLocations` of the swatches in the image"""
+    pixels, locations = _coarse_swatches(image, working_width, samples, dtype)
+    return SwatchSamples(pixels), locations
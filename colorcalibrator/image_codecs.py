@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Codecs for the images in the server-side store.
+
+The images in the store are only read back by the app itself, so the encoding
+can trade size for speed. Every codec is lossless:
+
+- ``raw``: a small header and the pixel buffer, no compression
+- ``png-fast``: PNG with compress_level 1
+- ``png``: PNG with the default compress_level 6
+- ``webp``: lossless WebP (if Pillow was built with WebP support), WebP only
+  stores RGB(A), other modes are stored as PNG
+
+Which one is used is set with a policy (``IMAGE_STORE_CODEC``): ``speed``
+(raw), ``balanced`` (png-fast), ``size`` (webp, or png without WebP support) or
+the name of a codec. ``python -m colorcalibrator codecs`` compares them on
+some images.
+"""
+import struct
+import time
+from io import BytesIO as _BytesIO
+
+from PIL import Image, features
+
+RAW_MAGIC = b"CCRAW1"
+_RAW_HEADER = struct.Struct("<6s8sII")
+
+
+def _encode_raw(image):
+    if image.mode not in ("L", "LA", "RGB", "RGBA", "I", "F"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    header = _RAW_HEADER.pack(
+        RAW_MAGIC, image.mode.encode("ascii"), image.size[0], image.size[1]
+    )
+    return header + image.tobytes()
+
+
+def _decode_raw(data):
+    _, mode, width, height = _RAW_HEADER.unpack_from(data)
+    return Image.frombytes(
+        mode.rstrip(b"\0").decode("ascii"),
+        (width, height),
+        bytes(data[_RAW_HEADER.size :]),
+    )
+
+
+def _pil_encoder(enc_format, **kwargs):
+    def encode(image):
+        buff = _BytesIO()
+        image.save(buff, format=enc_format, **kwargs)
+        return buff.getvalue()
+
+    return encode
+
+
+_encode_png = _pil_encoder("png")  # pylint:disable=invalid-name
+# exact keeps the colour of the transparent pixels
+_encode_webp = _pil_encoder(  # pylint:disable=invalid-name
+    "webp", lossless=True, quality=0, method=0, exact=True
+)
+
+
+def _encode_webp_or_png(image):
+    if image.mode in ("RGB", "RGBA"):
+        return _encode_webp(image)
+    return _encode_png(image)
+
+
+CODECS = {
+    "raw": _encode_raw,
+    "png-fast": _pil_encoder("png", compress_level=1),
+    "png": _encode_png,
+    "webp": _encode_webp_or_png,
+}
+
+POLICIES = {"speed": "raw", "balanced": "png-fast", "size": "webp"}
+
+
+def resolve_codec(name):
+    """Codec name for a policy or codec name"""
+    codec = POLICIES.get(name, name)
+    if codec == "webp" and not features.check("webp"):
+        codec = "png"
+    if codec not in CODECS:
+        raise ValueError(
+            "Unknown codec {}, available are {}".format(
+                name, ", ".join(list(POLICIES) + list(CODECS))
+            )
+        )
+    return codec
+
+
+def encode(image, codec="png-fast"):
+    return CODECS[resolve_codec(codec)](image)
+
+
+def decode(data):
+    """PIL image of the bytes of any of the codecs (or any format PIL reads), the
+    formats of PIL are decoded lazily"""
+    if data[: len(RAW_MAGIC)] == RAW_MAGIC:
+        return _decode_raw(data)
+    return Image.open(_BytesIO(data))
+
+
+def to_transport(data):
+    """Bytes and mimetype of the image that can be sent to clients, raw images
+    are converted to PNG"""
+    if data[: len(RAW_MAGIC)] == RAW_MAGIC:
+        return CODECS["png-fast"](_decode_raw(data)), "image/png"
+    image_format = Image.open(_BytesIO(data)).format
+    return data, Image.MIME.get(image_format, "application/octet-stream")
+
+
+def benchmark(images, repeat=3):
+    """Encode and decode time (best of ``repeat``, in seconds) and size of every
+    codec for the PIL images, returns a list of dicts"""
+    results = []
+    for index, image in enumerate(images):
+        image.load()
+        for name in CODECS:
+            if resolve_codec(name) != name:  # not available
+                continue
+            encode_times, decode_times = [], []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                data = CODECS[name](image)
+                encode_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                decode(data).load()
+                decode_times.append(time.perf_counter() - start)
+            results.append(
+                {
+                    "image": index,
+                    "size": list(image.size),
+                    "codec": name,
+                    "encode_s": min(encode_times),
+                    "decode_s": min(decode_times),
+                    "bytes": len(data),
+                }
+            )
+    return results
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed server-side storage for the images the app works on.
+
+The callbacks only pass a short image id (a prefix of the SHA-256 of the encoded
+image) through the hidden ``div-storage`` div, the image itself stays on the
+server. Backends are pluggable, the default keeps the files in ``/dev/shm`` (in
+the private directory of the user, see settings.py) so that all gunicorn workers
+see the same images, with a small in-memory LRU in front of it.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .image_codecs import decode, resolve_codec
+from .settings import get_config, runtime_directory
+from .timing import span
+from .workers import encode_image
+
+ID_LENGTH = 16
+_ID_PATTERN = re.compile("[0-9a-f]{%d}" % ID_LENGTH)
+
+
+class ImageNotFoundError(KeyError):
+    """Raised if an image id is not (or no longer) in the store"""
+
+
+def image_id_for(data):
+    """Content hash that is used as id for the bytes ``data``"""
+    return hashlib.sha256(data).hexdigest()[:ID_LENGTH]
+
+
+class MemoryBackend:
+    """In-memory LRU that holds at most ``max_bytes`` of encoded images.
+
+    Note that every gunicorn worker has its own copy, use it alone only if the
+    app runs in one process.
+    """
+
+    def __init__(self, max_bytes=256 * 1024**2):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key):
+        """Return the bytes stored under ``key`` or None"""
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def put(self, key, data):
+        """Store ``data`` under ``key`` and evict the least recently used entries"""
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return
+            self._data[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._size -= len(evicted)
+
+    def delete(self, key):
+        with self._lock:
+            data = self._data.pop(key, None)
+            if data is not None:
+                self._size -= len(data)
+
+
+class FileBackend:
+    """One file per image in ``directory``, shared between processes.
+
+    If ``max_bytes`` is set, the files that were accessed least recently are
+    removed once the directory grows beyond it.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        if directory is None:
+            directory = os.path.join(runtime_directory(), "images")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """Return the bytes stored under ``key`` or None"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as handle:
+                data = handle.read()
+            os.utime(path)  # mtime is used as access time for the eviction
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key, data):
+        """Store ``data`` under ``key``, the write is atomic"""
+        if key in self:
+            os.utime(self._path(key))
+            return
+        self.put_file(key, self.write_temporary([data]))
+
+    def write_temporary(self, chunks):
+        """Write the chunks to a temporary file in the directory, returns its
+        path. The file is removed if iterating the chunks raises."""
+        handle, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(handle, "wb") as tmp_file:
+                for chunk in chunks:
+                    tmp_file.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    def put_file(self, key, tmp_path):
+        """Move a file of :meth:`write_temporary` to ``key``"""
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            os.utime(path)
+            return
+        os.replace(tmp_path, path)
+        if self.max_bytes is not None:
+            self._evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".tmp-"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+BACKENDS = {"memory": MemoryBackend, "file": FileBackend}
+
+
+def register_backend(name, factory):
+    """Make a backend available under ``name``. ``factory`` is called with the
+    keyword arguments given to :func:`make_backend` and has to return an object
+    with ``get``, ``put``, ``delete`` and ``__contains__`` (and optionally
+    ``write_temporary`` and ``put_file`` to store uploads without joining them in
+    memory, see :class:`FileBackend`)"""
+    BACKENDS[name] = factory
+
+
+def make_backend(name, **kwargs):
+    try:
+        factory = BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            "Unknown image store backend {}, available are {}".format(
+                name, ", ".join(BACKENDS)
+            )
+        )
+    return factory(**kwargs)
+
+
+class ImageStore:
+    """Content-addressed image store with an optional in-memory cache in front
+    of the actual backend"""
+
+    def __init__(self, backend, cache=None, codec="balanced"):
+        self.backend = backend
+        self.cache = cache
+        self.codec = resolve_codec(codec)
+
+    def __contains__(self, image_id):
+        if not isinstance(image_id, str) or not _ID_PATTERN.fullmatch(image_id):
+            return False
+        if self.cache is not None and image_id in self.cache:
+            return True
+        return image_id in self.backend
+
+    def put(self, data):
+        """Store the encoded image ``data`` and return its id"""
+        image_id = image_id_for(data)
+        self.backend.put(image_id, data)
+        if self.cache is not None:
+            self.cache.put(image_id, data)
+        return image_id
+
+    def put_stream(self, chunks):
+        """Store the encoded image from an iterable of byte chunks and return its
+        id. With the file backend, the chunks go straight to a file and are
+        never joined in memory. They are not added to the memory cache."""
+        digest = hashlib.sha256()
+
+        def hashed():
+            for chunk in chunks:
+                digest.update(chunk)
+                yield chunk
+
+        if hasattr(self.backend, "write_temporary"):
+            tmp_path = self.backend.write_temporary(hashed())
+            image_id = digest.hexdigest()[:ID_LENGTH]
+            self.backend.put_file(image_id, tmp_path)
+        else:
+            data = b"".join(hashed())
+            image_id = digest.hexdigest()[:ID_LENGTH]
+            self.backend.put(image_id, data)
+        return image_id
+
+    def put_image(self, image, codec=None):
+        """Encode the PIL image with the codec (or policy) of the store, see
+        image_codecs.py, and store it, returns the id"""
+        with span("store_encode"):
+            data = encode_image(image, codec or self.codec)
+        return self.put(data)
+
+    def get(self, image_id):
+        """Return the encoded bytes for ``image_id``"""
+        if not isinstance(image_id, str) or not _ID_PATTERN.fullmatch(image_id):
+            raise ImageNotFoundError(image_id)
+        if self.cache is not None:
+            data = self.cache.get(image_id)
+            if data is not None:
+                return data
+        data = self.backend.get(image_id)
+        if data is None:
+            raise ImageNotFoundError(image_id)
+        if self.cache is not None:
+            self.cache.put(image_id, data)
+        return data
+
+    def get_pil(self, image_id):
+        return decode(self.get(image_id))
+
+    def get_numpy(self, image_id, to_scalar=True, dtype=np.float64):
+        np_array = np.array(self.get_pil(image_id))
+        if to_scalar:
+            np_array = np.divide(np_array, 255, dtype=dtype)
+        return np_array
+
+    def metadata(self, image_id):
+        """Size and mode of the image, only the header is decoded"""
+        im = self.get_pil(image_id)  # pylint:disable=invalid-name
+        return {"width": im.size[0], "height": im.size[1], "mode": im.mode}
+
+    def delete(self, image_id):
+        self.backend.delete(image_id)
+        if self.cache is not None:
+            self.cache.delete(image_id)
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_image_store():
+    """Return the store of this process, configured from settings.py"""
+    global _STORE  # pylint:disable=global-statement
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                config = get_config()
+                backend_name = config.get("IMAGE_STORE_BACKEND", "file")
+                backend_kwargs = {}
+                if backend_name == "file":
+                    backend_kwargs["directory"] = config.get("IMAGE_STORE_PATH")
+                if config.get("IMAGE_STORE_MAX_BYTES"):
+                    backend_kwargs["max_bytes"] = int(config["IMAGE_STORE_MAX_BYTES"])
+                cache_bytes = int(config.get("IMAGE_STORE_CACHE_BYTES", 0) or 0)
+                _STORE = ImageStore(
+                    make_backend(backend_name, **backend_kwargs),
+                    cache=MemoryBackend(cache_bytes)
+                    if cache_bytes and backend_name != "memory"
+                    else None,
+                    codec=config.get("IMAGE_STORE_CODEC", "balanced"),
+                )
+    return _STORE
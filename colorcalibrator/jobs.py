@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Background jobs for the slow parts of the callbacks (the calibration).
+
+The jobs are rows of a SQLite database, which takes the place of a broker: every
+gunicorn worker can submit jobs and look up the status of any job, also of jobs
+submitted by another worker. A worker runs the jobs it claimed in its pool of
+processes (see workers.py), or in threads if the image store is in memory, as
+the processes would not see it, or the pool is disabled. At most ``concurrency`` jobs run at the same time over all workers, queued
+jobs are claimed when a job finishes or the status of a job is requested.
+
+A job is a picklable function, that is called with the arguments and a
+``progress(fraction, message)`` callback, its return value is pickled into the
+database. The timing records of the job (see timing.py) are reported in the
+worker that runs it, also when it runs in the pool. As the jobs and their
+results are unpickled, the database is by default in the private directory of
+the user (see settings.py).
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+from . import timing
+from .settings import get_config, runtime_directory
+from .workers import get_process_pool
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    payload BLOB,
+    result BLOB,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+def _connect(path):
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    return connection
+
+
+def _update(path, job_id, **columns):
+    columns["updated"] = time.time()
+    with closing(_connect(path)) as connection:
+        connection.execute(
+            "UPDATE jobs SET {} WHERE id = ?".format(
+                ", ".join("{} = ?".format(column) for column in columns)
+            ),
+            (*columns.values(), job_id),
+        )
+
+
+def _run(path, job_id):
+    """Run a claimed job, in the pool, returns the timing records"""
+    with timing.collect() as records, timing.span("job", job_id=job_id):
+        _run_job(path, job_id)
+    return records
+
+
+def _run_job(path, job_id):
+    with closing(_connect(path)) as connection:
+        (payload,) = connection.execute(
+            "SELECT payload FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+    function, args, kwargs = pickle.loads(payload)
+
+    def progress(fraction, message=None):
+        _update(path, job_id, progress=float(fraction), message=message)
+
+    try:
+        result = function(*args, progress=progress, **kwargs)
+    except Exception as e:  # pylint:disable=broad-except, invalid-name
+        logger.exception("Job {} failed".format(job_id))
+        _update(path, job_id, status=FAILED, error="{}: {}".format(type(e).__name__, e))
+        return
+    _update(
+        path,
+        job_id,
+        status=DONE,
+        progress=1.0,
+        result=pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL),
+    )
+
+
+class JobQueue:
+    """SQLite-backed job queue, run by an executor of this process (a thread
+    pool of ``concurrency`` threads by default)"""
+
+    def __init__(
+        self, path, concurrency=2, executor=None, timeout=600, keep=24 * 3600
+    ):  # pylint:disable=too-many-arguments
+        self.path = path
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.keep = keep
+        self.executor = executor or ThreadPoolExecutor(concurrency)
+        self._lock = threading.RLock()  # the done callbacks can run in dispatch
+        with closing(_connect(path)) as connection:
+            connection.execute(_SCHEMA)
+
+    def submit(self, function, *args, **kwargs):
+        """Queue the job, returns its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with closing(_connect(self.path)) as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, status, payload, created, updated) VALUES (?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    QUEUED,
+                    pickle.dumps((function, args, kwargs)),
+                    now,
+                    now,
+                ),
+            )
+            connection.execute("DELETE FROM jobs WHERE created < ?", (now - self.keep,))
+        self.dispatch()
+        return job_id
+
+    def _claim(self):
+        """Mark the oldest queued job as running if less than ``concurrency``
+        jobs run, returns its id or None"""
+        connection = _connect(self.path)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            # jobs of crashed workers
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE status = ? AND updated < ?",
+                (FAILED, "Timed out", now, RUNNING, now - self.timeout),
+            )
+            (running,) = connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", (RUNNING,)
+            ).fetchone()
+            row = None
+            if running < self.concurrency:
+                row = connection.execute(
+                    "SELECT id FROM jobs WHERE status = ? ORDER BY created LIMIT 1",
+                    (QUEUED,),
+                ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET status = ?, updated = ? WHERE id = ?",
+                    (RUNNING, now, row[0]),
+                )
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+        return None if row is None else row[0]
+
+    def dispatch(self):
+        """Start queued jobs while there is capacity"""
+        with self._lock:
+            while True:
+                job_id = self._claim()
+                if job_id is None:
+                    return
+                future = self.executor.submit(_run, self.path, job_id)
+                future.add_done_callback(self._done)
+
+    def _done(self, future):
+        if future.exception() is None:
+            # not in a span of the thread that happens to run the callback
+            timing.report(future.result(), nest=False)
+        self.dispatch()
+
+    def status(self, job_id):
+        """Dict with status, progress, message, error and (when done) the result
+        of the job, None if it is unknown"""
+        self.dispatch()
+        with closing(_connect(self.path)) as connection:
+            row = connection.execute(
+                "SELECT status, progress, message, error, result FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        status, progress, message, error, result = row
+        return {
+            "status": status,
+            "progress": progress,
+            "message": message,
+            "error": error,
+            "result": pickle.loads(result) if result is not None else None,
+        }
+
+
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
+
+
+def get_job_queue():
+    """Return the queue of this process, configured from settings.py"""
+    global _QUEUE  # pylint:disable=global-statement
+    if _QUEUE is None:
+        with _QUEUE_LOCK:
+            if _QUEUE is None:
+                config = get_config()
+                executor = None
+                if config.get("IMAGE_STORE_BACKEND", "file") != "memory":
+                    executor = get_process_pool()
+                _QUEUE = JobQueue(
+                    config.get("JOBS_PATH")
+                    or os.path.join(runtime_directory(), "jobs.sqlite"),
+                    concurrency=int(config.get("JOBS_CONCURRENCY", 2)),
+                    executor=executor,
+                    timeout=float(config.get("JOBS_TIMEOUT", 600)),
+                )
+    return _QUEUE
@@ -3,29 +3,36 @@
 
 import json
 
+import dash
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
 import pandas as pd
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 from dash import dash_table
 from loguru import logger
 import numpy as np
 
 from . import dash_reusable_components as drc
 from .app import __version__, app
+from .charts import AUTO, chart_names, chart_options, get_chart
+from .detection import GRID
+from .image_store import get_image_store
+from . import jobs, pipeline
+from .orientation import IDENTITY, orient_pil
+from .preview import PREVIEW_SIZE, make_preview, oriented_size, visible_tiles
+from .timing import span, timed
 from .utils import (
-    GRAPH_PLACEHOLDER,
     STORAGE_PLACEHOLDER,
-    calibrate_image,
     closest_name,
-    flip_image,
     get_average_color,
-    mirror_image,
     plot_parity,
-    rotate_image,
+    selection_box,
 )
 
+GRAPH_PLACEHOLDER = dcc.Graph(id="interactive-image", style={"height": "80vh"})
+
 
 def serve_layout():
     """create the layout"""
@@ -59,8 +66,8 @@ def serve_layout():
                                 [
                                     html.H4("Workflow"),
                                     html.Li(
-                                        "Upload image (please use files smaller than 1MB), rotate if needed (black patch in the top left corner and the white one in the top right corner)."
-                                    ),  # this limit only applies to the deployments
+                                        "Upload image, rotate if needed (black patch in the top left corner and the white one in the top right corner)."
+                                    ),
                                     html.Li('Cick on "Run calibration"'),
                                     html.Li(
                                         "Use mouswheel to zoom, select a rectangle with your substance."
@@ -78,11 +85,24 @@ def serve_layout():
                                 children=[
                                     drc.Card(
                                         [
-                                            dcc.Upload(
-                                                id="upload-image",
+                                            # streamed to /api/upload by
+                                            # assets/upload.js, which puts the id
+                                            # into uploaded-image
+                                            html.Label(
+                                                id="stream-upload",
                                                 children=[
                                                     "Drag and Drop or ",
                                                     html.A("Select an Image"),
+                                                    html.Span(
+                                                        id="stream-upload-status",
+                                                        style={"margin-left": "1em"},
+                                                    ),
+                                                    html.Input(
+                                                        id="stream-upload-input",
+                                                        type="file",
+                                                        accept="image/*",
+                                                        style={"display": "none"},
+                                                    ),
                                                 ],
                                                 style={
                                                     "width": "100%",
@@ -92,8 +112,14 @@ def serve_layout():
                                                     "borderStyle": "dashed",
                                                     "borderRadius": "5px",
                                                     "textAlign": "center",
+                                                    "cursor": "pointer",
                                                 },
-                                                accept="image/*",
+                                            ),
+                                            dcc.Input(
+                                                id="uploaded-image",
+                                                type="text",
+                                                value="",
+                                                style={"display": "none"},
                                             ),
                                         ]
                                     ),
@@ -123,6 +149,30 @@ def serve_layout():
                                                     "margin-top": "5px",
                                                 },
                                             ),
+                                            html.Button(
+                                                "crop to selection",
+                                                id="crop",
+                                                style={
+                                                    "margin-right": "10px",
+                                                    "margin-top": "5px",
+                                                },
+                                            ),
+                                            html.Button(
+                                                "undo",
+                                                id="undo",
+                                                style={
+                                                    "margin-right": "10px",
+                                                    "margin-top": "5px",
+                                                },
+                                            ),
+                                            html.Button(
+                                                "redo",
+                                                id="redo",
+                                                style={
+                                                    "margin-right": "10px",
+                                                    "margin-top": "5px",
+                                                },
+                                            ),
                                         ]
                                     ),
                                     drc.Card(
@@ -130,10 +180,11 @@ def serve_layout():
                                             html.Label("Calibration card"),
                                             dcc.Dropdown(
                                                 id="calibration_card",
-                                                options=[
+                                                options=chart_options()
+                                                + [
                                                     {
-                                                        "label": "Spyderchecker 24",
-                                                        "value": "spyder24",
+                                                        "label": "Detect automatically",
+                                                        "value": AUTO,
                                                     },
                                                 ],
                                                 value="spyder24",
@@ -168,6 +219,11 @@ def serve_layout():
                                                 ["Only Whitepoint"],
                                                 id="only_whitepoint",
                                             ),
+                                            dcc.Checklist(
+                                                ["Show ΔE map"],
+                                                [],
+                                                id="show_delta_e",
+                                            ),
                                             html.Button(
                                                 "Run Calibration",
                                                 id="button-run-operation",
@@ -216,6 +272,10 @@ def serve_layout():
                                     # showing the image, as well as the hidden div storing
                                     # the true image
                                     html.Div(id="error"),
+                                    html.Div(id="job-progress"),
+                                    dcc.Interval(
+                                        id="job-poll", interval=1000, disabled=True
+                                    ),
                                     html.Div(
                                         id="div-interactive-image",
                                         children=[
@@ -246,7 +306,14 @@ def serve_layout():
                                 [
                                     html.H4("Measured colors"),
                                     dash_table.DataTable(
-                                        data=[{"R": np.nan, "G": np.nan, "B": np.nan}],
+                                        data=[
+                                            {
+                                                "statistic": "mean",
+                                                "R": np.nan,
+                                                "G": np.nan,
+                                                "B": np.nan,
+                                            }
+                                        ],
                                         # optional - sets the order of columns
                                         # columns=["R", "G", "B"],
                                         editable=True,
@@ -287,6 +354,64 @@ def serve_layout():
 app.layout = serve_layout
 
 
+def _dump_storage(storage):
+    with span("storage_json"):
+        return json.dumps(storage)
+
+
+def _job_progress(job):
+    """Progress bar of a calibration job"""
+    if job is None or job["status"] == jobs.QUEUED:
+        return dbc.Progress(value=100, striped=True, animated=True, label="Queued")
+    return dbc.Progress(
+        value=max(job["progress"] * 100, 5),
+        striped=True,
+        animated=True,
+        label="Calibrating ({})".format(job["message"])
+        if job["message"]
+        else "Calibrating",
+    )
+
+
+def _replay(storage, store):
+    """Update the storage from the memoized stages, calibrations that are not
+    memoized are submitted as background job. Returns the progress bar and
+    whether a job is pending."""
+    try:
+        storage.update(
+            pipeline.replay(
+                store,
+                storage["original_id"],
+                storage["action_stack"],
+                cached_only=True,
+            )
+        )
+    except pipeline.PendingStage as pending:
+        # the stage may already be computed by the job of an earlier action
+        job_key = json.dumps(pending.args[0])
+        if storage.get("job_id") and storage.get("job_key") == job_key:
+            job = jobs.get_job_queue().status(storage["job_id"])
+            if job is not None and job["status"] in (jobs.QUEUED, jobs.RUNNING):
+                return _job_progress(job), True
+        storage["job_key"] = job_key
+        # the action that is dropped if the job fails
+        index = pending.args[1]
+        storage["job_action"] = [index, storage["action_stack"][index]]
+        storage["job_id"] = jobs.get_job_queue().submit(
+            pipeline.replay_job,
+            storage["original_id"],
+            list(storage["action_stack"]),
+            tile_rows=app.server.config.get("CALIBRATION_TILE_ROWS") or None,
+            dtype=app.server.config.get("CALIBRATION_DTYPE", "float64"),
+            detection_width=app.server.config.get("CALIBRATION_DETECTION_WIDTH")
+            or None,
+        )
+        app.logger.info("Submitted calibration job {}".format(storage["job_id"]))
+        return _job_progress(None), True
+    storage["job_id"] = None
+    return html.Div(), False
+
+
 def init_timestamp(timestamp):
     """Set the timestamp to zero in case the button has not been clicked, otherwise give an int for the ranking"""
     try:
@@ -302,6 +427,7 @@ def init_timestamp(timestamp):
     [Input("interactive-image", "figure")],
     [State("div-storage", "children")],
 )
+@timed("callback.update_histogram")
 def update_histogram(_, storage):
     """Check if the parity plot can be updated when the image changes"""
     storage = json.loads(storage)
@@ -333,11 +459,24 @@ def update_histogram(_, storage):
     Output("exclude_dropdown", "options"),
     [Input("calibration_card", "value")],
 )
+@timed("callback.update_exlude_options")
 def update_exlude_options(calibration_card):
-    """Dropdown for exclude is dynamic as function of the selected number of rows and columns"""
-    if calibration_card == "spyder24":
-        options = [{"label": str(v), "value": v} for v in range(0, 23)]
-    return options
+    """Dropdown for exclude is dynamic as function of the swatches of the selected
+    card, with "auto" the cards of the detected grid have to agree"""
+    if calibration_card == AUTO:
+        sizes = {
+            len(get_chart(name))
+            for name in chart_names()
+            if get_chart(name).grid == GRID
+        }
+        if len(sizes) != 1:
+            return []
+        return [{"label": str(v), "value": v} for v in range(sizes.pop())]
+    chart = get_chart(calibration_card)
+    return [
+        {"label": "{} ({})".format(v, name), "value": v}
+        for v, name in enumerate(chart.swatch_names)
+    ]
 
 
 @app.callback(
@@ -348,6 +487,7 @@ def update_exlude_options(calibration_card):
         State("div-storage", "children"),
     ],
 )
+@timed("callback.update_rgb_result")
 def update_rgb_result(
     _, table, selected_data, storage
 ):  # pylint:disable=unused-argument
@@ -358,7 +498,10 @@ def update_rgb_result(
         rgb, data = get_average_color(
             selected_data["range"]["x"],
             selected_data["range"]["y"],
-            drc.b64_to_pil(storage["image_string"]),
+            orient_pil(
+                get_image_store().get_pil(storage["image_id"]),
+                storage.get("orientation", IDENTITY),
+            ),
         )
 
         return [
@@ -380,21 +523,33 @@ def update_rgb_result(
 
     except Exception as e:  # pylint:disable=broad-except
         logger.exception(e)
-        return [html.Div([""]), [{"R": np.nan, "G": np.nan, "B": np.nan}]]
+        return [
+            html.Div([""]),
+            [{"statistic": "mean", "R": np.nan, "G": np.nan, "B": np.nan}],
+        ]
 
 
 @app.callback(
-    [Output("div-interactive-image", "children"), Output("error", "children")],
     [
-        Input("upload-image", "contents"),
+        Output("div-interactive-image", "children"),
+        Output("error", "children"),
+        Output("job-progress", "children"),
+        Output("job-poll", "disabled"),
+    ],
+    [
+        Input("uploaded-image", "value"),
         Input("button-run-operation", "n_clicks_timestamp"),
         Input("rotate", "n_clicks_timestamp"),
         Input("flip", "n_clicks_timestamp"),
         Input("mirror", "n_clicks_timestamp"),
+        Input("crop", "n_clicks_timestamp"),
+        Input("undo", "n_clicks_timestamp"),
+        Input("redo", "n_clicks_timestamp"),
+        Input("show_delta_e", "value"),
+        Input("job-poll", "n_intervals"),
     ],
     [
         State("interactive-image", "selectedData"),
-        State("upload-image", "filename"),
         State("div-storage", "children"),
         State("calibration_card", "value"),
         State("exclude_dropdown", "value"),
@@ -402,14 +557,19 @@ def update_rgb_result(
         State("only_whitepoint", "value"),
     ],
 )
-def update_graph_interactive_image(  # pylint:disable=too-many-arguments
-    content,
+@timed("callback.update_graph_interactive_image")
+def update_graph_interactive_image(  # pylint:disable=too-many-arguments, too-many-locals, too-many-branches
+    uploaded,
     run_timestamp,
     rotate_timestamp,
     flip_timestamp,
     mirror_timestamp,
-    selected_data,  # pylint:disable=unused-argument
-    new_filename,
+    crop_timestamp,
+    undo_timestamp,
+    redo_timestamp,
+    show_delta_e,
+    _,
+    selected_data,
     storage,
     calibration_card,
     excluded,
@@ -420,98 +580,122 @@ def update_graph_interactive_image(  # pylint:disable=too-many-arguments
     # Retrieve information saved in storage, which is a dict containing
     # information about the image and its action stack
     storage = json.loads(storage)
-    filename = storage["filename"]  # Filename is the name of the image file.
+    store = get_image_store()
+    triggered = [t["prop_id"].split(".")[0] for t in dash.callback_context.triggered]
 
-    # # Runs the undo function if the undo button was clicked. Storage stays
-    # # the same otherwise.
-    # storage = undo_last_action(undo_clicks, storage)
     error_out = html.Div()
+    failed_job = job_action = None
 
-    # If a new file was uploaded (new file name changed)
-    if new_filename and new_filename != filename:
-        # Replace filename
-
-        # Update the storage dict
-        storage["filename"] = new_filename
-
-        # Parse the string and convert to pil
-        string = content.split(";base64,")[-1]
-        # im_pil = drc.b64_to_pil(string)
-        storage["image_string"] = string
+    if "job-poll" in triggered:
+        job = (
+            jobs.get_job_queue().status(storage["job_id"])
+            if storage.get("job_id")
+            else None
+        )
+        if job is None:
+            return dash.no_update, dash.no_update, html.Div(), True
+        if job["status"] in (jobs.QUEUED, jobs.RUNNING):
+            return dash.no_update, dash.no_update, _job_progress(job), False
+        storage["job_id"] = None
+        job_action = storage.pop("job_action", None)
+        if job["status"] == jobs.DONE:
+            pipeline.remember(job["result"]["stages"])
+        else:
+            failed_job = job
+
+    if storage.get("original_id") is not None and storage["original_id"] not in store:
+        # the store evicted the image (or the worker was restarted)
+        storage["original_id"] = storage["image_id"] = None
+        error_out = dbc.Alert(
+            "The image is no longer available on the server, please upload it again.",
+            color="primary",
+            dismissable=True,
+            style={"font-size": "1.5rem"},
+        )
 
-        del string
+    # If a new file was uploaded, it is already in the store (see api.upload)
+    if "uploaded-image" in triggered and uploaded:
+        uploaded = json.loads(uploaded)
+        storage["filename"] = uploaded["filename"]
+        storage["original_id"] = uploaded["image_id"]
+        storage["image_signature"] = storage["original_id"]
+        storage["action_stack"] = []
+        storage["redo_stack"] = []
+
+    # toggling the ΔE map only changes the display
+    elif (
+        "show_delta_e" in triggered
+        or "job-poll" in triggered
+        or storage.get("original_id") is None
+    ):
+        pass
 
-    # we want to run colorcalibration as name wasn't changed
     else:
         # https://community.plotly.com/t/input-two-or-more-button-how-to-tell-which-button-is-pressed/5788/29
-
-        run_timestamp = init_timestamp(run_timestamp)
-        rotate_timestamp = init_timestamp(rotate_timestamp)
-        flip_timestamp = init_timestamp(flip_timestamp)
-        mirror_timestamp = init_timestamp(mirror_timestamp)
-
-        # run calibration
-        if (
-            run_timestamp > rotate_timestamp
-            and run_timestamp > flip_timestamp
-            and run_timestamp > mirror_timestamp
-        ):
-            try:
-                img, merged_df = calibrate_image(
-                    drc.b64_to_numpy(storage["image_string"]),
-                    calibration_card,
-                    excluded,
-                    algorithm,
-                    len(only_whitepoint) > 0,
-                )
-                storage["image_string"] = drc.pil_to_b64(img)
-                storage["merged_df"] = merged_df.to_json()
-                del img
-            except Exception as e:  # pylint:disable=broad-except, invalid-name
-                logger.exception("Could not calibrate image due to {}".format(e))
-                error_out = dbc.Alert(
-                    "Could not calibrate image, maybe the detection of the color card failed. Try a different image.",
-                    color="primary",
-                    dismissable=True,
-                    style={"font-size": "1.5rem"},
+        timestamps = {
+            "calibrate": init_timestamp(run_timestamp),
+            "rotate": init_timestamp(rotate_timestamp),
+            "flip": init_timestamp(flip_timestamp),
+            "mirror": init_timestamp(mirror_timestamp),
+            "crop": init_timestamp(crop_timestamp),
+            "undo": init_timestamp(undo_timestamp),
+            "redo": init_timestamp(redo_timestamp),
+        }
+        clicked = max(timestamps, key=timestamps.get)
+
+        if timestamps[clicked] == 0:
+            pass
+        elif clicked == "undo":
+            pipeline.undo(storage)
+        elif clicked == "redo":
+            pipeline.redo(storage)
+        elif clicked == "calibrate":
+            pipeline.push(
+                storage,
+                pipeline.calibrate_action(
+                    calibration_card, excluded, algorithm, len(only_whitepoint) > 0
+                ),
+            )
+        elif clicked == "crop":
+            if selected_data and "range" in selected_data:
+                box = selection_box(
+                    selected_data["range"]["x"],
+                    selected_data["range"]["y"],
+                    storage["image_size"],
                 )
-                app.logger.error(
-                    "Could not calibrate image due to {}".format(e)
-                )  # pylint:disable=logging-format-interpolation
-            else:
-                app.logger.info("Calibration successfull")
-
-        # mirror the image
-        elif (
-            mirror_timestamp > rotate_timestamp
-            and mirror_timestamp > flip_timestamp
-            and mirror_timestamp > run_timestamp
-        ):
-            img = drc.pil_to_b64(mirror_image(drc.b64_to_pil(storage["image_string"])))
-            storage["image_string"] = img
-            del img
-        # flip the image
-        elif (
-            flip_timestamp > rotate_timestamp
-            and flip_timestamp > mirror_timestamp
-            and flip_timestamp > run_timestamp
-        ):
-            img = drc.pil_to_b64(flip_image(drc.b64_to_pil(storage["image_string"])))
-            storage["image_string"] = img
-            del img
-        # rotate the image by 90 degree
-        elif (
-            rotate_timestamp > flip_timestamp
-            and rotate_timestamp > mirror_timestamp
-            and rotate_timestamp > run_timestamp
-        ):
-            img = drc.pil_to_b64(rotate_image(drc.b64_to_pil(storage["image_string"])))
-            storage["image_string"] = img
-
-            del img
-
+                if box[2] > box[0] and box[3] > box[1]:
+                    pipeline.push(storage, pipeline.crop_action(box))
+        else:
+            pipeline.push(storage, {"action": clicked})
+
+    progress_out, polling = html.Div(), False
+    if storage.get("original_id") is not None:
+        try:
+            if failed_job is not None:
+                raise RuntimeError(failed_job["error"])
+            progress_out, polling = _replay(storage, store)
+        except Exception as e:  # pylint:disable=broad-except, invalid-name
+            logger.exception("Could not calibrate image due to {}".format(e))
+            error_out = dbc.Alert(
+                "Could not calibrate image, maybe the detection of the color card failed. Try a different image.",
+                color="primary",
+                dismissable=True,
+                style={"font-size": "1.5rem"},
+            )
+            app.logger.error(
+                "Could not calibrate image due to {}".format(e)
+            )  # pylint:disable=logging-format-interpolation
+            # drop the failed action (of the job, the user may have added others
+            # since), the stack before it replays from the cache
+            if failed_job is None:
+                pipeline.discard(storage)
+            elif job_action is not None:
+                pipeline.discard(storage, *job_action)
+            progress_out, polling = _replay(storage, store)
+        else:
+            app.logger.info("Replayed {} actions".format(len(storage["action_stack"])))
     app.logger.info("Returning now")
-    if storage["image_string"] == "":  # pylint:disable=no-else-return
+    if storage["image_id"] is None:  # pylint:disable=no-else-return
         return [
             drc.InteractiveImagePIL(
                 image_id="interactive-image",
@@ -523,23 +707,80 @@ def update_graph_interactive_image(  # pylint:disable=too-many-arguments
             ),
             html.Div(
                 id="div-storage",
-                children=json.dumps(storage),
+                children=_dump_storage(storage),
                 style={"display": "none"},
             ),
-        ], error_out
+        ], error_out, progress_out, not polling
     else:
+        # the orientation is only applied for the display, which only gets a
+        # preview, the axes are in full-resolution pixels
+        orientation = storage.get("orientation", IDENTITY)
+        image = store.get_pil(storage["image_id"])
+        storage["image_size"] = list(oriented_size(image.size, orientation))
+        image = make_preview(
+            image,
+            orientation,
+            app.server.config.get("PREVIEW_SIZE", PREVIEW_SIZE),
+        )
+        overlay = None
+        caption = html.Div()
+        if show_delta_e and storage.get("delta_e_map_id") is not None:
+            overlay = orient_pil(store.get_pil(storage["delta_e_map_id"]), orientation)
+            caption = html.P(
+                "ΔE2000 between the original and the calibrated image, from 0 (dark) to {:.1f} (bright).".format(
+                    storage["delta_e_max"]
+                )
+            )
         return [
             drc.InteractiveImagePIL(
                 image_id="interactive-image",
-                image=drc.b64_to_pil(storage["image_string"]),
+                image=image,
                 enc_format="jpeg",
                 display_mode="fixed",
                 dragmode="select",
                 verbose=False,
+                overlay=overlay,
+                size=storage["image_size"],
             ),
+            caption,
             html.Div(
                 id="div-storage",
-                children=json.dumps(storage),
+                children=_dump_storage(storage),
                 style={"display": "none"},
             ),
-        ], error_out
+        ], error_out, progress_out, not polling
+
+
+@app.callback(
+    Output("interactive-image", "figure"),
+    [Input("interactive-image", "relayoutData")],
+    [State("interactive-image", "figure"), State("div-storage", "children")],
+)
+@timed("callback.update_tiles")
+def update_tiles(relayout_data, figure, storage):
+    """Add tiles with more detail than the preview when zooming in"""
+    if not relayout_data or figure is None:
+        raise PreventUpdate
+    storage = json.loads(storage)
+    if storage.get("image_id") is None:
+        raise PreventUpdate
+
+    images = [
+        image for image in figure["layout"]["images"] if image.get("name") != "tile"
+    ]
+    if "xaxis.range[0]" in relayout_data and "yaxis.range[0]" in relayout_data:
+        tiles = visible_tiles(
+            storage["image_id"],
+            storage.get("orientation", IDENTITY),
+            storage["image_size"],
+            (relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]),
+            (relayout_data["yaxis.range[0]"], relayout_data["yaxis.range[1]"]),
+            app.server.config.get("PREVIEW_SIZE", PREVIEW_SIZE),
+        )
+        # on top of the preview, below the overlay
+        images = images[:1] + tiles + images[1:]
+    elif not relayout_data.get("xaxis.autorange"):
+        raise PreventUpdate
+
+    figure["layout"]["images"] = images
+    return figure
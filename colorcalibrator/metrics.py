@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""``/metrics``: the timing histograms of timing.py"""
+from flask import Blueprint, Response
+
+from .timing import HISTOGRAMS
+
+metrics = Blueprint("metrics", __name__)  # pylint:disable=invalid-name
+
+
+@metrics.route("/metrics")
+def get_metrics():
+    """Timing histograms of this worker in the Prometheus text format"""
+    return Response(HISTOGRAMS.exposition(), mimetype="text/plain; version=0.0.4")
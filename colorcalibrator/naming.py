@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Perceptual colour naming against a palette of named colours"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .delta_e import DELTA_E_METHODS, srgb_to_lab
+
+
+class ColourNamer:
+    """Find the perceptually closest named colour (by default with CIEDE2000).
+
+    The palette, a dict of name to RGB tuple in the range 0-255, is converted to
+    Lab once. If ``prefilter`` is set, only the ``prefilter`` nearest palette
+    entries in Lab (found with a KD-tree) are compared with CIEDE2000, which is
+    faster for large batches and almost always gives the same name.
+    """
+
+    def __init__(self, palette, prefilter=None, chunk_size=1024, method="CIE 2000"):
+        self.delta_e = DELTA_E_METHODS[method]
+        self.names = np.array(list(palette.keys()))
+        self.lab = srgb_to_lab(np.array(list(palette.values())), upscaled=True)
+        self.prefilter = prefilter
+        self.chunk_size = chunk_size
+        self._tree = cKDTree(self.lab) if prefilter else None
+
+    def _closest_indices(self, lab):
+        if self._tree is not None:
+            _, candidates = self._tree.query(
+                lab, k=min(self.prefilter, len(self.names))
+            )
+            candidates = candidates.reshape(len(lab), -1)
+            distances = self.delta_e(lab[:, np.newaxis, :], self.lab[candidates])
+            return candidates[np.arange(len(lab)), np.argmin(distances, axis=1)]
+
+        distances = self.delta_e(lab[:, np.newaxis, :], self.lab[np.newaxis])
+        return np.argmin(distances, axis=1)
+
+    def closest(self, colours, upscaled=True):
+        """Names for an (N, 3) array of RGB colours (0-255 if ``upscaled``)"""
+        lab = srgb_to_lab(np.asarray(colours)[..., :3], upscaled=upscaled)
+        lab = lab.reshape(-1, 3)
+        if len(lab) == 0:
+            return []
+        # the distance matrix has len(palette) entries per colour, limit the
+        # memory by working in chunks
+        indices = np.concatenate(
+            [
+                self._closest_indices(lab[start : start + self.chunk_size])
+                for start in range(0, len(lab), self.chunk_size)
+            ]
+        )
+        return list(self.names[indices])
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Orientation of the image as element of the dihedral group D4.
+
+Rotating, flipping and mirroring only update the orientation in the storage, the
+image in the store stays as uploaded. The orientation is applied (losslessly,
+with transpositions) when the image is displayed, calibrated or cropped. The
+detection of the card depends on it, as it expects the black patch on the top
+left.
+
+An orientation is a pair ``[rotation, mirrored]``: the image is mirrored
+(left-right) if ``mirrored``, then rotated by ``rotation`` times 90 degrees
+counter-clockwise.
+"""
+import numpy as np
+from PIL import Image
+
+IDENTITY = (0, False)
+
+_ROTATIONS = {1: Image.ROTATE_90, 2: Image.ROTATE_180, 3: Image.ROTATE_270}
+
+
+def rotate(orientation):
+    """Orientation after an additional rotation by 90 degrees counter-clockwise"""
+    rotation, mirrored = orientation
+    return ((rotation + 1) % 4, mirrored)
+
+
+def mirror(orientation):
+    """Orientation after an additional left-right mirroring"""
+    rotation, mirrored = orientation
+    return (-rotation % 4, not mirrored)
+
+
+def flip(orientation):
+    """Orientation after an additional top-bottom flip (a mirroring followed by a
+    rotation by 180 degrees)"""
+    rotation, mirrored = orientation
+    return ((2 - rotation) % 4, not mirrored)
+
+
+def orient_pil(image, orientation):
+    """Apply the orientation to a PIL image"""
+    rotation, mirrored = orientation
+    if mirrored:
+        image = image.transpose(Image.FLIP_LEFT_RIGHT)
+    if rotation:
+        image = image.transpose(_ROTATIONS[rotation])
+    return image
+
+
+def orient_array(array, orientation):
+    """Apply the orientation to a (height, width, ...) array, returns a view"""
+    rotation, mirrored = orientation
+    if mirrored:
+        array = array[:, ::-1]
+    return np.rot90(array, rotation)
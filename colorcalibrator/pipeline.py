@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""Replayable edit pipeline of the web app.
+
+The storage keeps the id of the uploaded image and the actions that were applied
+to it (``action_stack``), undone actions are kept in ``redo_stack``. The current
+image is derived by replaying the actions on the original:
+
+- rotate, flip and mirror only change the orientation (see orientation.py)
+- calibrate and crop produce a new image in the store, of the oriented image
+
+The results of calibrate and crop are memoized, keyed by the id of their input
+image, the action and the orientation. As the ids are content hashes, the input image is
+determined by the original and the actions before it, so undo, redo and going
+back to parameters that were used before reuse the stages instead of decoding,
+detecting and correcting again. The memo is kept next to the images, in the
+backend of the image store, such that (with the file backend) all gunicorn
+workers and the processes of the jobs share it.
+
+The web app replays with ``cached_only=True``, which raises :class:`PendingStage`
+instead of calibrating, and runs :func:`replay_job` as background job (see
+jobs.py), whose stages are then added to the memo with :func:`remember`.
+"""
+import hashlib
+import json
+
+import numpy as np
+
+from .calibration_cache import get_calibration_cache
+from .image_store import get_image_store
+from .orientation import IDENTITY, flip, mirror, orient_array, orient_pil, rotate
+from .utils import heatmap_to_pil
+from .workers import calibrate_image
+
+ORIENTATION_ACTIONS = {"rotate": rotate, "flip": flip, "mirror": mirror}
+
+
+def calibrate_action(card, excluded, algorithm, only_white_point):
+    return {
+        "action": "calibrate",
+        "card": card,
+        "excluded": sorted(excluded) if excluded else None,
+        "algorithm": algorithm,
+        "only_white_point": bool(only_white_point),
+    }
+
+
+def crop_action(box):
+    """Crop to the box (x_0, y_0, x_1, y_1) in the coordinates of the displayed,
+    i.e. oriented, image"""
+    return {"action": "crop", "box": [int(value) for value in box]}
+
+
+def push(storage, action):
+    """Add the action to the stack of the storage, this clears the redo stack.
+
+    A calibration directly after a calibration replaces it, i.e. only changes the
+    parameters, as calibrating an already calibrated image is not meaningful."""
+    stack = storage.setdefault("action_stack", [])
+    if action["action"] == "calibrate" and stack and stack[-1]["action"] == "calibrate":
+        stack.pop()
+    stack.append(action)
+    storage["redo_stack"] = []
+
+
+def undo(storage):
+    """Move the last action to the redo stack, returns False if there is none"""
+    if not storage.get("action_stack"):
+        return False
+    storage.setdefault("redo_stack", []).append(storage["action_stack"].pop())
+    return True
+
+
+def redo(storage):
+    """Move the last undone action back to the action stack, returns False if
+    there is none"""
+    if not storage.get("redo_stack"):
+        return False
+    storage.setdefault("action_stack", []).append(storage["redo_stack"].pop())
+    return True
+
+
+def discard(storage, index=None, action=None):
+    """Remove a failed action and keep all others: the action at ``index`` of
+    the history (the action stack followed by the undone actions, the last undone
+    one last) if it still is ``action``, by default the last action. Returns False
+    if it is not there (anymore)."""
+    stack = storage.setdefault("action_stack", [])
+    redo_stack = storage.setdefault("redo_stack", [])
+    if index is None:
+        if not stack:
+            return False
+        index, action = len(stack) - 1, stack[-1]
+    if 0 <= index < len(stack):
+        actions, position = stack, index
+    else:
+        actions, position = redo_stack, len(stack) + len(redo_stack) - 1 - index
+    if not 0 <= position < len(actions) or actions[position] != action:
+        return False
+    del actions[position]
+    return True
+
+
+class StageCache:
+    """Results of the stages as JSON in a byte backend of the image store (which
+    evicts them like the images), the images are only referenced by id"""
+
+    PREFIX = "stage-"
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _key(self, key):
+        return self.PREFIX + hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+    def get(self, key):
+        data = self.backend.get(self._key(key))
+        return None if data is None else json.loads(data.decode())
+
+    def put(self, key, result):
+        # the backends keep an existing entry, which may reference evicted images
+        self.backend.delete(self._key(key))
+        self.backend.put(self._key(key), json.dumps(result).encode())
+
+
+def _stages(store):
+    return StageCache(store.backend)
+
+
+class PendingStage(Exception):
+    """Raised by :func:`replay` with ``cached_only`` if a calibration is needed,
+    the arguments are the key of the stage and the index of the action"""
+
+
+def remember(stages, store=None):
+    """Add the (key, result) pairs of stages computed elsewhere to the memo,
+    needed only if that process has another image store"""
+    memo = _stages(store or get_image_store())
+    for key, result in stages:
+        if memo.get(key) != result:
+            memo.put(key, result)
+
+
+def _calibrate(store, image_id, orientation, action, **kwargs):
+    # the detection expects the card as displayed (black patch on the top left)
+    image = orient_array(store.get_numpy(image_id, to_scalar=False), orientation)
+    img, merged_df, delta_e_map = calibrate_image(
+        np.ascontiguousarray(image),
+        action["card"],
+        action["excluded"],
+        action["algorithm"],
+        action["only_white_point"],
+        delta_e_map=True,
+        cache=get_calibration_cache(),
+        **kwargs
+    )
+    return {
+        "image_id": store.put_image(img),
+        "merged_df": merged_df.to_json(),
+        "delta_e_map_id": store.put_image(heatmap_to_pil(delta_e_map)),
+        "delta_e_max": float(np.nanmax(delta_e_map)),
+    }
+
+
+def _crop(store, image_id, orientation, action):
+    image = orient_pil(store.get_pil(image_id), orientation)
+    # the ΔE map belongs to the uncropped image
+    return {
+        "image_id": store.put_image(image.crop(tuple(action["box"]))),
+        "delta_e_map_id": None,
+        "delta_e_max": None,
+    }
+
+
+def _available(store, result):
+    return all(
+        result[key] is None or result[key] in store
+        for key in ("image_id", "delta_e_map_id")
+        if key in result
+    )
+
+
+def replay(
+    store,
+    original_id,
+    actions,
+    cached_only=False,
+    computed=None,
+    progress=None,
+    **calibration_options
+):  # pylint:disable=too-many-arguments
+    """Replay the actions on the original image, returns the current state: the
+    image id, its orientation and the results of the last calibration.
+    ``calibration_options`` are passed to :func:`~colorcalibrator.utils.calibrate_image`.
+
+    With ``cached_only``, :class:`PendingStage` is raised if a calibration is not
+    memoized. The stages that were computed are appended as (key, result) to the
+    list ``computed``, ``progress(fraction, message)`` is called before each
+    action.
+    """
+    state = {
+        "image_id": original_id,
+        "orientation": IDENTITY,
+        "merged_df": None,
+        "delta_e_map_id": None,
+        "delta_e_max": None,
+    }
+    memo = _stages(store)
+    for index, action in enumerate(actions):
+        name = action["action"]
+        if progress is not None:
+            progress(index / len(actions), name)
+        if name in ORIENTATION_ACTIONS:
+            state["orientation"] = ORIENTATION_ACTIONS[name](state["orientation"])
+            continue
+
+        key = [
+            state["image_id"],
+            json.dumps(action, sort_keys=True),
+            list(state["orientation"]),
+        ]
+        result = memo.get(key)
+        if result is None or not _available(store, result):
+            if name == "calibrate" and cached_only:
+                raise PendingStage(key, index)
+            if name == "calibrate":
+                result = _calibrate(
+                    store,
+                    state["image_id"],
+                    state["orientation"],
+                    action,
+                    **calibration_options
+                )
+            elif name == "crop":
+                result = _crop(store, state["image_id"], state["orientation"], action)
+            else:
+                raise ValueError("Unknown action {}".format(name))
+            memo.put(key, result)
+            if computed is not None:
+                computed.append((key, result))
+
+        state.update(result)
+        # the orientation is part of the calibrated or cropped image
+        state["orientation"] = IDENTITY
+
+    return state
+
+
+def replay_job(original_id, actions, progress=None, **calibration_options):
+    """:func:`replay` as background job, returns the state and the computed
+    stages"""
+    computed = []
+    state = replay(
+        get_image_store(),
+        original_id,
+        actions,
+        computed=computed,
+        progress=progress,
+        **calibration_options
+    )
+    return {"state": state, "stages": computed}
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Multi-resolution previews of the interactive image.
+
+The figure only embeds a preview that fits on the screen, its axes span the
+full-resolution image (the preview is stretched over them), hence selections
+are in full-resolution pixels. When the user zooms in, tiles of a finer level of
+the pyramid are fetched from ``/preview/...``:
+
+level ``k`` is the (oriented) image downscaled by ``2**k``, cut into tiles of
+``TILE_SIZE`` pixels. The level is chosen such that the visible part of the image
+has about ``TILE_SIZE * 2`` pixels on the screen.
+"""
+import math
+from functools import lru_cache
+from io import BytesIO as _BytesIO
+
+from flask import Blueprint, Response, abort, url_for
+from PIL import Image
+
+from .image_store import ImageNotFoundError, get_image_store
+from .orientation import orient_pil
+
+PREVIEW_SIZE = 1600
+TILE_SIZE = 512
+MAX_TILES = 25
+
+preview = Blueprint(  # pylint:disable=invalid-name
+    "preview", __name__, url_prefix="/preview"
+)
+
+
+def oriented_size(size, orientation):
+    """(width, height) after applying the orientation"""
+    width, height = size
+    return (height, width) if orientation[0] % 2 else (width, height)
+
+
+def make_preview(image, orientation, max_size=PREVIEW_SIZE):
+    """Downscaled and oriented copy of the (lazily loaded) PIL image with at most
+    ``max_size`` pixels on the longer side. For JPEGs, only a reduced version is
+    decoded."""
+    image = image.copy() if image.im else image
+    image.thumbnail((max_size, max_size))
+    return orient_pil(image, orientation)
+
+
+@lru_cache(maxsize=2)
+def _oriented_image(image_id, orientation):
+    return orient_pil(get_image_store().get_pil(image_id), orientation).convert("RGB")
+
+
+@lru_cache(maxsize=256)
+def _tile(image_id, orientation, level, col, row):
+    image = _oriented_image(image_id, orientation)
+    scale = 2**level
+    span = TILE_SIZE * scale
+    box = (
+        col * span,
+        row * span,
+        min((col + 1) * span, image.size[0]),
+        min((row + 1) * span, image.size[1]),
+    )
+    if box[0] >= box[2] or box[1] >= box[3]:
+        raise ValueError("The tile is outside of the image")
+    tile = image.crop(box)
+    if scale > 1:
+        tile = tile.resize(
+            (
+                max(math.ceil((box[2] - box[0]) / scale), 1),
+                max(math.ceil((box[3] - box[1]) / scale), 1),
+            ),
+            Image.BOX,
+        )
+    buff = _BytesIO()
+    tile.save(buff, format="jpeg", quality=90)
+    return buff.getvalue()
+
+
+@preview.route(
+    "/<image_id>/<int:rotation>/<int:mirrored>/<int:level>/<int:col>/<int:row>.jpg"
+)
+def get_tile(
+    image_id, rotation, mirrored, level, col, row
+):  # pylint:disable=too-many-arguments
+    """One tile of the pyramid of the oriented image"""
+    try:
+        data = _tile(image_id, (rotation % 4, bool(mirrored)), level, col, row)
+    except (ImageNotFoundError, ValueError):
+        abort(404)
+    response = Response(data, mimetype="image/jpeg")
+    # the image ids are content hashes, the tiles never change (send_file of
+    # flask >= 2 would add no-cache)
+    response.cache_control.max_age = 24 * 3600
+    response.cache_control.public = True
+    return response
+
+
+def visible_tiles(
+    image_id, orientation, size, x_range, y_range, preview_size=PREVIEW_SIZE
+):  # pylint:disable=too-many-arguments, too-many-locals
+    """Layout images (for plotly) of the tiles that cover the visible part of the
+    image, ``x_range`` and ``y_range`` are the axis ranges of the figure. Returns
+    an empty list if the preview is fine enough."""
+    width, height = size
+    x_0, x_1 = sorted(max(min(value, width), 0) for value in x_range)
+    # the y axis points up
+    y_0, y_1 = sorted(height - max(min(value, height), 0) for value in y_range)
+    visible = max(x_1 - x_0, y_1 - y_0)
+    if visible <= 0:
+        return []
+
+    preview_scale = max(width, height) / preview_size
+    level = max(int(math.floor(math.log2(max(visible / (2 * TILE_SIZE), 1)))), 0)
+    if 2**level >= preview_scale:
+        return []
+
+    span = TILE_SIZE * 2**level
+    cols = range(int(x_0 // span), int(math.ceil(x_1 / span)))
+    rows = range(int(y_0 // span), int(math.ceil(y_1 / span)))
+    if len(cols) * len(rows) > MAX_TILES:
+        return []
+
+    rotation, mirrored = orientation
+    images = []
+    for row in rows:
+        for col in cols:
+            tile_width = min(span, width - col * span)
+            tile_height = min(span, height - row * span)
+            images.append(
+                {
+                    "xref": "x",
+                    "yref": "y",
+                    "x": col * span,
+                    "y": height - row * span - tile_height,
+                    "yanchor": "bottom",
+                    "sizing": "stretch",
+                    "sizex": tile_width,
+                    "sizey": tile_height,
+                    "layer": "below",
+                    "source": url_for(
+                        "preview.get_tile",
+                        image_id=image_id,
+                        rotation=rotation,
+                        mirrored=int(mirrored),
+                        level=level,
+                        col=col,
+                        row=row,
+                    ),
+                    "name": "tile",
+                }
+            )
+    return images
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Calibration profiles that can be reused for images shot under the same setup.
+
+A profile is the white balance and the colour correction matrix fitted on one
+reference shot. Applying it to other images of the same camera and lighting
+is then only a per-pixel multiply and matrix product in linear RGB, the card
+does not need to be in the frame and no detection is run.
+"""
+import json
+
+import numpy as np
+from colour.characterisation import colour_correction_matrix, polynomial_expansion
+
+from . import transfer
+
+ALGORITHMS = {
+    "finlayson": "Finlayson 2015",
+    "cheung": "Cheung 2004",
+    "vandermonde": "Vandermonde",
+}
+
+PROFILE_VERSION = 1
+
+
+class CalibrationProfile:
+    """White balance (per channel scale) and, unless only the white point is
+    corrected, the colour correction matrix of the ``colour`` method, both for
+    linear RGB"""
+
+    def __init__(  # pylint:disable=too-many-arguments
+        self,
+        white_balance,
+        matrix=None,
+        method=None,
+        card="spyder24",
+        algorithm="finlayson",
+        excluded=None,
+    ):
+        self.white_balance = np.asarray(white_balance, dtype=np.float64)
+        self.matrix = None if matrix is None else np.asarray(matrix, dtype=np.float64)
+        self.method = method
+        self.card = card
+        self.algorithm = algorithm
+        self.excluded = list(excluded) if excluded else None
+
+    @property
+    def only_white_point(self):
+        return self.matrix is None
+
+    @classmethod
+    def fit(  # pylint:disable=too-many-arguments
+        cls,
+        swatches,
+        chart,
+        excluded=None,
+        algorithm="finlayson",
+        only_white_point=True,
+    ):
+        """Fit the profile on the mean colours of the swatches in linear RGB
+        (black first) and the precomputed references of the
+        :class:`~colorcalibrator.charts.ReferenceChart`"""
+        swatch = chart.white_balance_swatch
+        white_balance = chart.linear[swatch] / swatches[swatch]
+        if only_white_point:
+            return cls(white_balance, card=chart.name, algorithm=algorithm)
+
+        # unknown algorithms fall back to Finlayson 2015
+        method = ALGORITHMS.get(algorithm, ALGORITHMS["finlayson"])
+        swatches_wb = swatches * white_balance
+        if excluded:
+            swatches_wb = swatches_wb[chart.mask(excluded)]
+
+        return cls(
+            white_balance,
+            colour_correction_matrix(
+                swatches_wb, chart.subset(excluded, "linear"), method=method
+            ),
+            method,
+            card=chart.name,
+            algorithm=algorithm,
+            excluded=excluded,
+        )
+
+    def white_balanced(self, rgb):
+        """Only the white balance of the linear ``rgb``"""
+        return rgb * self.white_balance.astype(rgb.dtype, copy=False)
+
+    def corrected(self, rgb):
+        """Colour correction of the white balanced, linear ``rgb``, the dtype of
+        ``rgb`` is kept"""
+        if self.matrix is None:
+            return rgb
+        if self.matrix.shape[1] == 3:  # no expansion with the default degrees
+            return rgb @ self.matrix.T.astype(rgb.dtype, copy=False)
+        shape = rgb.shape
+        expanded = polynomial_expansion(rgb.reshape(-1, 3), method=self.method)
+        return (expanded @ self.matrix.T).reshape(shape).astype(rgb.dtype, copy=False)
+
+    def apply_linear(self, rgb):
+        """Calibrate linear RGB values of any shape (..., 3)"""
+        return self.corrected(self.white_balanced(rgb))
+
+    def apply(self, rgb, dtype=None):
+        """Calibrate non-linear (sRGB) values, uint8 or float in the range 0-1.
+
+        The computation is done in ``dtype``, by default the dtype of float
+        inputs and float64 for uint8 inputs, see :mod:`colorcalibrator.transfer`.
+        """
+        if dtype is None:
+            dtype = np.float64 if rgb.dtype == np.uint8 else rgb.dtype
+        return transfer.encode(self.apply_linear(transfer.decode(rgb, dtype)))
+
+    def to_dict(self):
+        return {
+            "version": PROFILE_VERSION,
+            "card": self.card,
+            "algorithm": self.algorithm,
+            "method": self.method,
+            "excluded": self.excluded,
+            "white_balance": self.white_balance.tolist(),
+            "matrix": None if self.matrix is None else self.matrix.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, d):  # pylint:disable=invalid-name
+        if d.get("version", PROFILE_VERSION) > PROFILE_VERSION:
+            raise ValueError(
+                "Calibration profile version {} is not supported".format(
+                    d["version"]
+                )
+            )
+        return cls(
+            d["white_balance"],
+            d.get("matrix"),
+            d.get("method"),
+            card=d.get("card", "spyder24"),
+            algorithm=d.get("algorithm", "finlayson"),
+            excluded=d.get("excluded"),
+        )
+
+    def save(self, path):
+        """Write the profile as JSON"""
+        with open(path, "w") as handle:
+            json.dump(self.to_dict(), handle, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as handle:
+            return cls.from_dict(json.load(handle))
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Configuration that does not need the web app.
+
+The modules read their settings with :func:`get_config`: the config of the Flask
+app if it is imported, otherwise (on the command line and in the processes of
+the pool) the upper case attributes of ``Config`` of config.py. That is the
+config.py next to the package, or one on the path, independent of the working
+directory. Without any, the modules use their defaults.
+
+The files the workers share (the image store, the file cache of the
+calibrations, the job database) are by default in a directory of the user below
+``/dev/shm``, see :func:`runtime_directory`. Pickles are loaded from there, hence
+it has to be private.
+"""
+import importlib.util
+import os
+import stat
+import sys
+import tempfile
+from functools import lru_cache
+
+CONFIG_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.py"
+)
+
+
+def load_config_class():
+    """``Config`` of config.py, None if there is none"""
+    if os.path.isfile(CONFIG_PATH):
+        spec = importlib.util.spec_from_file_location("config", CONFIG_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module.Config
+    try:
+        from config import Config  # pylint:disable=import-outside-toplevel
+    except ImportError:
+        return None
+    return Config
+
+
+@lru_cache(maxsize=1)
+def _standalone_config():
+    config_class = load_config_class()
+    if config_class is None:
+        return {}
+    return {
+        name: getattr(config_class, name)
+        for name in dir(config_class)
+        if name.isupper()
+    }
+
+
+def get_config():
+    """The settings of the Flask app if it is imported, otherwise of config.py"""
+    app = sys.modules.get("colorcalibrator.app")
+    if app is not None:
+        return app.server.config
+    return _standalone_config()
+
+
+def runtime_directory(base=None):
+    """The directory colorcalibrator-<uid> in ``base`` (by default /dev/shm, or the
+    temporary directory without it), created with the mode 0700. Raises a
+    PermissionError if it is not a directory of this user that only they can
+    access, e.g. one another user created in advance."""
+    if base is None:
+        base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    directory = os.path.join(base, "colorcalibrator-{}".format(os.getuid()))
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    status = os.lstat(directory)
+    if (
+        not stat.S_ISDIR(status.st_mode)
+        or status.st_uid != os.getuid()
+        or status.st_mode & 0o077
+    ):
+        raise PermissionError(
+            "{} is not a directory that only this user can access".format(directory)
+        )
+    return directory
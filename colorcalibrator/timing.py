@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""Per-stage timing (and optionally peak memory) of the calibration and the
+callbacks.
+
+Code is wrapped in (nested) spans, ``with span("detect"): ...`` or the
+``@timed(...)`` decorator. When the outermost span of a thread ends, one record
+with its duration and those of all nested stages is logged to the
+``colorcalibrator.timing`` logger, i.e. as JSON with the setup in logging.conf.
+Every span is also added to histograms that ``/metrics`` (see metrics.py)
+exposes in the Prometheus text format (per worker process).
+
+Code that runs in the pool of processes (see workers.py and jobs.py) keeps the
+records of its spans with :class:`collect` and returns them, the calling process
+adds them to its histograms and to its enclosing span or the log with
+:func:`report`.
+
+The peak memory is measured with tracemalloc (numpy reports its allocations to
+it), which slows down allocations and is hence only on if ``TIMING_TRACE_MEMORY``
+is set. With several threads, the peaks include the allocations of the others,
+before python 3.9 they are the peak since the tracing was started.
+"""
+import functools
+import logging
+import resource
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+logger = logging.getLogger("colorcalibrator.timing")  # pylint:disable=invalid-name
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_local = threading.local()  # pylint:disable=invalid-name
+
+
+class _Histograms:
+    """Thread-safe duration histograms and peak memory per stage"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: [0] * len(self.buckets))
+        self._sums = defaultdict(float)
+        self._totals = defaultdict(int)
+        self._peaks = {}
+
+    def observe(self, name, seconds, peak_bytes=None):
+        with self._lock:
+            counts = self._counts[name]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+            self._sums[name] += seconds
+            self._totals[name] += 1
+            if peak_bytes is not None:
+                self._peaks[name] = max(self._peaks.get(name, 0), peak_bytes)
+
+    def exposition(self):
+        """Prometheus text format"""
+        lines = [
+            "# HELP colorcalibrator_stage_seconds Duration of the stages",
+            "# TYPE colorcalibrator_stage_seconds histogram",
+        ]
+        with self._lock:
+            for name in sorted(self._totals):
+                for bound, count in zip(self.buckets, self._counts[name]):
+                    lines.append(
+                        'colorcalibrator_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(
+                            name, bound, count
+                        )
+                    )
+                lines.append(
+                    'colorcalibrator_stage_seconds_bucket{{stage="{}",le="+Inf"}} {}'.format(
+                        name, self._totals[name]
+                    )
+                )
+                lines.append(
+                    'colorcalibrator_stage_seconds_sum{{stage="{}"}} {}'.format(
+                        name, self._sums[name]
+                    )
+                )
+                lines.append(
+                    'colorcalibrator_stage_seconds_count{{stage="{}"}} {}'.format(
+                        name, self._totals[name]
+                    )
+                )
+            if self._peaks:
+                lines.append(
+                    "# HELP colorcalibrator_stage_peak_bytes Largest traced peak memory of the stages"
+                )
+                lines.append("# TYPE colorcalibrator_stage_peak_bytes gauge")
+                for name in sorted(self._peaks):
+                    lines.append(
+                        'colorcalibrator_stage_peak_bytes{{stage="{}"}} {}'.format(
+                            name, self._peaks[name]
+                        )
+                    )
+        lines.append("# HELP colorcalibrator_max_rss_bytes Peak resident memory")
+        lines.append("# TYPE colorcalibrator_max_rss_bytes gauge")
+        lines.append("colorcalibrator_max_rss_bytes {}".format(_max_rss()))
+        return "\n".join(lines) + "\n"
+
+
+HISTOGRAMS = _Histograms()
+
+
+def _max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # kB on linux
+
+
+def enable_memory_tracing():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+class span:  # pylint:disable=invalid-name, too-few-public-methods
+    """Context manager that times the enclosed code as stage ``name``, the
+    keyword arguments are added to the log record"""
+
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+        self.stages = []
+        self._start = None
+        self._peak = 0
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        if tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            if stack:  # the peak so far belongs to the enclosing span
+                stack[-1]._peak = max(stack[-1]._peak, peak)
+            if hasattr(tracemalloc, "reset_peak"):  # python >= 3.9
+                tracemalloc.reset_peak()
+        stack.append(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self._start
+        stack = _local.stack
+        stack.pop()
+
+        peak = None
+        if tracemalloc.is_tracing():
+            peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+
+        record = {"stage": self.name, "seconds": round(seconds, 6)}
+        if peak is not None:
+            record["peak_bytes"] = peak
+        if self.stages:
+            record["stages"] = self.stages
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        HISTOGRAMS.observe(self.name, seconds, peak)
+
+        if stack:
+            parent = stack[-1]
+            parent.stages.append(record)
+            if peak is not None:
+                parent._peak = max(parent._peak, peak)  # pylint:disable=protected-access
+        else:
+            record["max_rss_bytes"] = _max_rss()
+            record.update(self.fields)
+            _emit(record)
+        return False
+
+
+def _emit(record):
+    """Log the record of an outermost span, or keep it for :class:`collect`"""
+    collected = getattr(_local, "collected", None)
+    if collected is not None:
+        collected.append(record)
+    else:
+        logger.info(
+            "timing %s %.3f s", record["stage"], record["seconds"], extra=record
+        )
+
+
+class collect:  # pylint:disable=invalid-name
+    """Context manager that gives the list of the records of the outermost spans
+    of the thread, they are not logged"""
+
+    def __init__(self):
+        self.records = []
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = getattr(_local, "collected", None)
+        _local.collected = self.records
+        return self.records
+
+    def __exit__(self, *_):
+        _local.collected = self._previous
+        return False
+
+
+def _observe(record):
+    HISTOGRAMS.observe(record["stage"], record["seconds"], record.get("peak_bytes"))
+    for stage in record.get("stages", ()):
+        _observe(stage)
+
+
+def report(records, nest=True):
+    """Add the records collected in another process to the histograms, and to the
+    enclosing span of the thread (unless ``nest`` is False) or the log"""
+    for record in records:
+        _observe(record)
+        stack = getattr(_local, "stack", None)
+        if nest and stack:
+            stack[-1].stages.append(record)
+        else:
+            _emit(record)
+
+
+def timed(name):
+    """Decorator that runs the function in a span"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""sRGB decoding and encoding for the different precisions of the calibration.
+
+float64 values go through the exact implementation of colour. uint8 images are
+decoded with a table of all 256 values, float32 values are linearly interpolated
+in tables of ``LUT_SIZE`` entries and stay float32, instead of evaluating the
+power function for every pixel in float64.
+
+The interpolation error of the tables is below 1e-4 (in the range 0-1), hence
+8 bit images calibrated with float32 differ from the float64 path by at most one
+level per channel, where the value is close to a rounding boundary.
+"""
+from functools import lru_cache
+
+import colour
+import numpy as np
+
+LUT_SIZE = 4096
+
+
+def _decode_exact(values):
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def _encode_exact(values):
+    return np.where(
+        values <= 0.0031308, values * 12.92, 1.055 * values ** (1 / 2.4) - 0.055
+    )
+
+
+@lru_cache(maxsize=None)
+def _table(function, size, dtype):
+    table = function(np.linspace(0, 1, size)).astype(dtype)
+    table.flags.writeable = False
+    return table
+
+
+def _interpolate(table, values):
+    """Linear interpolation in a table sampled uniformly on 0-1, values outside of
+    0-1 are clipped"""
+    scaled = np.clip(values, 0, 1)
+    scaled *= len(table) - 1
+    index = np.minimum(scaled.astype(np.intp), len(table) - 2)
+    scaled -= index  # fraction between the two entries
+    lower = table[index]
+    return lower + (table[index + 1] - lower) * scaled
+
+
+def decode(image, dtype=np.float64):
+    """Linear RGB of a uint8 (0-255) or float (0-1) sRGB image, as ``dtype``"""
+    dtype = np.dtype(dtype)
+    if image.dtype == np.uint8:
+        return _table(_decode_exact, 256, dtype)[image]
+    if dtype == np.float64:
+        return colour.cctf_decoding(image.astype(dtype, copy=False))
+    return _interpolate(
+        _table(_decode_exact, LUT_SIZE, dtype), image.astype(dtype, copy=False)
+    )
+
+
+def encode(linear):
+    """sRGB (0-1) of linear RGB values, float32 values are looked up and clipped
+    to 0-1, float64 values are encoded exactly"""
+    if linear.dtype == np.float64:
+        return colour.cctf_encoding(linear)
+    return _interpolate(_table(_encode_exact, LUT_SIZE, linear.dtype), linear)
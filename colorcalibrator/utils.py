@@ -1,67 +1,42 @@
 # -*- coding: utf-8 -*-
 """Some utility functions"""
 import json
+from functools import lru_cache
 
 import colour
-import dash_core_components as dcc
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-from colormath.color_conversions import convert_color
-from colormath.color_diff import delta_e_cie2000
-from colormath.color_objects import LabColor, sRGBColor
-from colour_checker_detection import detect_colour_checkers_segmentation
+from plotly.colors import hex_to_rgb, sequential
 from PIL import Image, ImageOps
 from plotly.subplots import make_subplots
 from loguru import logger
 
-import numpy
+from . import transfer, workers
+from .calibration_cache import image_hash, result_key, samples_key
+from .charts import AUTO, get_chart, identify_chart
+from .delta_e import delta_e, srgb_to_lab, transform_delta_e_map
+from .detection import GRID, detect_swatch_samples, detect_swatch_samples_coarse
+from .naming import ColourNamer
+from .profile import CalibrationProfile
+from .timing import span, timed
 
-
-def patch_asscalar(a):
-    return a.item()
-
-
-setattr(numpy, "asscalar", patch_asscalar)
-
-# [filename, image_signature, action_stack]
+# the images live in the server-side image store, see image_store.py, the current
+# image_id and orientation are derived from the uploaded original_id and the
+# action_stack, see pipeline.py, job_id is a pending calibration, see jobs.py
 STORAGE_PLACEHOLDER = json.dumps(
-    {"filename": None, "image_signature": None, "action_stack": [], "image_string": ""}
-)
-
-GRAPH_PLACEHOLDER = dcc.Graph(id="interactive-image", style={"height": "80vh"})
-
-# https://www.datacolor.com/wp-content/uploads/2018/01/SpyderCheckr_Color_Data_V2.pdf
-TARGET_SPYDER24 = (
-    np.array(
-        [
-            [43, 41, 43],  # 6E
-            [80, 80, 78],  # 5E
-            [122, 118, 116],  # 4E
-            [161, 157, 154],  # 3E
-            [202, 198, 195],  # 2E
-            [249, 242, 238],  # 1E
-            [25, 55, 135],  # 6F
-            [57, 146, 64],  # 5F
-            [186, 26, 51],  # 4F
-            [245, 205, 0],  # 3F
-            [192, 75, 145],  # 2F
-            [0, 127, 159],  # 1F
-            [238, 158, 25],  # 6G
-            [157, 188, 54],  # 5G
-            [83, 58, 106],  # 4G
-            [195, 79, 95],  # 3G
-            [58, 88, 159],  # 2G
-            [222, 118, 32],  # 1G
-            [112, 76, 60],  # 6H
-            [197, 145, 125],  # 5H
-            [87, 120, 155],  # 4H
-            [82, 106, 60],  # 3H
-            [126, 125, 174],  # 2H
-            [98, 187, 166],  # 1H
-        ]
-    )
-    / 255
+    {
+        "filename": None,
+        "image_signature": None,
+        "original_id": None,
+        "action_stack": [],
+        "redo_stack": [],
+        "image_id": None,
+        "image_size": None,
+        "orientation": [0, False],
+        "delta_e_map_id": None,
+        "job_id": None,
+    }
 )
 
 XKCD_RGB_DICT = {
@@ -1019,28 +994,23 @@ XKCD_RGB_DICT = {
 
 def get_delta_e(rgba, rgbb, upscaled=False):
     """Get color difference according to CIE2000, if upscaled the range is 0-255, else between 0 and 1"""
-    color1_rgb = sRGBColor(rgba[0], rgba[1], rgba[2], is_upscaled=upscaled)
-    color2_rgb = sRGBColor(rgbb[0], rgbb[1], rgbb[2], is_upscaled=upscaled)
-
-    # Convert from RGB to Lab Color Space
-    color1_lab = convert_color(color1_rgb, LabColor)
+    return float(delta_e(np.asarray(rgba)[:3], np.asarray(rgbb)[:3], upscaled=upscaled))
 
-    # Convert from RGB to Lab Color Space
-    color2_lab = convert_color(color2_rgb, LabColor)
 
-    # Find the color difference
-    delta_e = delta_e_cie2000(color1_lab, color2_lab)
-
-    return delta_e
+@lru_cache(maxsize=None)
+def xkcd_namer():
+    """Colour namer for the xkcd survey, the palette is converted to Lab only once"""
+    return ColourNamer(XKCD_RGB_DICT)
 
 
 def closest_name(requested_colour):
     """Return the perceptually closest color name from the xkcd survey given and RGB tuple in the range 0-255"""
-    min_colours = {}
-    for name, rgb in XKCD_RGB_DICT.items():
-        distance = get_delta_e(rgb, requested_colour, upscaled=True)
-        min_colours[distance] = name
-    return min_colours[min(min_colours.keys())]
+    return xkcd_namer().closest(requested_colour)[0]
+
+
+def closest_names(requested_colours):
+    """Names from the xkcd survey for an (N, 3) array of RGB colours in the range 0-255"""
+    return xkcd_namer().closest(requested_colours)
 
 
 def pil_to_array(pil):
@@ -1051,116 +1021,284 @@ def array_to_pil(array):
     return Image.fromarray(array)
 
 
+def _parity_dataframe(measured, chart):
+    """Measured and target colour (and their CIEDE2000 difference) for every
+    swatch, labelled with the swatch index"""
+    reference = chart.srgb
+    return pd.DataFrame(
+        {
+            "label": np.arange(len(reference)),
+            "r_source": measured[:, 0],
+            "g_source": measured[:, 1],
+            "b_source": measured[:, 2],
+            "r_target": reference[:, 0],
+            "g_target": reference[:, 1],
+            "b_target": reference[:, 2],
+            "delta_e": delta_e(chart.lab, srgb_to_lab(measured), space="Lab"),
+        }
+    )
+
+
+def resolve_chart(card, samples=None):
+    """The reference chart of the card, "auto" identifies it from the detected
+    swatch samples (None without samples)"""
+    if card != AUTO:
+        return get_chart(card)
+    if samples is None:
+        return None
+    with span("identify_chart"):
+        return identify_chart(samples.means(), GRID)
+
+
+def _to_uint8(image):
+    return (np.clip(image, 0, 1) * 255).astype(np.uint8)
+
+
+def _bands(height, tile_rows):
+    for start in range(0, height, tile_rows):
+        yield slice(start, min(start + tile_rows, height))
+
+
+def _linearize(image, tile_rows=None, dtype=np.float64):
+    """Linear RGB of the image, if ``tile_rows`` is given it is decoded in bands of
+    rows such that only the result is allocated in full size"""
+    if tile_rows is None:
+        return transfer.decode(image, dtype)
+    linear = np.empty(image.shape[:2] + (3,), dtype=dtype)
+    for band in _bands(image.shape[0], tile_rows):
+        linear[band] = transfer.decode(image[band, :, :3], dtype)
+    return linear
+
+
+def _apply_tiled(image, profile, tile_rows, dtype=np.float64):
+    """Calibrate the image with the profile in bands of rows, returns uint8.
+
+    Only one band is converted to float at a time, the peak memory on top of the
+    input and the output is some copies of one band."""
+    out = np.empty(image.shape[:2] + (3,), dtype=np.uint8)
+    for band in _bands(image.shape[0], tile_rows):
+        out[band] = _to_uint8(profile.apply(image[band, :, :3], dtype))
+    return out
+
+
+def _detect(image, linear_image, detection_width, dtype):
+    """Swatch samples, from the linear image or coarse to fine"""
+    if detection_width is None:
+        return detect_swatch_samples(linear_image)
+    return detect_swatch_samples_coarse(image, detection_width, dtype=dtype)
+
+
+def fit_profile_from_samples(
+    samples, chart, excluded=None, algorithm="finlayson", only_white_point=True
+):
+    """Fit a :class:`~colorcalibrator.profile.CalibrationProfile` on the detected
+    swatch samples, with the defaults of :func:`calibrate_image`"""
+    return CalibrationProfile.fit(
+        samples.means(),
+        chart,
+        excluded=excluded,
+        algorithm=algorithm,
+        only_white_point=only_white_point,
+    )
+
+
+@timed("calibrate_image")
 def calibrate_image(
-    image, card, excluded=None, algorithm="finlayson", only_white_point=True
-):  # pylint:disable=too-many-locals, too-many-arguments
-    """Use colour to automatically calibrate the image"""
-    if card == "spyder24":
-        reference = TARGET_SPYDER24
-    else:
-        raise NotImplementedError
+    image,
+    card,
+    excluded=None,
+    algorithm="finlayson",
+    only_white_point=True,
+    delta_e_map=False,
+    return_profile=False,
+    tile_rows=None,
+    dtype=np.float64,
+    cache=None,
+    detection_width=None,
+):  # pylint:disable=too-many-locals, too-many-arguments, too-many-branches, too-many-statements
+    """Use colour to automatically calibrate the image.
 
-    linear_image = colour.cctf_decoding(image)  # decode to linear RGB
+    The colour checker is detected only once, on the linear image. The swatch
+    pixels then undergo the same white balance, colour correction and encoding
+    as the image, which gives the swatch colours at every stage without running
+    the segmentation again.
 
-    try:
-        swatches = detect_colour_checkers_segmentation(linear_image)[0][
-            ::-1
-        ]  # black first
-
-        # neutralization (white balance) based on # 3E
-        im = linear_image / swatches[3]  # pylint:disable=invalid-name
-        im *= colour.cctf_decoding(reference[3])  # pylint:disable=invalid-name
-
-        del linear_image
-        del swatches
-
-        if not only_white_point:
-            swatches_wb = detect_colour_checkers_segmentation(im)[
-                0
-            ]  # [::-1]  # black first
-            if algorithm == "finlayson":
-                algorithm_ = "Finlayson 2015"
-            elif algorithm == "cheung":
-                algorithm_ = "Cheung 2004"
-            elif algorithm == "vandermonde":
-                algorithm_ = "Vandermonde"
-            else:
-                # log this case
-                algorithm_ = "Finlayson 2015"
-
-            if isinstance(excluded, list):
-                swatches_wb = np.delete(swatches_wb, excluded, axis=0)
-                reference = np.delete(reference, excluded, axis=0)
-
-            im_cal_linear = colour.colour_correction(
-                im, swatches_wb, colour.cctf_decoding(reference), method=algorithm_
+    The image can be uint8 or float in the range 0-1. Everything is computed in
+    the float ``dtype``, with np.float32 the sRGB decoding and encoding use
+    lookup tables (see :mod:`colorcalibrator.transfer`), which halves memory and
+    time. If ``tile_rows`` is given, the image is linearized, corrected and
+    encoded in bands of that many rows, only the linear image for the detection
+    and the uint8 result are allocated in full size.
+
+    With ``detection_width``, the card is located on a copy with that many
+    pixels on the longer side and the swatches are sampled at full resolution
+    (see :func:`~colorcalibrator.detection.detect_swatch_samples_coarse`), then
+    no full-size linear image is needed with ``tile_rows``.
+
+    If ``delta_e_map`` is True, a downsampled map of the CIEDE2000 difference
+    between the original and the calibrated image is returned as additional
+    element. If ``return_profile`` is True, the fitted
+    :class:`~colorcalibrator.profile.CalibrationProfile` is returned as last
+    element, it can be used for other images with :func:`apply_profile`.
+
+    The ``card`` is the name of a chart (see :mod:`colorcalibrator.charts`), with
+    "auto" the chart is identified from the detected swatches. The fitted profile
+    has the name of the chart that was used.
+
+    With a :class:`~colorcalibrator.calibration_cache.CalibrationCache`, the
+    detected swatches and the results are cached by the content of the image and
+    the parameters.
+    """
+    chart = resolve_chart(card)  # unknown cards fail before the detection
+
+    if cache is not None:
+        with span("cache_lookup"):
+            image_key = image_hash(image)
+            key = result_key(
+                image_key,
+                card=card,
+                excluded=excluded,
+                algorithm=algorithm,
+                only_white_point=only_white_point,
+                delta_e_map=delta_e_map,
+                dtype=dtype,
+                detection_width=detection_width,
             )
+            result = cache.get(key)
+        if result is not None:
+            return result if return_profile else result[:-1]
 
-            im_cal_non_linear = colour.cctf_encoding(im_cal_linear)
-            del im_cal_linear
-            im_pil = Image.fromarray(
-                (np.clip(im_cal_non_linear, 0, 1) * 255).astype(np.uint8)
+    try:
+        samples = None
+        if cache is not None:
+            samples = cache.get(samples_key(image_key, dtype, detection_width))
+        if tile_rows is None or (samples is None and detection_width is None):
+            with span("cctf_decode"):
+                linear_image = _linearize(image, tile_rows, dtype)
+        if samples is None:
+            with span("detect"):
+                samples = _detect(  # black first
+                    image,
+                    linear_image if detection_width is None else None,
+                    detection_width,
+                    dtype,
+                )
+            if cache is not None:
+                cache.put(samples_key(image_key, dtype, detection_width), samples)
+
+        if chart is None:
+            chart = resolve_chart(card, samples)
+        with span("fit"):
+            profile = fit_profile_from_samples(
+                samples, chart, excluded, algorithm, only_white_point
             )
-        else:
-            im = colour.cctf_encoding(im)
-            im_cal_non_linear = im
-            im_pil = Image.fromarray((np.clip(im, 0, 1) * 255).astype(np.uint8))
-
-        try:
-            swatches_calibrated = detect_colour_checkers_segmentation(
-                im_cal_non_linear
-            )[0][::-1]
+
+        if tile_rows is None:
+            with span("colour_correction"):
+                im = profile.apply_linear(linear_image)  # pylint:disable=invalid-name
+            del linear_image
+            with span("cctf_encode"):
+                im_cal_non_linear = transfer.encode(im)
+                del im
+                im_pil = Image.fromarray(_to_uint8(im_cal_non_linear))
             del im_cal_non_linear
-            label = np.arange(0, len(swatches_wb))
-            target_matrix = np.zeros((len(label), 4))
-            measured_matrix = np.zeros((len(label), 4))
-            del swatches_wb
-
-            target_matrix[:, 0] = label
-            measured_matrix[:, 0] = label
-
-            measured_matrix[:, 1:] = swatches_calibrated
-            target_matrix[:, 1:] = reference
-
-            df_sm = pd.DataFrame(measured_matrix, columns=["label", "r", "g", "b"])
-            df_tm = pd.DataFrame(target_matrix, columns=["label", "r", "g", "b"])
-
-            merged_df = pd.merge(
-                df_sm,
-                df_tm,
-                left_on="label",
-                right_on="label",
-                suffixes=("_source", "_target"),
-            )
-            merged_df["label"] = merged_df["label"]
-        except Exception as e:
-            merged_df = pd.DataFrame(
-                [[np.nan] * 7],
-                columns=[
-                    "label",
-                    "r_source",
-                    "g_source",
-                    "b_source",
-                    "r_target",
-                    "g_target",
-                    "b_target",
-                ],
-            )
+        else:
+            linear_image = None
+            # decode, correction and encode alternate band by band
+            with span("colour_correction_tiled"):
+                im_pil = Image.fromarray(
+                    _apply_tiled(image, profile, tile_rows, dtype)
+                )
+
+        with span("parity"):
+            samples = samples.transformed(profile.apply_linear)
+            swatches_calibrated = samples.transformed(colour.cctf_encoding).means()
+            merged_df = _parity_dataframe(swatches_calibrated, chart)
 
-        return im_pil, merged_df
+        result = [im_pil, merged_df]
+        if delta_e_map:
+            with span("delta_e_map"):
+                result.append(transform_delta_e_map(image, profile.apply))
+        result.append(profile)
+    except Exception as e:  # pylint:disable=invalid-name
+        raise ValueError(e)
+
+    if cache is not None:
+        cache.put(key, tuple(result))
+    return tuple(result) if return_profile else tuple(result[:-1])
+
+
+def fit_profile(  # pylint:disable=too-many-arguments
+    image,
+    card,
+    excluded=None,
+    algorithm="finlayson",
+    only_white_point=True,
+    tile_rows=None,
+    dtype=np.float64,
+    detection_width=None,
+):
+    """Fit a calibration profile on an image with the colour checker, without
+    calibrating the image itself"""
+    chart = resolve_chart(card)
+    try:
+        samples = _detect(
+            image,
+            None
+            if detection_width is not None
+            else _linearize(image, tile_rows, dtype),
+            detection_width,
+            dtype,
+        )
+        return fit_profile_from_samples(
+            samples,
+            chart if chart is not None else resolve_chart(card, samples),
+            excluded,
+            algorithm,
+            only_white_point,
+        )
     except Exception as e:  # pylint:disable=invalid-name
         raise ValueError(e)
 
 
+def apply_profile(image, profile, tile_rows=None, dtype=np.float64):
+    """Calibrate the image (uint8 or range 0-1) with a profile fitted on another
+    image of the same setup, the card does not need to be in the image. With
+    ``tile_rows`` the image is processed in bands of rows."""
+    if tile_rows is None:
+        return Image.fromarray(_to_uint8(profile.apply(image, dtype)))
+    return Image.fromarray(_apply_tiled(image, profile, tile_rows, dtype))
+
+
+def heatmap_to_pil(values, vmax=None, colorscale=sequential.Viridis):
+    """Render a 2D array as RGB image with the given (plotly) colorscale, the
+    values are scaled from 0 to ``vmax`` (default: the maximum)"""
+    if vmax is None:
+        vmax = np.nanmax(values)
+    scaled = np.nan_to_num(np.clip(values / max(vmax, 1e-12), 0, 1))
+    colours = np.array([hex_to_rgb(c) for c in colorscale], dtype=np.float64)
+    positions = np.linspace(0, 1, len(colours))
+    rgb = np.stack(
+        [np.interp(scaled, positions, colours[:, i]) for i in range(3)], axis=-1
+    )
+    return Image.fromarray(rgb.astype(np.uint8))
+
+
 def plot_parity(merged_df):
     """Make a partiy plot indicating the quality of the calibration"""
     fig = make_subplots(rows=1, cols=3)
+    hovertext = merged_df["label"]
+    if "delta_e" in merged_df.columns:
+        hovertext = [
+            "{} (ΔE {:.1f})".format(label, difference)
+            for label, difference in zip(merged_df["label"], merged_df["delta_e"])
+        ]
 
     fig.add_trace(
         go.Scatter(
             x=merged_df["r_source"],
             y=merged_df["r_target"],
-            hovertext=merged_df["label"],
+            hovertext=hovertext,
             mode="markers",
             marker={"color": "red"},
         ),
@@ -1172,7 +1310,7 @@ def plot_parity(merged_df):
         go.Scatter(
             x=merged_df["g_source"],
             y=merged_df["g_target"],
-            hovertext=merged_df["label"],
+            hovertext=hovertext,
             mode="markers",
             marker={"color": "green"},
         ),
@@ -1184,7 +1322,7 @@ def plot_parity(merged_df):
         go.Scatter(
             x=merged_df["b_source"],
             y=merged_df["b_target"],
-            hovertext=merged_df["label"],
+            hovertext=hovertext,
             mode="markers",
             marker={"color": "blue"},
         ),
@@ -1198,12 +1336,107 @@ def plot_parity(merged_df):
     return fig
 
 
-def get_average_color(x, y, image):  # pylint:disable=too-many-locals, invalid-name
-    """Returns a 3-tuple containing the RGB value of the average color of the
-    given square bounded area of length = n whose origin (top left corner)
-    is (x, y) in the given image"""
-    logger.debug("Getting average color of %s", image)
-    height = image.size[1]
+def _histogram_quantiles(counts, quantiles):
+    """Quantiles (linear interpolation, as np.percentile) from the counts of the
+    integer values 0, 1, ..."""
+    cumulative = np.cumsum(counts)
+    rank = (cumulative[-1] - 1) * np.asarray(quantiles) / 100
+    lower = np.searchsorted(cumulative, np.floor(rank), side="right")
+    upper = np.searchsorted(cumulative, np.ceil(rank), side="right")
+    return lower + (upper - lower) * (rank - np.floor(rank))
+
+
+def region_statistics(
+    array, box=None, percentiles=(5, 25, 75, 95), histogram_bins=None
+):  # pylint:disable=invalid-name
+    """Colour statistics of the pixels of an (height, width, channels) array.
+
+    ``box`` is (x_0, y_0, x_1, y_1) in pixels, if it is None the full array is
+    used. Returns a dict with the number of pixels, the mean, standard deviation,
+    median and the requested percentiles per channel. If ``histogram_bins`` is
+    given, a histogram (over 0-255) of every channel is added.
+
+    For uint8 images everything is computed from the 256-bin histogram of every
+    channel, which is much faster than sorting the pixels.
+    """
+    if box is not None:
+        x_0, y_0, x_1, y_1 = box
+        array = array[y_0:y_1, x_0:x_1]
+    region = array[..., :3].reshape(-1, 3)
+    if len(region) == 0:
+        raise ValueError("The selected region is empty")
+
+    quantile_levels = [50, *percentiles]
+    if region.dtype == np.uint8:
+        counts = np.stack([np.bincount(region[:, i], minlength=256) for i in range(3)])
+        values = np.arange(256)
+        mean = counts @ values / len(region)
+        std = np.sqrt(
+            (counts * (values - mean[:, np.newaxis]) ** 2).sum(axis=1) / len(region)
+        )
+        quantiles = np.stack(
+            [_histogram_quantiles(channel, quantile_levels) for channel in counts],
+            axis=1,
+        )
+    else:
+        mean = region.mean(axis=0, dtype=np.float64)
+        std = region.std(axis=0, dtype=np.float64)
+        quantiles = np.percentile(region, quantile_levels, axis=0)
+
+    stats = {
+        "n_pixels": len(region),
+        "mean": mean,
+        "std": std,
+        "median": quantiles[0],
+        "percentiles": dict(zip(percentiles, quantiles[1:])),
+    }
+
+    if histogram_bins is not None:
+        stats["histogram"] = np.stack(
+            [
+                np.histogram(region[:, i], bins=histogram_bins, range=(0, 256))[0]
+                for i in range(3)
+            ]
+        )
+
+    return stats
+
+
+def statistics_table(stats):
+    """Summary of :func:`region_statistics` as rows for the DataTable"""
+
+    def row(name, values):
+        return {
+            "statistic": name,
+            "R": round(float(values[0]), 2),
+            "G": round(float(values[1]), 2),
+            "B": round(float(values[2]), 2),
+        }
+
+    rows = [
+        row("mean", stats["mean"]),
+        row("std", stats["std"]),
+        row("median", stats["median"]),
+    ]
+    for percentile, values in stats["percentiles"].items():
+        rows.append(row("p{}".format(percentile), values))
+    rows.append(
+        {
+            "statistic": "pixels",
+            "R": stats["n_pixels"],
+            "G": stats["n_pixels"],
+            "B": stats["n_pixels"],
+        }
+    )
+    return rows
+
+
+def selection_box(x, y, size):  # pylint:disable=invalid-name
+    """Box (x_0, y_0, x_1, y_1) in pixels (origin top left) of the rectangle
+    spanned by the ranges x and y in the plot coordinates (y pointing up),
+    clipped to the image of the given (width, height). A box outside of the
+    image is empty (x_0 == x_1 or y_0 == y_1)."""
+    width, height = size
 
     lower, upper = list(map(int, y))
     left, right = list(map(int, x))
@@ -1212,35 +1445,30 @@ def get_average_color(x, y, image):  # pylint:disable=too-many-locals, invalid-n
     upper = height - upper
     lower = height - lower
 
-    x_0 = min([left, right])
-    x_1 = max([left, right])
-
-    y_0 = min([lower, upper])
-    y_1 = max([lower, upper])
-
-    # ugly because numpy somehow flips the axis
-    reds = []
-    greens = []
-    blues = []
-    data = []
-    for i in range(x_0, x_1):
-        for j in range(y_0, y_1):
-            red, green, blue = image.getpixel((i, j))
-            reds.append(red)
-            greens.append(green)
-            blues.append(blue)
-            data.append({"R": red, "G": green, "B": blue})
+    x_0 = min(max(min([left, right]), 0), width)
+    x_1 = max(min(max([left, right]), width), 0)
+
+    y_0 = min(max(min([lower, upper]), 0), height)
+    y_1 = max(min(max([lower, upper]), height), 0)
+
+    return x_0, y_0, x_1, y_1
+
+
+def get_average_color(x, y, image):  # pylint:disable=invalid-name
+    """Returns a 6-tuple containing the RGB value of the average color and its
+    standard deviation in the rectangle spanned by the ranges x and y (in the
+    plot coordinates, i.e. with y pointing up) in the given image, and a summary
+    table of the colour statistics of the region"""
+    logger.debug("Getting average color of %s", image)
+    x_0, y_0, x_1, y_1 = selection_box(x, y, image.size)
+
+    # only the selected region is converted to an array
+    region = np.asarray(image.crop((x_0, y_0, x_1, y_1)).convert("RGB"))
+    stats = workers.region_statistics(region)
 
     return (
-        (
-            np.mean(reds),
-            np.mean(greens),
-            np.mean(blues),
-            np.std(reds),
-            np.std(greens),
-            np.std(blues),
-        ),
-        data,
+        (*stats["mean"], *stats["std"]),
+        statistics_table(stats),
     )
 
 
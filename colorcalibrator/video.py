@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""Calibration of videos and image sequences, used by ``python -m colorcalibrator
+video``.
+
+The frames are decoded (videos with OpenCV, image sequences with PIL, in a thread
+that reads at most two frames ahead), calibrated, measured and written one at a
+time, the memory does not grow with the number of frames.
+
+The card is located on the first frame and on keyframes, every
+``keyframe_interval`` frames, see
+:func:`~colorcalibrator.detection.detect_swatch_locations`. In between, the
+centres of the swatches are tracked with pyramidal Lucas-Kanade optical flow, a
+frame on which a swatch is lost is a keyframe as well. On every frame, the
+swatches at the tracked positions are sampled and corrected with the current
+profile. The profile is only fitted again, on these samples, if the mean
+CIEDE2000 difference of the corrected swatches to the chart grew by more than
+``refit_delta_e`` since the last fit.
+
+The calibrated frames are written as video, the mean colour (and its standard
+deviation) of a fixed region of interest, measured with
+:func:`~colorcalibrator.utils.region_statistics` (in the process, without the
+pool), and the state of the calibration of every frame as CSV time series.
+"""
+import csv
+import os
+import queue
+import threading
+
+import cv2
+import numpy as np
+from loguru import logger
+from PIL import Image
+
+from . import transfer
+from .batch import collect_images
+from .delta_e import delta_e, srgb_to_lab
+from .detection import WORKING_WIDTH, detect_swatch_locations
+from .utils import (
+    apply_profile,
+    fit_profile_from_samples,
+    region_statistics,
+    resolve_chart,
+)
+
+VIDEO_EXTENSIONS = (".mp4", ".m4v", ".mov", ".avi", ".mkv", ".webm")
+DEFAULT_FPS = 10.0  # of image sequences
+# window and pyramid levels of the optical flow
+TRACKING_WINDOW = (21, 21)
+TRACKING_LEVELS = 3
+
+SERIES_COLUMNS = [
+    "frame",
+    "time_s",
+    "card",
+    "keyframe",
+    "detected",
+    "refit",
+    "delta_e",
+]
+ROI_COLUMNS = ["r", "g", "b", "r_std", "g_std", "b_std"]
+
+
+def is_video(source):
+    return os.path.isfile(source) and source.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def frame_rate(source):
+    """Frames per second of a video, None if it is not known"""
+    if not is_video(source):
+        return None
+    capture = cv2.VideoCapture(source)
+    try:
+        return capture.get(cv2.CAP_PROP_FPS) or None
+    finally:
+        capture.release()
+
+
+def iter_frames(source):
+    """uint8 RGB frames of a video, or of the images of a directory or glob
+    pattern (sorted by name), one at a time"""
+    if is_video(source):
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise ValueError("Could not open the video {}".format(source))
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        finally:
+            capture.release()
+    else:
+        paths = collect_images([source])
+        if not paths:
+            raise ValueError("No video or images found in {}".format(source))
+        for path in paths:
+            yield np.asarray(Image.open(path).convert("RGB"))
+
+
+class _Failure:  # pylint:disable=too-few-public-methods
+    def __init__(self, error):
+        self.error = error
+
+
+def _prefetch(iterable, size=2):
+    """Iterate in a thread that is at most ``size`` items ahead, the decoding
+    releases the GIL"""
+    items = queue.Queue(size)
+    stop = threading.Event()
+    end = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        items.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as e:  # pylint:disable=broad-except, invalid-name
+            items.put(_Failure(e))
+            return
+        items.put(end)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is end:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+def _gray(frame):
+    return cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+
+
+class CardTracker:
+    """Swatch locations of the card, tracked from frame to frame"""
+
+    def __init__(self, locations, frame):
+        self.locations = locations
+        self._gray = _gray(frame)
+
+    def track(self, frame):
+        """Move the locations to ``frame``, returns False (and keeps them) if a
+        swatch is lost"""
+        gray = _gray(frame)
+        points = self.locations.centres.astype(np.float32).reshape(-1, 1, 2)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(
+            self._gray,
+            gray,
+            points,
+            None,
+            winSize=TRACKING_WINDOW,
+            maxLevel=TRACKING_LEVELS,
+        )
+        self._gray = gray
+        if moved is None or not status.all():
+            return False
+        self.locations = self.locations.moved(moved.reshape(-1, 2))
+        return True
+
+
+def swatch_delta_e(profile, samples, chart, excluded=None):
+    """Mean CIEDE2000 difference of the swatches corrected with the profile to
+    the references of the chart, without the excluded swatches"""
+    measured = (
+        samples.transformed(profile.apply_linear).transformed(transfer.encode).means()
+    )
+    return float(
+        np.mean(
+            delta_e(
+                chart.subset(excluded, "lab"),
+                srgb_to_lab(measured[chart.mask(excluded)]),
+                space="Lab",
+            )
+        )
+    )
+
+
+def _roi_colour(roi, frame):
+    """Mean and standard deviation of the box (x_0, y_0, x_1, y_1 in pixels,
+    origin top left, clipped to the frame) of the uint8 RGB frame, computed in
+    this process, the command line does not start a pool"""
+    height, width = frame.shape[:2]
+    x_0, x_1 = sorted(min(max(int(x), 0), width) for x in roi[::2])
+    y_0, y_1 = sorted(min(max(int(y), 0), height) for y in roi[1::2])
+    stats = region_statistics(frame, (x_0, y_0, x_1, y_1))
+    colour = (*stats["mean"], *stats["std"])
+    return dict(zip(ROI_COLUMNS, (float(value) for value in colour)))
+
+
+def calibrate_video(  # pylint:disable=too-many-arguments, too-many-locals, too-many-branches, too-many-statements
+    source,
+    output,
+    roi=None,
+    card="spyder24",
+    excluded=None,
+    algorithm="finlayson",
+    only_white_point=False,
+    refit_delta_e=1.0,
+    keyframe_interval=30,
+    fps=None,
+    dtype="float32",
+    detection_width=WORKING_WIDTH,
+    tile_rows=None,
+    codec="mp4v",
+    series=None,
+):
+    """Calibrate the frames of the video or image sequence ``source``, write them
+    to the video ``output`` and the time series to ``series`` (by default the
+    output with .csv). Returns a summary of the run.
+
+    ``fps`` is the frame rate of image sequences (default 10), or overrides that
+    of the video. ``roi`` is a box (x_0, y_0, x_1, y_1) in pixels (origin top
+    left) whose colour is measured in every calibrated frame. With the ``card``
+    "auto", the chart is identified on the first frame. Raises a ValueError if
+    no card is found in the first frame or ``keyframe_interval`` is not positive.
+    """
+    if keyframe_interval < 1:
+        raise ValueError(
+            "The keyframe interval has to be at least 1, not {}".format(
+                keyframe_interval
+            )
+        )
+    series = series or os.path.splitext(output)[0] + ".csv"
+    rate = fps or frame_rate(source) or DEFAULT_FPS
+    chart = resolve_chart(card)
+    columns = SERIES_COLUMNS + (ROI_COLUMNS if roi is not None else [])
+
+    summary = {"frames": 0, "keyframes": 0, "detections": 0, "refits": 0}
+    writer = size = tracker = profile = None
+    baseline = 0.0
+    try:
+        with open(series, "w", newline="") as handle:
+            table = csv.DictWriter(handle, fieldnames=columns)
+            table.writeheader()
+            for index, frame in enumerate(_prefetch(iter_frames(source))):
+                tracked = tracker is not None and tracker.track(frame)
+                keyframe = not tracked or index % keyframe_interval == 0
+                detected = False
+                if keyframe:
+                    try:
+                        samples, locations = detect_swatch_locations(
+                            frame, detection_width, dtype=dtype
+                        )
+                        tracker = CardTracker(locations, frame)
+                        detected = True
+                    except (IndexError, ValueError, cv2.error):
+                        if tracker is None:
+                            raise ValueError(
+                                "No card found in the first frame of {}".format(source)
+                            )
+                        logger.warning(
+                            "No card found in frame {}, using the tracked "
+                            "swatches".format(index)
+                        )
+                if not detected:
+                    samples = tracker.locations.sample(frame, dtype)
+                if chart is None:
+                    chart = resolve_chart(card, samples)
+
+                refit = profile is None
+                if not refit:
+                    drift = swatch_delta_e(profile, samples, chart, excluded)
+                    refit = drift - baseline > refit_delta_e
+                if refit:
+                    profile = fit_profile_from_samples(
+                        samples,
+                        chart,
+                        excluded,
+                        algorithm=algorithm,
+                        only_white_point=only_white_point,
+                    )
+                    baseline = drift = swatch_delta_e(profile, samples, chart, excluded)
+
+                calibrated = apply_profile(frame, profile, tile_rows, dtype)
+                if writer is None:
+                    size = calibrated.size
+                    writer = cv2.VideoWriter(
+                        output, cv2.VideoWriter_fourcc(*codec), rate, size
+                    )
+                    if not writer.isOpened():
+                        raise ValueError(
+                            "Could not write the video {} with the codec {}".format(
+                                output, codec
+                            )
+                        )
+                elif calibrated.size != size:
+                    raise ValueError(
+                        "Frame {} has the size {}, the first one {}".format(
+                            index, calibrated.size, size
+                        )
+                    )
+                pixels = np.asarray(calibrated)
+                writer.write(cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR))
+
+                row = {
+                    "frame": index,
+                    "time_s": index / rate,
+                    "card": chart.name,
+                    "keyframe": keyframe,
+                    "detected": detected,
+                    "refit": refit,
+                    "delta_e": drift,
+                }
+                if roi is not None:
+                    row.update(_roi_colour(roi, pixels))
+                table.writerow(row)
+
+                summary["frames"] += 1
+                summary["keyframes"] += keyframe
+                summary["detections"] += detected
+                summary["refits"] += refit
+    finally:
+        if writer is not None:
+            writer.release()
+
+    logger.info(
+        "{frames} frames, {detections} detections, {refits} refits".format(**summary)
+    )
+    summary.update({"output": output, "series": series, "fps": rate})
+    return summary
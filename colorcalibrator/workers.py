@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""Pool of processes for the CPU-bound work of the app.
+
+The threads of a gthread gunicorn worker share one GIL, so concurrent
+calibrations, region statistics and PNG encodings of the threads would run one
+after the other. Every gunicorn worker has one pool of processes (also used for
+the background jobs, see jobs.py). ``PROCESS_POOL_CORES`` is the fraction of the
+cores of the host for all pools together, each of the gunicorn workers
+(``WEB_CONCURRENCY``, or the count gunicorn_conf.py passes) gets its share. The
+pool is started and warmed up (imports, lookup tables) when the worker starts,
+see gunicorn_conf.py.
+
+The images are passed through shared memory (``multiprocessing.shared_memory``,
+python >= 3.8) instead of being pickled, the calibrated image is written into a
+block the caller allocated. On older pythons, the arrays are pickled, also the
+calibrated image on the way back.
+
+The functions run in the calling process if the pool is disabled (0 cores), if
+they are called in a process of the pool, or if the image is smaller than
+``PROCESS_POOL_MIN_PIXELS``.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+from PIL import Image
+
+from . import timing
+from .image_codecs import encode
+from .settings import get_config
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python < 3.8
+    shared_memory = None  # pylint:disable=invalid-name
+
+MIN_PIXELS = 1000000
+
+_IN_POOL = False
+
+
+def pool_size(cores=0.5, cpu_count=None, workers=1):
+    """Number of processes of the pool of one of ``workers`` processes that share
+    ``cores`` times the number of cores (at least one if ``cores`` is positive)"""
+    if cores <= 0:
+        return 0
+    total = cores * (cpu_count or os.cpu_count() or 1)
+    return max(int(round(total / max(workers, 1))), 1)
+
+
+def _init_process():
+    global _IN_POOL  # pylint:disable=global-statement
+    _IN_POOL = True
+
+
+def _warm_up():
+    """Import the heavy modules and build the lookup tables"""
+    # pylint:disable=import-outside-toplevel
+    from . import transfer
+    from .utils import closest_name
+
+    transfer.encode(transfer.decode(np.zeros((1, 1, 3), np.uint8), np.float32))
+    closest_name((0, 0, 0))
+    return os.getpid()
+
+
+def _close(memory):
+    try:
+        memory.close()
+    except BufferError:  # views of it are still around, closed when collected
+        pass
+
+
+class SharedArray:
+    """Copy of an array in shared memory (or the array itself without
+    shared_memory), pass ``descriptor`` to the other process and read it there
+    with :func:`attach`. Use as context manager, the block is freed on exit."""
+
+    def __init__(self, array=None, shape=None, dtype=None):
+        if array is not None:
+            shape, dtype = array.shape, array.dtype
+        self.shape, self.dtype = tuple(shape), np.dtype(dtype)
+        if shared_memory is None:
+            self.memory = None
+            self.array = (
+                np.array(array) if array is not None else np.empty(shape, dtype)
+            )
+            return
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=max(int(np.prod(shape)) * self.dtype.itemsize, 1)
+        )
+        self.array = np.ndarray(self.shape, self.dtype, buffer=self.memory.buf)
+        if array is not None:
+            self.array[...] = array
+
+    @property
+    def descriptor(self):
+        if self.memory is None:
+            return self.array
+        return (self.memory.name, self.shape, self.dtype.str)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        if self.memory is not None:
+            del self.array
+            _close(self.memory)
+            self.memory.unlink()
+
+
+class attach:  # pylint:disable=invalid-name, too-few-public-methods
+    """Context manager that gives the array of a :attr:`SharedArray.descriptor`"""
+
+    def __init__(self, descriptor):
+        self.descriptor = descriptor
+        self.memory = None
+
+    def __enter__(self):
+        if isinstance(self.descriptor, np.ndarray):
+            return self.descriptor
+        name, shape, dtype = self.descriptor
+        self.memory = shared_memory.SharedMemory(name=name)
+        return np.ndarray(shape, np.dtype(dtype), buffer=self.memory.buf)
+
+    def __exit__(self, *_):
+        if self.memory is not None:
+            _close(self.memory)
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_process_pool(workers=None):
+    """Return the pool of this process (started and warmed up on the first
+    call), None if it is disabled. ``workers`` is the number of gunicorn workers
+    that share the cores, by default ``WEB_CONCURRENCY``."""
+    global _POOL  # pylint:disable=global-statement
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                config = get_config()
+                size = pool_size(
+                    float(config.get("PROCESS_POOL_CORES", 0.5)),
+                    workers=workers or int(config.get("WEB_CONCURRENCY", 1)),
+                )
+                if size == 0:
+                    return None
+                # no fork of the threaded gunicorn worker
+                _POOL = ProcessPoolExecutor(
+                    size, mp_context=get_context("spawn"), initializer=_init_process
+                )
+                for _ in range(size):
+                    _POOL.submit(_warm_up)
+    return _POOL
+
+
+def _offload(pixels):
+    """The pool if the work on an image with that many pixels should run there,
+    otherwise None"""
+    if _IN_POOL or pixels < int(
+        get_config().get("PROCESS_POOL_MIN_PIXELS", MIN_PIXELS)
+    ):
+        return None
+    return get_process_pool()
+
+
+def _calibrate_image(image, output, use_cache, *args, **kwargs):
+    """Calibrate in the pool, the calibrated pixels are written to the shared
+    ``output`` or, without shared memory (``output`` is None), returned. The
+    timing records are returned as last element."""
+    # pylint:disable=import-outside-toplevel
+    from .calibration_cache import get_calibration_cache
+    from .utils import calibrate_image as _calibrate
+
+    with timing.collect() as records, attach(image) as array:
+        result = _calibrate(
+            array,
+            *args,
+            cache=get_calibration_cache() if use_cache else None,
+            **kwargs
+        )
+    if output is None:
+        return (np.asarray(result[0]), *result[1:], records)
+    with attach(output) as out:
+        out[...] = np.asarray(result[0])
+    return (None, *result[1:], records)
+
+
+def calibrate_image(image, *args, cache=None, **kwargs):
+    """:func:`~colorcalibrator.utils.calibrate_image` in the pool, the processes
+    use their own calibration cache if ``cache`` is given. The timing records of
+    the pool are reported in this process."""
+    pool = _offload(image.shape[0] * image.shape[1])
+    if pool is None:
+        # pylint:disable=import-outside-toplevel
+        from .utils import calibrate_image as _calibrate
+
+        return _calibrate(image, *args, cache=cache, **kwargs)
+
+    def run(shared, output=None):
+        *result, records = pool.submit(
+            _calibrate_image,
+            shared.descriptor,
+            None if output is None else output.descriptor,
+            cache is not None,
+            *args,
+            **kwargs
+        ).result()
+        timing.report(records)
+        return result
+
+    with SharedArray(image) as shared:
+        if shared_memory is None:  # the process has a copy, it returns the pixels
+            pixels, *rest = run(shared)
+            return (Image.fromarray(pixels), *rest)
+        with SharedArray(shape=image.shape[:2] + (3,), dtype=np.uint8) as output:
+            _, *rest = run(shared, output)
+            calibrated = Image.fromarray(output.array.copy())
+    return (calibrated, *rest)
+
+
+def _region_statistics(region):
+    from .utils import region_statistics as _statistics  # pylint:disable=import-outside-toplevel
+
+    with attach(region) as array:
+        return _statistics(array)
+
+
+def region_statistics(region):
+    """:func:`~colorcalibrator.utils.region_statistics` in the pool"""
+    pool = _offload(region.shape[0] * region.shape[1])
+    if pool is None:
+        from .utils import region_statistics as _statistics  # pylint:disable=import-outside-toplevel
+
+        return _statistics(region)
+    with SharedArray(region) as shared:
+        return pool.submit(_region_statistics, shared.descriptor).result()
+
+
+def _encode_image(array, mode, codec):
+    with attach(array) as pixels:
+        return encode(Image.fromarray(pixels, mode), codec)
+
+
+def encode_image(image, codec):
+    """:func:`~colorcalibrator.image_codecs.encode` in the pool (for 8 bit
+    RGB(A) and L images)"""
+    pool = None
+    if image.mode in ("L", "RGB", "RGBA"):
+        pool = _offload(image.size[0] * image.size[1])
+    if pool is None:
+        return encode(image, codec)
+    with SharedArray(np.asarray(image)) as shared:
+        return pool.submit(_encode_image, shared.descriptor, image.mode, codec).result()
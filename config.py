@@ -10,6 +10,53 @@ class Config:
     FLASK_APP = environ.get('FLASK_APP')
     FLASK_ENV = environ.get('FLASK_ENV')
 
+    # Server-side image store, the client only gets the image id
+    IMAGE_STORE_BACKEND = environ.get('IMAGE_STORE_BACKEND', 'file')  # 'file' or 'memory'
+    IMAGE_STORE_PATH = environ.get('IMAGE_STORE_PATH')  # defaults to /dev/shm/colorcalibrator-<uid>/images
+    IMAGE_STORE_MAX_BYTES = int(environ.get('IMAGE_STORE_MAX_BYTES', 2 * 1024**3))
+    IMAGE_STORE_CACHE_BYTES = int(environ.get('IMAGE_STORE_CACHE_BYTES', 128 * 1024**2))
+    # 'speed' (raw), 'balanced' (png-fast), 'size' (lossless webp) or a codec name
+    IMAGE_STORE_CODEC = environ.get('IMAGE_STORE_CODEC', 'balanced')
+
+    # Uploads are streamed to the store in chunks, see /api/upload
+    UPLOAD_MAX_BYTES = int(environ.get('UPLOAD_MAX_BYTES', 100 * 1024**2))
+    UPLOAD_CHUNK_BYTES = int(environ.get('UPLOAD_CHUNK_BYTES', 1024**2))
+
+    # Calibrate images in bands of that many rows to bound the memory (0: at once)
+    CALIBRATION_TILE_ROWS = int(environ.get('CALIBRATION_TILE_ROWS', 512))
+    # 'float32' uses lookup tables for the sRGB curves, within one level of 'float64'
+    CALIBRATION_DTYPE = environ.get('CALIBRATION_DTYPE', 'float32')
+    # Locate the card on a copy with that many pixels on the longer side (at most 1440, the segmentation runs at 1440
+    # pixels anyway), sample it at full resolution (0: on the full image)
+    CALIBRATION_DETECTION_WIDTH = int(environ.get('CALIBRATION_DETECTION_WIDTH', 1440))
+    # Directories with JSON files of custom reference charts, separated by ':' (see colorcalibrator/charts.py)
+    CHART_PATHS = environ.get('CHART_PATHS', '')
+
+    # Longest side of the image that is sent to the browser, finer tiles are loaded on zoom
+    PREVIEW_SIZE = int(environ.get('PREVIEW_SIZE', 1600))
+
+    # Cache of detected swatches and calibration results, 'memory', 'file' or '' (off)
+    CALIBRATION_CACHE_BACKEND = environ.get('CALIBRATION_CACHE_BACKEND', 'memory')
+    CALIBRATION_CACHE_PATH = environ.get('CALIBRATION_CACHE_PATH')  # defaults to /dev/shm/colorcalibrator-<uid>/cache, keep it private
+    CALIBRATION_CACHE_BYTES = int(environ.get('CALIBRATION_CACHE_BYTES', 512 * 1024**2))
+
+    # Processes for calibration, statistics, encoding and the jobs, relative to the cores of the host (0: off).
+    # Every gunicorn worker has its own pool, the WEB_CONCURRENCY workers share these cores: with 8 cores,
+    # 0.5 and 2 workers, each pool has 2 processes. gunicorn_conf.py passes its worker count to the pools.
+    PROCESS_POOL_CORES = float(environ.get('PROCESS_POOL_CORES', 0.5))
+    PROCESS_POOL_MIN_PIXELS = int(environ.get('PROCESS_POOL_MIN_PIXELS', 1000000))  # smaller images stay in the thread
+    WEB_CONCURRENCY = int(environ.get('WEB_CONCURRENCY', 1))  # gunicorn workers, if not started with gunicorn_conf.py
+
+    # Calibrations run as background jobs, queued in SQLite and run in processes
+    JOBS_PATH = environ.get('JOBS_PATH')  # defaults to /dev/shm/colorcalibrator-<uid>/jobs.sqlite, keep it private
+    # Over all workers. The jobs run in the pools above and add no processes, more jobs than processes of
+    # all pools would only wait there, in front of the calibrations of the API.
+    JOBS_CONCURRENCY = int(environ.get('JOBS_CONCURRENCY', 2))
+    JOBS_TIMEOUT = float(environ.get('JOBS_TIMEOUT', 600))  # seconds without progress
+
+    # Peak memory of the stages in the timing logs and /metrics (slows down allocations)
+    TIMING_TRACE_MEMORY = environ.get('TIMING_TRACE_MEMORY', '') not in ('', '0', 'false')
+
     # Flask-Session
     # SESSION_TYPE = 'redis'  # there is some issue with images getting to large for the heroku redis
     # # SESSION_REDIS = redis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379'))
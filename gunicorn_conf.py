@@ -1,9 +1,20 @@
 # -*- coding: utf-8 -*-
 # pylint:disable=invalid-name
 """Settings for gunicorn"""
+import os
 
 #https://pythonspeed.com/articles/gunicorn-in-docker/
 worker_tmp_dir = '/dev/shm'
-workers = 2
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
 threads = 4
 worker_class = 'gthread'
+# JSON logs, including the timing records of colorcalibrator/timing.py
+logconfig = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logging.conf')
+
+
+def post_worker_init(worker):
+    """Start and warm up the process pool of the worker, the workers share the
+    cores, see colorcalibrator/workers.py"""
+    from colorcalibrator.workers import get_process_pool  # pylint:disable=import-outside-toplevel
+
+    get_process_pool(workers=worker.cfg.workers)
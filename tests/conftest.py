@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""Shared fixtures, run the tests from the repository root (``python -m pytest``)"""
+import pytest
+
+from colorcalibrator.benchmark import synthetic_card_image
+
+
+@pytest.fixture(scope="session")
+def card_image():
+    """1 MP uint8 image of a SpyderCheckr 24 with a colour cast"""
+    image = synthetic_card_image(1)
+    image.setflags(write=False)
+    return image
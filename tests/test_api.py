@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from io import BytesIO as _BytesIO
+from urllib.parse import quote
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from colorcalibrator import api, image_store, server, workers
+from colorcalibrator.image_store import FileBackend, ImageStore, MemoryBackend
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Test client with a store of its own, the calibration runs in the thread"""
+    monkeypatch.setattr(image_store, "_STORE", ImageStore(MemoryBackend()))
+    monkeypatch.setattr(api, "get_calibration_cache", lambda: None)
+    monkeypatch.setattr(workers, "_offload", lambda pixels: None)
+    return server.test_client()
+
+
+@pytest.fixture
+def upload_directory(tmp_path, monkeypatch):
+    """A file store, to see what an upload leaves behind, with small chunks"""
+    monkeypatch.setattr(image_store, "_STORE", ImageStore(FileBackend(str(tmp_path))))
+    monkeypatch.setitem(server.config, "UPLOAD_CHUNK_BYTES", 64)
+    return tmp_path
+
+
+def png(array):
+    buffer = _BytesIO()
+    Image.fromarray(array).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def post_image(client, endpoint, data, headers=None, **fields):
+    fields["image"] = (_BytesIO(data), "image.png")
+    return client.post(
+        "/api/" + endpoint,
+        data=fields,
+        content_type="multipart/form-data",
+        headers=headers,
+    )
+
+
+def test_calibrate_summary_header(client, card_image):
+    response = post_image(client, "calibrate", png(card_image), only_white_point="0")
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    header = response.headers["X-Calibration-Stats"]
+    assert set(json.loads(header)) == {"image_id", "card", "mean_delta_e"}
+    assert json.loads(header)["image_id"] == response.headers["X-Image-Id"]
+    assert len(header) < 256
+
+
+def test_calibrate_json(client, card_image):
+    response = post_image(
+        client,
+        "calibrate",
+        png(card_image),
+        headers={"Accept": "application/json"},
+        card="auto",
+        only_white_point="0",
+    )
+    assert response.status_code == 200
+    stats = response.get_json()
+    assert stats["card"] == "spyder24"
+    assert len(stats["swatches"]) == 24
+    assert stats["mean_delta_e"] < 2
+    assert client.get(stats["image_url"]).status_code == 200
+
+
+@pytest.mark.parametrize("pixels", [1500, 10000])
+def test_too_many_pixels(client, monkeypatch, pixels):
+    """Above MAX_IMAGE_PIXELS, and above twice of it, where PIL raises a
+    DecompressionBombError"""
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    image = np.zeros((pixels // 100, 100, 3), dtype=np.uint8)
+    response = post_image(client, "measure", png(image))
+    assert response.status_code == 413
+    assert "error" in response.get_json()
+
+
+def test_errors(client):
+    assert post_image(client, "measure", b"not an image").status_code == 400
+    response = client.post("/api/measure", data={"image_id": "0" * 16})
+    assert response.status_code == 404
+    assert client.post("/api/name", json={"colors": [1, 2]}).status_code == 400
+
+
+def test_measure_by_image_id(client):
+    image = np.zeros((20, 30, 3), dtype=np.uint8)
+    image[:, 10:] = (255, 0, 0)
+    image_id = post_image(client, "measure", png(image)).get_json()["image_id"]
+    response = client.post(
+        "/api/measure", data={"image_id": image_id, "x0": 10, "y0": 0}
+    )
+    stats = response.get_json()
+    assert stats["box"] == [10, 0, 30, 20]
+    assert stats["n_pixels"] == 400
+    assert stats["mean"] == [255, 0, 0]
+
+
+def test_upload(upload_directory):
+    data = png(np.zeros((20, 30, 3), dtype=np.uint8))
+    response = server.test_client().post(
+        "/api/upload",
+        data=data,
+        headers={"X-Filename": quote("Grünkarte 1.png")},
+        content_type="application/octet-stream",
+    )
+    assert response.status_code == 200
+    info = response.get_json()
+    assert info == {
+        "image_id": info["image_id"],
+        "filename": "Grünkarte 1.png",
+        "bytes": len(data),
+        "format": "PNG",
+        "width": 30,
+        "height": 20,
+        "mode": "RGB",
+    }
+    assert os.listdir(str(upload_directory)) == [info["image_id"]]
+    assert image_store.get_image_store().get(info["image_id"]) == data
+
+
+def test_upload_too_large(upload_directory, monkeypatch):
+    monkeypatch.setitem(server.config, "UPLOAD_MAX_BYTES", 1000)
+    data = png(np.random.RandomState(0).randint(0, 256, (40, 40, 3), np.uint8))
+    response = server.test_client().post("/api/upload", data=data)
+    assert response.status_code == 413
+    assert "error" in response.get_json()
+    assert os.listdir(str(upload_directory)) == []
+
+
+def test_upload_not_an_image(upload_directory):
+    response = server.test_client().post("/api/upload", data=b"not an image" * 100)
+    assert response.status_code == 400
+    assert os.listdir(str(upload_directory)) == []
+
+
+def test_header_check():
+    """The image is identified once its header has arrived, the chunks pass
+    through unchanged"""
+    data = png(np.zeros((20, 30, 3), dtype=np.uint8))
+    chunks = [data[i : i + 8] for i in range(0, len(data), 8)]
+    check = api._HeaderCheck(iter(chunks), max_bytes=len(data))
+    assert b"".join(check) == data
+    assert check.info == {"format": "PNG", "width": 30, "height": 20, "mode": "RGB"}
+    assert check.size == len(data) and check.header is None
+
+    check = api._HeaderCheck(iter(chunks), max_bytes=len(data) - 1)
+    with pytest.raises(api.ApiError):
+        list(check)
+
+
+@pytest.mark.parametrize("identified", [True, False])
+@pytest.mark.parametrize("pixels", [1500, 10000])
+def test_upload_too_many_pixels(upload_directory, monkeypatch, pixels, identified):
+    """Also if the image is only identified after the upload, e.g. a TIFF with
+    the directory at the end"""
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    if not identified:
+        monkeypatch.setattr(api._HeaderCheck, "_identify", lambda self: None)
+    image = np.zeros((pixels // 100, 100, 3), dtype=np.uint8)
+    response = server.test_client().post("/api/upload", data=png(image))
+    assert response.status_code == 413
+    assert os.listdir(str(upload_directory)) == []
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from PIL import Image
+
+from colorcalibrator.batch import (
+    CHECKPOINT_FILE,
+    collect_images,
+    output_names,
+    read_checkpoint,
+    run_batch,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def images(tmp_path, card_image):
+    """Two images of the card (with the same file name) and one without"""
+    directory = tmp_path / "images"
+    (directory / "more").mkdir(parents=True)
+    Image.fromarray(card_image).save(str(directory / "card.png"))
+    Image.fromarray(card_image).save(str(directory / "more" / "card.jpg"), quality=95)
+    Image.fromarray(np.full((200, 300, 3), 128, np.uint8)).save(
+        str(directory / "blank.png")
+    )
+    (directory / "notes.txt").write_text("not an image")
+    return directory
+
+
+def test_collect_images(images):
+    paths = collect_images([str(images), str(images / "more" / "*.jpg")])
+    names = [os.path.relpath(path, str(images)) for path in paths]
+    assert names == ["blank.png", "card.png", os.path.join("more", "card.jpg")]
+    assert list(output_names(paths).values()) == ["blank", "card", "card_1"]
+
+
+def test_read_checkpoint_skips_an_interrupted_line(tmp_path):
+    (tmp_path / CHECKPOINT_FILE).write_text(
+        json.dumps({"input": "a.png", "status": "ok"}) + '\n{"input": "b.p'
+    )
+    assert list(read_checkpoint(str(tmp_path))) == ["a.png"]
+    assert read_checkpoint(str(tmp_path / "missing")) == {}
+
+
+def test_resume_and_retry(images, tmp_path):
+    output = str(tmp_path / "calibrated")
+    patterns = [str(images), str(images / "more")]
+    options = dict(workers=2, only_white_point=False, card="auto")
+
+    records = run_batch(patterns, output, **options)
+    status = {os.path.basename(r["input"]): r["status"] for r in records}
+    assert status == {"blank.png": "failed", "card.png": "ok", "card.jpg": "ok"}
+    assert {r.get("card") for r in records if r["status"] == "ok"} == {"spyder24"}
+    swatches = pd.read_csv(os.path.join(output, "swatches.csv"))
+    assert len(swatches) == 48 and set(swatches["file"]) == {"card.png", "card.jpg"}
+    assert os.path.isfile(os.path.join(output, "card_1.png"))
+
+    # resumed, nothing left to do, the reports of the first run are kept
+    assert run_batch(patterns, output, **options) == []
+    assert len(pd.read_csv(os.path.join(output, "swatches.csv"))) == 48
+
+    # only the failed image is retried
+    Image.open(str(images / "card.png")).save(str(images / "blank.png"))
+    records = run_batch(patterns, output, retry_failed=True, **options)
+    assert [(os.path.basename(r["input"]), r["status"]) for r in records] == [
+        ("blank.png", "ok")
+    ]
+    assert len(pd.read_csv(os.path.join(output, "swatches.csv"))) == 72
+    assert len(read_checkpoint(output)) == 3
+
+
+def test_command_line_without_web_app(tmp_path):
+    """The modules of the command line load the settings of config.py from any
+    directory and do not import Dash or Flask"""
+    script = (
+        "import sys\n"
+        "import colorcalibrator.__main__, colorcalibrator.batch\n"
+        "import colorcalibrator.video\n"
+        "from colorcalibrator.settings import get_config\n"
+        "assert get_config()['CALIBRATION_TILE_ROWS'] == 512\n"
+        "web = [m for m in sys.modules if m.split('.')[0] in ('dash', 'flask')]\n"
+        "assert not web, web\n"
+    )
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop("CALIBRATION_TILE_ROWS", None)
+    subprocess.run(
+        [sys.executable, "-c", script], cwd=str(tmp_path), env=env, check=True
+    )
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import copy
+import json
+
+import pytest
+
+from colorcalibrator import benchmark
+
+
+@pytest.fixture(scope="module")
+def results():
+    return benchmark.run(
+        sizes=(0.3,),
+        repeat=1,
+        callback=False,
+        only=["closest_name", "detection", "get_average_color", "pil_to_b64"],
+    )
+
+
+def test_run(results):
+    assert {result["name"] for result in results} == {
+        "closest_name",
+        "detection",
+        "get_average_color",
+        "pil_to_b64",
+        "b64_to_pil",
+    }
+    for result in results:
+        assert {"name", "params", "best_s", "mean_s", "repeat"} <= set(result)
+        assert result["repeat"] == 1 and result["best_s"] == result["mean_s"] > 0
+    detections = [result for result in results if result["name"] == "detection"]
+    assert [result["params"]["detection_width"] for result in detections] == [
+        "full",
+        720,
+        1440,
+    ]
+    # the synthetic card is calibrated well in every mode
+    assert all(result["mean_delta_e"] < 5 for result in detections)
+
+
+def test_report_and_compare(results):
+    new = json.loads(json.dumps(benchmark.report(results)))
+    assert {"commit", "date", "python", "numpy", "colour", "pillow"} <= set(new)
+    assert new["results"] == results
+
+    old = copy.deepcopy(new)
+    for result in old["results"]:
+        result["best_s"] *= 2
+    old["results"].pop()  # not in the old run
+    comparison = benchmark.compare(old, new)
+    assert len(comparison) == len(results) - 1
+    for entry in comparison:
+        assert entry["ratio"] == pytest.approx(0.5)
+        assert entry["old_s"] == pytest.approx(2 * entry["new_s"])
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from colorcalibrator import utils
+from colorcalibrator.calibration_cache import (
+    CalibrationCache,
+    image_hash,
+    result_key,
+    samples_key,
+)
+from colorcalibrator.image_store import FileBackend, MemoryBackend
+
+
+def test_keys():
+    image = np.zeros((4, 6, 3), dtype=np.uint8)
+    assert image_hash(image) == image_hash(image.copy())
+    assert image_hash(image) != image_hash(image.reshape(6, 4, 3))
+    assert image_hash(image) != image_hash(image.astype(np.float32))
+    assert result_key("h", excluded=[3, 1], dtype="float32") == result_key(
+        "h", excluded=[1, 3], dtype=np.float32
+    )
+    assert result_key("h", algorithm="cheung") != result_key("h", algorithm="finlayson")
+    assert samples_key("h", np.float64) != samples_key("h", np.float64, 720)
+
+
+def test_file_backend_is_shared(tmp_path):
+    """The file backend is shared between the gunicorn workers"""
+    CalibrationCache(FileBackend(str(tmp_path))).put("key", {"a": np.arange(3)})
+    cache = CalibrationCache(FileBackend(str(tmp_path)))
+    np.testing.assert_array_equal(cache.get("key")["a"], np.arange(3))
+    assert cache.get("other") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_calibrate_image_reuses_the_detection(card_image, monkeypatch):
+    cache = CalibrationCache(MemoryBackend())
+    expected, expected_df = utils.calibrate_image(
+        card_image, "spyder24", only_white_point=False
+    )
+    calibrated, merged_df = utils.calibrate_image(
+        card_image, "spyder24", only_white_point=False, cache=cache
+    )
+    assert cache.stats()["hits"] == 0
+    np.testing.assert_array_equal(np.asarray(calibrated), np.asarray(expected))
+
+    # the same parameters are a hit on the result, other ones on the samples only
+    def no_detection(*args):
+        pytest.fail("the swatches are detected again")
+
+    monkeypatch.setattr(utils, "_detect", no_detection)
+    cached, cached_df = utils.calibrate_image(
+        card_image, "spyder24", only_white_point=False, cache=cache
+    )
+    np.testing.assert_array_equal(np.asarray(cached), np.asarray(expected))
+    assert cached_df.equals(merged_df)
+    _, white_point_df = utils.calibrate_image(
+        card_image, "spyder24", only_white_point=True, cache=cache
+    )
+    assert cache.stats()["hits"] == 2
+    assert not white_point_df.equals(merged_df)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import numpy as np
+import pytest
+
+from colorcalibrator import charts, transfer
+from colorcalibrator.detection import detect_swatch_samples
+
+
+@pytest.fixture
+def chart_path(tmp_path, monkeypatch):
+    """A directory of CHART_PATHS, the index of the charts is read again"""
+    monkeypatch.setattr(charts, "get_config", lambda: {"CHART_PATHS": str(tmp_path)})
+    charts._index.cache_clear()
+    charts._load.cache_clear()
+    yield tmp_path
+    charts._index.cache_clear()
+    charts._load.cache_clear()
+
+
+def grey_chart(name="grey"):
+    return charts.ReferenceChart(name, "Grey", np.full((6, 3), 0.5), 3, 2, 0)
+
+
+def test_get_chart():
+    names = charts.chart_names()
+    for name in ("colorchecker_classic", "colorchecker_passport", "spyder24"):
+        assert name in names
+    chart = charts.get_chart("spyder24")
+    assert chart is charts.get_chart("spyder24")
+    assert len(chart) == 24 and chart.grid == (6, 4)
+    assert chart.swatch_names[0] == "6E"
+    np.testing.assert_allclose(chart.srgb[0], np.array([43, 41, 43]) / 255)
+    assert chart.lab[0, 0] < chart.lab[5, 0]  # black first
+    with pytest.raises(NotImplementedError):
+        charts.get_chart("unknown")
+
+
+def test_alias():
+    passport = charts.get_chart("colorchecker_passport")
+    classic = charts.get_chart("colorchecker_classic")
+    assert passport.alias_of == "colorchecker_classic"
+    assert passport.label != classic.label
+    np.testing.assert_array_equal(passport.lab, classic.lab)
+
+
+def test_references_are_read_only():
+    chart = charts.get_chart("spyder24")
+    for form in charts.ReferenceChart.FORMS:
+        with pytest.raises(ValueError):
+            getattr(chart, form)[0, 0] = 0
+
+
+def test_grid_must_match_the_swatches():
+    with pytest.raises(ValueError):
+        charts.ReferenceChart("grey", "Grey", np.full((5, 3), 0.5), 3, 2, 0)
+
+
+def test_register_chart(monkeypatch):
+    monkeypatch.setattr(charts, "_REGISTERED", {})
+    chart = grey_chart()
+    charts.register_chart(chart)
+    assert charts.get_chart("grey") is chart
+    assert {"label": "Grey", "value": "grey"} in charts.chart_options()
+
+
+def test_chart_paths(chart_path):
+    with open(os.path.join(charts.DATA_PATH, "spyder24.json")) as handle:
+        spyder = json.load(handle)
+    spyder["label"] = "Own"
+    (chart_path / "own.json").write_text(json.dumps(spyder))
+    (chart_path / "own_alias.json").write_text(json.dumps({"alias_of": "own"}))
+    assert charts.get_chart("own").label == "Own"
+    assert charts.get_chart("own_alias").alias_of == "own"
+    assert "spyder24" in charts.chart_names()
+
+
+def test_identify_chart(card_image):
+    swatches = detect_swatch_samples(transfer.decode(card_image)).means()
+    assert charts.identify_chart(swatches, (6, 4)).name == "spyder24"
+    with pytest.raises(NotImplementedError):
+        charts.identify_chart(swatches, (5, 5))
+
+
+def test_subsets_are_memoized():
+    chart = grey_chart("subsets")
+    mask = chart.mask([4, 1, 1])
+    assert mask is chart.mask([1, 4]) and not mask.flags.writeable
+    np.testing.assert_array_equal(mask, [True, False, True, True, False, True])
+    assert chart.mask() is chart.mask([])
+    assert not chart.mask([-1])[5]
+
+    subset = chart.subset([1, 4], "lab")
+    assert subset is chart.subset([4, 1], "lab") and not subset.flags.writeable
+    np.testing.assert_array_equal(subset, chart.lab[mask])
+    assert chart.subset(None, "xyz") is chart.xyz
+    assert chart.subset([1]) is not chart.subset([1], "srgb")
+
+
+def test_subset_errors():
+    chart = grey_chart("errors")
+    with pytest.raises(IndexError):
+        chart.mask([6])
+    with pytest.raises(ValueError):
+        chart.subset([1], "hsv")
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import colour
+import numpy as np
+import pytest
+
+from colorcalibrator.delta_e import (
+    delta_e,
+    delta_e_cie1994,
+    delta_e_cie2000,
+    srgb_to_lab,
+    transform_delta_e_map,
+)
+from colorcalibrator.naming import ColourNamer
+
+# Sharma, Wu and Dalal (2005), pairs 1, 2, 7, 17 and 25 of the test data
+SHARMA = [
+    ((50.0, 2.6772, -79.7751), (50.0, 0.0, -82.7485), 2.0425),
+    ((50.0, 3.1571, -77.2803), (50.0, 0.0, -82.7485), 2.8615),
+    ((50.0, 0.0, 0.0), (50.0, -1.0, 2.0), 2.3669),
+    ((50.0, 2.5, 0.0), (73.0, 25.0, -18.0), 27.1492),
+    ((60.2574, -34.0099, 36.2677), (60.4626, -34.1751, 39.4387), 1.2644),
+]
+RNG = np.random.RandomState(0)
+
+
+def test_cie2000_reference_data():
+    lab_1, lab_2, expected = (np.array(values) for values in zip(*SHARMA))
+    np.testing.assert_allclose(delta_e_cie2000(lab_1, lab_2), expected, atol=1e-4)
+    np.testing.assert_allclose(
+        delta_e(lab_1, lab_2, space="Lab"), expected, atol=1e-4
+    )
+
+
+def test_cie1994_agrees_with_colour():
+    lab_1 = RNG.uniform([0, -80, -80], [100, 80, 80], (50, 3))
+    lab_2 = lab_1 + RNG.normal(0, 5, lab_1.shape)
+    np.testing.assert_allclose(
+        delta_e_cie1994(lab_1, lab_2),
+        colour.delta_E(lab_1, lab_2, method="CIE 1994"),
+        rtol=1e-6,
+    )
+
+
+def test_srgb_to_lab():
+    rgb = RNG.uniform(0, 1, (20, 3))
+    d65 = colour.ILLUMINANTS["CIE 1931 2 Degree Standard Observer"]["D65"]
+    expected = colour.XYZ_to_Lab(colour.sRGB_to_XYZ(rgb), d65)
+    np.testing.assert_allclose(srgb_to_lab(rgb), expected, atol=0.05)
+    upscaled = srgb_to_lab(rgb * 255, upscaled=True)
+    np.testing.assert_allclose(upscaled, srgb_to_lab(rgb))
+    np.testing.assert_allclose(srgb_to_lab([1, 1, 1]), [100, 0, 0], atol=0.01)
+
+
+def test_broadcasting_and_errors():
+    colours = RNG.uniform(0, 1, (4, 5, 3))
+    differences = delta_e(colours, colours[:, :1])
+    assert differences.shape == (4, 5)
+    np.testing.assert_allclose(differences[:, 0], 0, atol=1e-9)
+    with pytest.raises(ValueError):
+        delta_e(colours, colours, method="CMC")
+    with pytest.raises(ValueError):
+        delta_e(colours, colours, space="HSV")
+
+
+def test_transform_delta_e_map():
+    """The lookup on the lattice is close to the difference of every pixel"""
+    image = RNG.uniform(0, 1, (300, 200, 3))
+
+    def darken(rgb):
+        return rgb * 0.9
+
+    delta_e_map = transform_delta_e_map(image, darken, max_size=100, tile_rows=64)
+    assert delta_e_map.shape == (100, 67)
+    quantized = np.round(image * 255) / 255
+    exact = delta_e_cie2000(srgb_to_lab(quantized), srgb_to_lab(darken(quantized)))
+    block = exact[:297, :198].reshape(99, 3, 66, 3).mean(axis=(1, 3))
+    np.testing.assert_allclose(delta_e_map[:99, :66], block, atol=0.5)
+    assert transform_delta_e_map(image, lambda rgb: rgb).max() < 0.5
+
+
+def test_colour_namer():
+    palette = {"red": (255, 0, 0), "green": (0, 128, 0), "navy": (0, 0, 128)}
+    namer = ColourNamer(palette)
+    assert namer.closest([(250, 10, 10), (0, 0, 100), (10, 140, 10)]) == [
+        "red",
+        "navy",
+        "green",
+    ]
+    assert namer.closest(np.zeros((0, 3))) == []
+
+
+def test_prefilter_gives_the_names_of_the_full_search():
+    palette = {
+        str(index): tuple(colour)
+        for index, colour in enumerate(RNG.randint(0, 256, (200, 3)))
+    }
+    colours = RNG.randint(0, 256, (500, 3))
+    names = ColourNamer(palette, chunk_size=64).closest(colours)
+    assert ColourNamer(palette, prefilter=200).closest(colours) == names
+    prefiltered = ColourNamer(palette, prefilter=20).closest(colours)
+    assert np.mean(np.array(prefiltered) == np.array(names)) > 0.98
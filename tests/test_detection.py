@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import cv2
+import numpy as np
+import pytest
+
+from colorcalibrator import transfer
+from colorcalibrator.charts import get_chart
+from colorcalibrator.detection import (
+    SEGMENTATION_WIDTH,
+    SwatchSamples,
+    _level_rectangle,
+    _to_full_resolution,
+    _working_copy,
+    detect_swatch_locations,
+    detect_swatch_samples,
+    detect_swatch_samples_coarse,
+)
+
+
+def white_balanced(samples):
+    """The linear mean colours of the swatches with the colour cast removed on
+    the white balance swatch of the chart"""
+    chart = get_chart("spyder24")
+    means = samples.means()
+    swatch = chart.white_balance_swatch
+    return means * (chart.linear[swatch] / means[swatch])
+
+
+def test_swatch_samples():
+    pixels = np.arange(4 * 5 * 3, dtype=np.float64).reshape(4, 5, 3)
+    samples = SwatchSamples(pixels)
+    assert len(samples) == 4
+    np.testing.assert_array_equal(samples.means(), pixels.mean(axis=1))
+    doubled = samples.transformed(lambda p: p * 2)
+    np.testing.assert_array_equal(doubled.pixels, pixels * 2)
+    assert len(samples.delete([0, 3])) == 2
+
+
+def test_detect_swatch_samples(card_image):
+    """The swatches are found once and ordered black first, like the chart"""
+    samples = detect_swatch_samples(transfer.decode(card_image))
+    assert samples.pixels.shape[:1] == (24,)
+    balanced = white_balanced(samples)
+    chart = get_chart("spyder24")
+    assert np.argmin(balanced.sum(axis=1)) == np.argmin(chart.linear.sum(axis=1))
+    # the bright swatches clip in the red channel of the colour cast
+    np.testing.assert_allclose(balanced, chart.linear, rtol=0.1, atol=0.01)
+
+
+def test_no_card():
+    image = np.full((300, 450, 3), 0.5)
+    with pytest.raises(IndexError):
+        detect_swatch_samples(image)
+
+
+def expected_centres(card_image):
+    """Centres (x, y) of the swatches of benchmark.synthetic_card_image, black
+    first"""
+    height, width = card_image.shape[:2]
+    card_width = width // 2
+    swatch = card_width // 7
+    gap = (card_width - 6 * swatch) // 7
+    x_0 = (width - card_width) // 2 + gap + (swatch - 1) / 2
+    y_0 = (height - (4 * swatch + 5 * gap)) // 2 + gap + (swatch - 1) / 2
+    step = swatch + gap
+    return swatch, np.array(
+        [(x_0 + col * step, y_0 + row * step) for row in range(4) for col in range(6)]
+    )
+
+
+@pytest.mark.parametrize("shape", [(1000, 1500), (1500, 1000), (720, 1440)])
+def test_to_full_resolution(shape):
+    """The segmentation rotates portrait images clockwise and resizes them to its
+    width, the corners are mapped back to the pixels of the image"""
+    height, width = shape
+    corners = np.array([[10.0, 20.0], [width - 1, 0], [width / 2, height - 1]])
+    segmented = corners
+    if width < height:  # (x, y) -> (height - 1 - y, x)
+        segmented = np.stack([height - 1 - corners[:, 1], corners[:, 0]], axis=1)
+    segmented = segmented * SEGMENTATION_WIDTH / max(height, width)
+    mapped = _to_full_resolution(segmented, shape + (3,))
+    np.testing.assert_allclose(mapped, corners, atol=1e-9)
+
+
+@pytest.mark.parametrize("portrait", [False, True])
+def test_swatch_locations(card_image, portrait):
+    """The coarse detection finds the swatches where they are, also in portrait
+    images, which the segmentation rotates"""
+    swatch, centres = expected_centres(card_image)
+    image = card_image
+    if portrait:  # rotated counter-clockwise, (x, y) -> (y, width - 1 - x)
+        image = np.ascontiguousarray(np.rot90(card_image))
+        centres = np.stack([centres[:, 1], card_image.shape[1] - 1 - centres[:, 0]], 1)
+    samples, locations = detect_swatch_locations(image, working_width=720)
+    assert np.abs(locations.centres - centres).max() < 0.1 * swatch
+
+    # sampling at the locations, e.g. in the next frame, gives the same swatches
+    resampled = locations.sample(image)
+    np.testing.assert_allclose(resampled.means(), samples.means(), rtol=0.02, atol=0.01)
+
+
+def test_coarse_agrees_with_full_detection(card_image):
+    coarse = detect_swatch_samples_coarse(card_image, working_width=720)
+    full = detect_swatch_samples(transfer.decode(card_image))
+    np.testing.assert_allclose(coarse.means(), full.means(), rtol=0.05, atol=0.002)
+
+
+def test_working_copy_is_capped():
+    """The segmentation runs at its own width, a larger copy would only be
+    resized again"""
+    image = np.zeros((2000, 3000, 3), np.uint8)
+    assert _working_copy(image, 2160).shape == (960, SEGMENTATION_WIDTH, 3)
+    assert _working_copy(image, 720).shape == (480, 720, 3)
+
+
+def test_level_rectangle():
+    """The conventions of minAreaRect before and since OpenCV 4.5.1 give the same
+    rectangle"""
+    levelled = ((5.0, 6.0), (80, 40), -20)
+    assert _level_rectangle(((5.0, 6.0), (40, 80), 70)) == levelled
+    assert _level_rectangle(((5.0, 6.0), (80, 40), -20)) == levelled
+    assert _level_rectangle(((5.0, 6.0), (40, 80), -90)) == ((5.0, 6.0), (80, 40), 0)
+    assert _level_rectangle(((5.0, 6.0), (40, 80), 90)) == ((5.0, 6.0), (80, 40), 0)
+
+
+@pytest.mark.parametrize("angle", [-30, -15, 10, 40])
+def test_swatch_locations_of_a_rotated_card(card_image, angle):
+    """The swatches of a card at an angle are found where they are, whichever
+    convention for the angle of minAreaRect the OpenCV version has"""
+    swatch, centres = expected_centres(card_image)
+    height, width = card_image.shape[:2]
+    rotation = cv2.getRotationMatrix2D(((width - 1) / 2, (height - 1) / 2), angle, 1)
+    image = cv2.warpAffine(
+        card_image,
+        rotation,
+        (width, height),
+        flags=cv2.INTER_LINEAR,
+        borderValue=tuple(int(value) for value in card_image[0, 0]),
+    )
+    centres = centres @ rotation[:, :2].T + rotation[:, 2]
+    _, locations = detect_swatch_locations(image)
+    assert np.abs(locations.centres - centres).max() < 0.1 * swatch
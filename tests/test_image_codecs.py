@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from PIL import Image
+
+from colorcalibrator.image_codecs import (
+    CODECS,
+    decode,
+    encode,
+    resolve_codec,
+    to_transport,
+)
+
+RNG = np.random.RandomState(0)
+
+
+@pytest.mark.parametrize("codec", sorted(CODECS))
+@pytest.mark.parametrize(
+    "image",
+    [
+        Image.fromarray(RNG.randint(0, 256, (17, 31, 3)).astype(np.uint8)),
+        Image.fromarray(RNG.randint(0, 256, (17, 31, 4)).astype(np.uint8)),
+        Image.fromarray(RNG.randint(0, 256, (17, 31)).astype(np.uint8)),
+    ],
+    ids=["RGB", "RGBA", "L"],
+)
+def test_lossless(codec, image):
+    if resolve_codec(codec) != codec:
+        pytest.skip("{} is not available".format(codec))
+    decoded = decode(encode(image, codec))
+    assert decoded.mode == image.mode
+    np.testing.assert_array_equal(np.asarray(decoded), np.asarray(image))
+
+
+def test_policies():
+    assert resolve_codec("speed") == "raw"
+    assert resolve_codec("balanced") == "png-fast"
+    assert resolve_codec("size") in ("webp", "png")
+    with pytest.raises(ValueError):
+        resolve_codec("jpeg")
+
+
+def test_raw_is_sent_as_png():
+    image = Image.fromarray(RNG.randint(0, 256, (5, 7, 3)).astype(np.uint8))
+    data, mimetype = to_transport(encode(image, "raw"))
+    assert mimetype == "image/png"
+    np.testing.assert_array_equal(np.asarray(decode(data)), np.asarray(image))
+    png = encode(image, "png")
+    assert to_transport(png) == (png, "image/png")
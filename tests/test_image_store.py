@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from colorcalibrator.image_store import (
+    FileBackend,
+    ImageNotFoundError,
+    ImageStore,
+    MemoryBackend,
+    image_id_for,
+    make_backend,
+)
+
+
+@pytest.fixture(params=["memory", "file"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return ImageStore(MemoryBackend())
+    return ImageStore(FileBackend(str(tmp_path)), cache=MemoryBackend(1024**2))
+
+
+def test_content_addressed(store):
+    image_id = store.put(b"some bytes")
+    assert image_id == image_id_for(b"some bytes")
+    assert store.put(b"some bytes") == image_id
+    assert image_id in store
+    assert store.get(image_id) == b"some bytes"
+    store.delete(image_id)
+    assert image_id not in store
+    with pytest.raises(ImageNotFoundError):
+        store.get(image_id)
+
+
+@pytest.mark.parametrize("image_id", ["../../etc/passwd", "0" * 15, None, "G" * 16])
+def test_invalid_ids(store, image_id):
+    assert image_id not in store
+    with pytest.raises(ImageNotFoundError):
+        store.get(image_id)
+
+
+def test_put_stream(store):
+    chunks = [b"a" * 1000, b"b" * 10, b"c"]
+    image_id = store.put_stream(iter(chunks))
+    assert image_id == image_id_for(b"".join(chunks))
+    assert store.get(image_id) == b"".join(chunks)
+
+
+def test_put_image(store):
+    array = np.random.RandomState(0).randint(0, 256, (30, 20, 3)).astype(np.uint8)
+    image_id = store.put_image(Image.fromarray(array))
+    np.testing.assert_array_equal(store.get_numpy(image_id, to_scalar=False), array)
+    assert store.metadata(image_id) == {"width": 20, "height": 30, "mode": "RGB"}
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_bytes=30)
+    for key in "abc":
+        backend.put(key, b"x" * 10)
+    backend.get("a")
+    backend.put("d", b"x" * 10)
+    assert "b" not in backend
+    assert all(key in backend for key in "acd")
+    backend.put("e", b"x" * 31)  # larger than the whole cache
+    assert "e" not in backend
+
+
+def test_file_backend_evicts_least_recently_used(tmp_path):
+    backend = FileBackend(str(tmp_path), max_bytes=30)
+    for index, key in enumerate("abc"):
+        backend.put(key, b"x" * 10)
+        os.utime(backend._path(key), (time.time() - 10 + index,) * 2)
+    backend.get("a")  # accessed now
+    backend.put("d", b"x" * 10)
+    assert sorted(os.listdir(str(tmp_path))) == ["a", "c", "d"]
+
+
+def test_file_backend_is_shared(tmp_path):
+    """The gunicorn workers see the images of each other"""
+    image_id = ImageStore(FileBackend(str(tmp_path))).put(b"data")
+    assert ImageStore(FileBackend(str(tmp_path))).get(image_id) == b"data"
+
+
+def test_make_backend(tmp_path):
+    assert isinstance(make_backend("memory"), MemoryBackend)
+    assert make_backend("file", directory=str(tmp_path)).directory == str(tmp_path)
+    with pytest.raises(ValueError):
+        make_backend("redis")
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+import pytest
+
+from colorcalibrator import jobs, timing
+
+RELEASE = threading.Event()
+
+
+def add(a, b, progress):
+    progress(0.5, "adding")
+    return a + b
+
+
+def fail(progress):
+    raise ValueError("no card")
+
+
+def wait(progress):
+    progress(0.1, "waiting")
+    RELEASE.wait(10)
+    return "released"
+
+
+def timed_stage(progress):
+    with timing.span("job_stage"):
+        return 1
+
+
+def finished(queue, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.status(job_id)
+        if job["status"] not in (jobs.QUEUED, jobs.RUNNING):
+            return job
+        time.sleep(0.01)
+    pytest.fail("job {} did not finish".format(job_id))
+
+
+@pytest.fixture
+def path(tmp_path):
+    RELEASE.clear()
+    yield str(tmp_path / "jobs.sqlite")
+    RELEASE.set()
+
+
+def test_result_and_failure(path):
+    queue = jobs.JobQueue(path)
+    job = finished(queue, queue.submit(add, 1, b=2))
+    assert job == {
+        "status": jobs.DONE,
+        "progress": 1.0,
+        "message": "adding",
+        "error": None,
+        "result": 3,
+    }
+    job = finished(queue, queue.submit(fail))
+    assert job["status"] == jobs.FAILED
+    assert job["error"] == "ValueError: no card"
+    assert queue.status("unknown") is None
+
+
+def test_concurrency_over_all_workers(path):
+    """Two queues on the same database, like two gunicorn workers, run at most
+    ``concurrency`` jobs together"""
+    first, second = jobs.JobQueue(path, 1), jobs.JobQueue(path, 1)
+    waiting = first.submit(wait)
+    queued = second.submit(add, 1, 1)
+    assert second.status(queued)["status"] == jobs.QUEUED
+    assert second.status(waiting)["status"] == jobs.RUNNING
+    RELEASE.set()
+    assert finished(first, waiting)["result"] == "released"
+    assert finished(second, queued)["result"] == 2
+
+
+def test_stalled_jobs_time_out(path):
+    """A job running longer than the timeout (of a crashed worker) no longer
+    counts against the concurrency"""
+    executor = ThreadPoolExecutor(2)
+    queue = jobs.JobQueue(path, concurrency=1, executor=executor, timeout=0.2)
+    stalled = queue.submit(wait)
+    time.sleep(0.3)
+    queued = queue.submit(add, 2, 2)
+    assert finished(queue, queued)["result"] == 4
+    job = queue.status(stalled)
+    assert job["status"] == jobs.FAILED and job["error"] == "Timed out"
+
+
+def test_timing_of_jobs_in_the_pool(path, caplog):
+    """The spans of a job that ran in another process are logged in this one"""
+    caplog.set_level(logging.INFO, logger="colorcalibrator.timing")
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+        queue = jobs.JobQueue(path, executor=executor)
+        job_id = queue.submit(timed_stage)
+        assert finished(queue, job_id)["result"] == 1
+    (record,) = [
+        r.__dict__ for r in caplog.records if getattr(r, "job_id", None) == job_id
+    ]
+    assert record["stage"] == "job"
+    assert record["stages"][0]["stage"] == "job_stage"
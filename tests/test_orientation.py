@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import itertools
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from colorcalibrator.orientation import (
+    IDENTITY,
+    flip,
+    mirror,
+    orient_array,
+    orient_pil,
+    rotate,
+)
+
+ARRAY = np.arange(2 * 3 * 3, dtype=np.uint8).reshape(2, 3, 3)
+ORIENTATIONS = list(itertools.product(range(4), (False, True)))
+
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+def test_round_trips(orientation):
+    assert rotate(rotate(rotate(rotate(orientation)))) == orientation
+    assert flip(flip(orientation)) == orientation
+    assert mirror(mirror(orientation)) == orientation
+
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+def test_pil_and_array_agree(orientation):
+    oriented = orient_pil(Image.fromarray(ARRAY), orientation)
+    expected = orient_array(ARRAY, orientation)
+    np.testing.assert_array_equal(np.asarray(oriented), expected)
+
+
+def test_actions():
+    rotated = orient_array(ARRAY, rotate(IDENTITY))
+    np.testing.assert_array_equal(rotated, np.rot90(ARRAY))
+    np.testing.assert_array_equal(orient_array(ARRAY, flip(IDENTITY)), ARRAY[::-1])
+    np.testing.assert_array_equal(orient_array(ARRAY, mirror(IDENTITY)), ARRAY[:, ::-1])
+    # the actions compose on the displayed image
+    np.testing.assert_array_equal(
+        orient_array(ARRAY, flip(rotate(IDENTITY))), np.rot90(ARRAY)[::-1]
+    )
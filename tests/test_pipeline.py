@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import pytest
+from PIL import Image
+
+from colorcalibrator import pipeline, workers
+from colorcalibrator.image_store import FileBackend, ImageStore
+from colorcalibrator.orientation import IDENTITY
+
+
+@pytest.fixture
+def card_store(tmp_path, card_image, monkeypatch):
+    """A file store with the card image, the calibration runs in the process"""
+    monkeypatch.setattr(workers, "_offload", lambda pixels: None)
+    monkeypatch.setattr(pipeline, "get_calibration_cache", lambda: None)
+    store = ImageStore(FileBackend(str(tmp_path)), codec="png")
+    return store, store.put_image(Image.fromarray(card_image))
+
+
+def calibrate():
+    return pipeline.calibrate_action("spyder24", None, "finlayson", False)
+
+
+def test_undo_redo():
+    storage = {}
+    pipeline.push(storage, {"action": "rotate"})
+    pipeline.push(storage, calibrate())
+    pipeline.push(storage, calibrate())  # replaces the calibration
+    assert [a["action"] for a in storage["action_stack"]] == ["rotate", "calibrate"]
+    assert pipeline.undo(storage) and pipeline.undo(storage)
+    assert not pipeline.undo(storage)
+    assert pipeline.redo(storage)
+    assert storage["action_stack"] == [{"action": "rotate"}]
+    pipeline.push(storage, {"action": "flip"})
+    assert storage["redo_stack"] == []
+
+
+def test_discard_failed_action():
+    failed = calibrate()
+    storage = {"action_stack": [{"action": "rotate"}, failed], "redo_stack": []}
+    # the user added an action while the job ran
+    pipeline.push(storage, {"action": "flip"})
+    assert pipeline.discard(storage, 1, failed)
+    assert storage["action_stack"] == [{"action": "rotate"}, {"action": "flip"}]
+    assert not pipeline.discard(storage, 1, failed)
+
+    # undone while the job ran
+    storage = {"action_stack": [{"action": "rotate"}, failed], "redo_stack": []}
+    pipeline.undo(storage)
+    pipeline.undo(storage)
+    assert pipeline.discard(storage, 1, failed)
+    assert storage == {"action_stack": [], "redo_stack": [{"action": "rotate"}]}
+
+    # by default the last action, nothing to drop on an empty stack
+    assert pipeline.discard(storage) is False
+    assert pipeline.redo(storage) and pipeline.discard(storage)
+    assert storage == {"action_stack": [], "redo_stack": []}
+
+
+def test_cached_only_raises_pending(card_store):
+    store, image_id = card_store
+    with pytest.raises(pipeline.PendingStage) as pending:
+        pipeline.replay(
+            store, image_id, [{"action": "rotate"}, calibrate()], cached_only=True
+        )
+    assert pending.value.args[1] == 1
+    # orientation actions never need a job
+    state = pipeline.replay(store, image_id, [{"action": "rotate"}], cached_only=True)
+    assert state["image_id"] == image_id and state["orientation"] == (1, False)
+
+
+def test_stages_are_shared_between_processes(card_store):
+    """A stage computed by a job is found by another worker with a store on the
+    same directory, without remember"""
+    store, image_id = card_store
+    actions = [calibrate(), pipeline.crop_action((10, 10, 200, 100))]
+    computed = []
+    state = pipeline.replay(store, image_id, actions, computed=computed)
+    assert len(computed) == 2
+
+    other = ImageStore(FileBackend(store.backend.directory), codec="png")
+    assert pipeline.replay(other, image_id, actions, cached_only=True) == state
+    assert other.get_pil(state["image_id"]).size == (190, 90)
+
+
+def test_stage_with_evicted_image_is_recomputed(card_store):
+    store, image_id = card_store
+    state = pipeline.replay(store, image_id, [calibrate()])
+    store.delete(state["image_id"])
+    with pytest.raises(pipeline.PendingStage):
+        pipeline.replay(store, image_id, [calibrate()], cached_only=True)
+    assert pipeline.replay(store, image_id, [calibrate()]) == state
+    assert state["image_id"] in store
+
+
+def test_calibration_of_the_oriented_image(card_image, card_store):
+    """The card of an image taken upside down is found once the image is rotated
+    in the app, the calibrated image keeps that orientation"""
+    store, image_id = card_store
+    expected = pipeline.replay(store, image_id, [calibrate()])
+    upside_down = store.put_image(Image.fromarray(card_image[::-1, ::-1]))
+    actions = [{"action": "rotate"}, {"action": "rotate"}, calibrate()]
+    state = pipeline.replay(store, upside_down, actions)
+    assert state["orientation"] == IDENTITY
+    assert state["image_id"] == expected["image_id"]
+    assert state["delta_e_max"] == pytest.approx(expected["delta_e_max"])
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from io import BytesIO as _BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from colorcalibrator import image_store, preview, server
+from colorcalibrator.image_store import ImageStore, MemoryBackend
+from colorcalibrator.preview import (
+    TILE_SIZE,
+    make_preview,
+    oriented_size,
+    visible_tiles,
+)
+
+SIZE = (3000, 2000)
+
+
+@pytest.fixture
+def image_id(monkeypatch):
+    monkeypatch.setattr(image_store, "_STORE", ImageStore(MemoryBackend()))
+    preview._oriented_image.cache_clear()  # pylint:disable=protected-access
+    preview._tile.cache_clear()  # pylint:disable=protected-access
+    gradient = np.linspace(0, 255, SIZE[0]).astype(np.uint8)
+    image = np.broadcast_to(gradient[None, :, None], (SIZE[1], SIZE[0], 3))
+    return image_store.get_image_store().put_image(Image.fromarray(image))
+
+
+def test_make_preview():
+    image = Image.new("RGB", SIZE)
+    assert make_preview(image, (0, False), max_size=600).size == (600, 400)
+    assert make_preview(image, (1, True), max_size=600).size == (400, 600)
+    assert image.size == SIZE
+    assert oriented_size(SIZE, (3, False)) == (2000, 3000)
+    assert oriented_size(SIZE, (2, True)) == SIZE
+
+
+def test_no_tiles_for_the_whole_image(image_id):
+    with server.test_request_context():
+        tiles = visible_tiles(image_id, (0, False), SIZE, (0, 3000), (0, 2000), 1600)
+    assert tiles == []
+
+
+def test_tiles_of_a_zoomed_region(image_id):
+    client = server.test_client()
+    with server.test_request_context():
+        # the y axis points up, this is the top left corner
+        tiles = visible_tiles(
+            image_id, (0, False), SIZE, (0, 600), (1400, 2000), 1600
+        )
+    assert [(tile["x"], tile["y"]) for tile in tiles] == [
+        (0, 2000 - TILE_SIZE),
+        (TILE_SIZE, 2000 - TILE_SIZE),
+        (0, 2000 - 2 * TILE_SIZE),
+        (TILE_SIZE, 2000 - 2 * TILE_SIZE),
+    ]
+    response = client.get(tiles[1]["source"])
+    assert response.status_code == 200
+    assert response.cache_control.public
+    assert response.cache_control.max_age == 24 * 3600
+    assert not response.cache_control.no_cache
+    tile = np.asarray(Image.open(_BytesIO(response.data)))
+    assert tile.shape == (TILE_SIZE, TILE_SIZE, 3)
+    # the columns 512 to 1023 of the gradient
+    assert abs(int(tile[0, 0, 0]) - 512 * 255 // 2999) <= 2
+
+    url = "/preview/{}/0/0/0/100/0.jpg".format(image_id)
+    assert client.get(url).status_code == 404
+    assert client.get("/preview/{}/0/0/0/0/0.jpg".format("0" * 16)).status_code == 404
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from colorcalibrator import transfer
+from colorcalibrator.benchmark import CAST
+from colorcalibrator.charts import get_chart
+from colorcalibrator.profile import CalibrationProfile
+
+CHART = get_chart("spyder24")
+# the references under a colour cast and a channel crosstalk, in linear RGB
+MIXING = np.array([[0.9, 0.08, 0.02], [0.05, 0.9, 0.05], [0.02, 0.1, 0.88]])
+SWATCHES = CHART.linear @ MIXING.T * CAST * 0.8
+
+
+def test_white_point():
+    profile = CalibrationProfile.fit(SWATCHES, CHART)
+    assert profile.only_white_point
+    swatch = CHART.white_balance_swatch
+    balanced = profile.apply_linear(SWATCHES)
+    np.testing.assert_allclose(balanced[swatch], CHART.linear[swatch])
+
+
+@pytest.mark.parametrize("algorithm", ["finlayson", "cheung", "vandermonde"])
+def test_colour_correction(algorithm):
+    profile = CalibrationProfile.fit(
+        SWATCHES, CHART, algorithm=algorithm, only_white_point=False
+    )
+    corrected = profile.apply_linear(SWATCHES)
+    error = np.abs(corrected - CHART.linear).max()
+    assert error < 0.02
+    assert error < np.abs(profile.white_balanced(SWATCHES) - CHART.linear).max()
+
+
+def test_excluded_swatches_are_not_fitted():
+    swatches = SWATCHES.copy()
+    swatches[5] = [1, 0, 0]  # e.g. a reflection
+    fitted = CalibrationProfile.fit(swatches, CHART, only_white_point=False)
+    excluded = CalibrationProfile.fit(
+        swatches, CHART, excluded=[5], only_white_point=False
+    )
+    mask = CHART.mask([5])
+
+    def error(profile):
+        return np.abs(profile.apply_linear(swatches)[mask] - CHART.linear[mask]).max()
+
+    assert error(excluded) < 0.02 < error(fitted)
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_apply_to_srgb(dtype):
+    profile = CalibrationProfile.fit(SWATCHES, CHART, only_white_point=False)
+    image = transfer.encode(SWATCHES.reshape(4, 6, 3))
+    image = (image * 255).round().astype(np.uint8)
+    calibrated = profile.apply(image, dtype)
+    assert calibrated.dtype == dtype
+    np.testing.assert_allclose(calibrated, CHART.srgb.reshape(4, 6, 3), atol=0.03)
+
+
+def test_save_and_load(tmp_path):
+    profile = CalibrationProfile.fit(
+        SWATCHES, CHART, excluded=[3], algorithm="cheung", only_white_point=False
+    )
+    path = str(tmp_path / "profile.json")
+    profile.save(path)
+    loaded = CalibrationProfile.load(path)
+    assert loaded.to_dict() == profile.to_dict()
+    np.testing.assert_array_equal(
+        loaded.apply_linear(SWATCHES), profile.apply_linear(SWATCHES)
+    )
+    with pytest.raises(ValueError):
+        CalibrationProfile.from_dict(dict(profile.to_dict(), version=99))
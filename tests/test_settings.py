@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+import os
+import stat
+
+import pytest
+
+from colorcalibrator.settings import runtime_directory
+
+
+def test_runtime_directory(tmp_path):
+    directory = runtime_directory(str(tmp_path))
+    assert directory == str(tmp_path / "colorcalibrator-{}".format(os.getuid()))
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+    assert runtime_directory(str(tmp_path)) == directory
+
+
+def test_runtime_directory_must_be_private(tmp_path):
+    """A directory (or link) another user could have created is not used"""
+    directory = tmp_path / "colorcalibrator-{}".format(os.getuid())
+    directory.mkdir(0o755)
+    os.chmod(str(directory), 0o755)
+    with pytest.raises(PermissionError):
+        runtime_directory(str(tmp_path))
+    directory.rmdir()
+
+    (tmp_path / "elsewhere").mkdir(0o700)
+    directory.symlink_to(tmp_path / "elsewhere")
+    with pytest.raises(PermissionError):
+        runtime_directory(str(tmp_path))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import runpy
+
+import pytest
+
+from colorcalibrator import timing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def restore_logging():
+    loggers = [logging.getLogger(name) for name in ("", "colorcalibrator.timing")]
+    saved = [(log, log.handlers[:], log.level, log.propagate) for log in loggers]
+    yield
+    for logger, handlers, level, propagate in saved:
+        logger.handlers[:] = handlers
+        logger.setLevel(level)
+        logger.propagate = propagate
+
+
+def test_nested_spans():
+    with timing.span("outer") as outer:
+        with timing.span("inner"):
+            pass
+    assert [stage["stage"] for stage in outer.stages] == ["inner"]
+    exposition = timing.HISTOGRAMS.exposition()
+    assert 'colorcalibrator_stage_seconds_count{stage="inner"}' in exposition
+
+
+def test_gunicorn_logs_the_timing_records(capsys, restore_logging):
+    """The logging.conf of gunicorn_conf.py routes a timed callback to stdout
+    as JSON"""
+    pytest.importorskip("gunicorn")
+    from gunicorn.config import Config  # pylint:disable=import-outside-toplevel
+    from gunicorn.glogging import Logger  # pylint:disable=import-outside-toplevel
+
+    config = Config()
+    settings = runpy.run_path(os.path.join(ROOT, "gunicorn_conf.py"))
+    config.set("logconfig", settings["logconfig"])
+    Logger(config)
+
+    @timing.timed("callback")
+    def callback():
+        with timing.span("stage"):
+            return 1
+
+    assert callback() == 1
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    record = records[-1]
+    assert record["logger"] == "colorcalibrator.timing"
+    assert record["stage"] == "callback"
+    assert record["stages"][0]["stage"] == "stage"
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import colour
+import numpy as np
+import pytest
+
+from colorcalibrator import transfer
+
+VALUES = np.linspace(0, 1, 10001)
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_uint8_table(dtype):
+    levels = np.arange(256, dtype=np.uint8)
+    decoded = transfer.decode(levels, dtype)
+    assert decoded.dtype == dtype
+    np.testing.assert_allclose(
+        decoded, colour.cctf_decoding(levels / 255), rtol=1e-6, atol=1e-7
+    )
+
+
+def test_float32_tables_are_within_their_error():
+    decoded = transfer.decode(VALUES.astype(np.float32), np.float32)
+    assert decoded.dtype == np.float32
+    assert np.abs(decoded - colour.cctf_decoding(VALUES)).max() < 1e-4
+    encoded = transfer.encode(VALUES.astype(np.float32))
+    assert encoded.dtype == np.float32
+    assert np.abs(encoded - colour.cctf_encoding(VALUES)).max() < 1e-4
+
+
+def test_float32_is_clipped():
+    values = np.array([-0.5, 1.5], dtype=np.float32)
+    np.testing.assert_allclose(transfer.encode(values), [0, 1])
+
+
+def test_float64_is_exact():
+    np.testing.assert_array_equal(
+        transfer.decode(VALUES), colour.cctf_decoding(VALUES)
+    )
+    np.testing.assert_allclose(transfer.encode(transfer.decode(VALUES)), VALUES)
+
+
+def test_uint8_round_trip_in_float32():
+    """8 bit images calibrated in float32 differ by at most one level"""
+    levels = np.arange(256, dtype=np.uint8)
+    encoded = transfer.encode(transfer.decode(levels, np.float32))
+    assert np.abs(np.round(encoded * 255) - levels).max() <= 1
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from colorcalibrator import transfer, utils
+from colorcalibrator.charts import get_chart
+from colorcalibrator.detection import detect_swatch_samples
+
+
+@pytest.fixture(scope="module")
+def calibrated_at_once(card_image):
+    """The calibration of the card image without bands, per dtype"""
+    results = {}
+
+    def calibrated(dtype):
+        if dtype not in results:
+            results[dtype] = utils.calibrate_image(
+                card_image, "spyder24", dtype=dtype, return_profile=True
+            )
+        return results[dtype]
+
+    return calibrated
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+@pytest.mark.parametrize("tile_rows", [97, 333, 10000])
+def test_tiled_calibration(card_image, calibrated_at_once, dtype, tile_rows):
+    """Calibrating in bands of rows (also if they do not divide the height) gives
+    the image of the calibration at once, with float32 the lookup tables"""
+    assert card_image.shape[0] % 97 and card_image.shape[0] % 333
+    expected, expected_df, profile = calibrated_at_once(dtype)
+    calibrated, merged_df = utils.calibrate_image(
+        card_image, "spyder24", dtype=dtype, tile_rows=tile_rows
+    )
+    np.testing.assert_array_equal(np.asarray(calibrated), np.asarray(expected))
+    np.testing.assert_allclose(merged_df["delta_e"], expected_df["delta_e"])
+
+    tiled = utils.apply_profile(card_image, profile, tile_rows, dtype)
+    untiled = utils.apply_profile(card_image, profile, dtype=dtype)
+    np.testing.assert_array_equal(np.asarray(tiled), np.asarray(untiled))
+    np.testing.assert_array_equal(np.asarray(tiled), np.asarray(expected))
+
+
+def test_fit_profile_from_samples_defaults(card_image, calibrated_at_once):
+    """The same defaults as calibrate_image: the white point only"""
+    samples = detect_swatch_samples(transfer.decode(card_image))
+    profile = utils.fit_profile_from_samples(samples, get_chart("spyder24"))
+    assert profile.only_white_point
+    expected = calibrated_at_once(np.float64)[-1]
+    np.testing.assert_allclose(profile.white_balance, expected.white_balance)
+
+
+def test_tiled_calibration_with_coarse_detection(card_image):
+    """Without a full-size linear image"""
+    expected, _ = utils.calibrate_image(
+        card_image, "spyder24", dtype=np.float32, detection_width=1440
+    )
+    calibrated, _ = utils.calibrate_image(
+        card_image, "spyder24", dtype=np.float32, detection_width=1440, tile_rows=333
+    )
+    np.testing.assert_array_equal(np.asarray(calibrated), np.asarray(expected))
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.float64])
+def test_region_statistics(dtype):
+    """The histogram statistics of uint8 regions agree with numpy"""
+    array = np.random.RandomState(0).randint(0, 256, (37, 23, 4)).astype(dtype)
+    box = (3, 5, 20, 30)
+    stats = utils.region_statistics(
+        array, box, percentiles=(1, 10, 90), histogram_bins=16
+    )
+    region = array[5:30, 3:20, :3].reshape(-1, 3).astype(np.float64)
+    assert stats["n_pixels"] == 17 * 25
+    np.testing.assert_allclose(stats["mean"], region.mean(axis=0))
+    np.testing.assert_allclose(stats["std"], region.std(axis=0))
+    np.testing.assert_allclose(stats["median"], np.percentile(region, 50, axis=0))
+    assert list(stats["percentiles"]) == [1, 10, 90]
+    for percentile, values in stats["percentiles"].items():
+        np.testing.assert_allclose(values, np.percentile(region, percentile, axis=0))
+    assert stats["histogram"].shape == (3, 16)
+    assert (stats["histogram"].sum(axis=1) == len(region)).all()
+
+    with pytest.raises(ValueError):
+        utils.region_statistics(array, (10, 10, 10, 20))
+
+
+def test_histogram_quantiles():
+    values = np.array([0, 0, 3, 7, 7, 7, 255])
+    counts = np.bincount(values, minlength=256)
+    levels = [0, 10, 33, 50, 99, 100]
+    np.testing.assert_allclose(
+        utils._histogram_quantiles(counts, levels), np.percentile(values, levels)
+    )
+
+
+def test_statistics_table():
+    stats = utils.region_statistics(np.full((2, 3, 3), (10, 20, 30), np.uint8))
+    rows = utils.statistics_table(stats)
+    assert [row["statistic"] for row in rows] == [
+        "mean",
+        "std",
+        "median",
+        "p5",
+        "p25",
+        "p75",
+        "p95",
+        "pixels",
+    ]
+    assert rows[0] == {"statistic": "mean", "R": 10, "G": 20, "B": 30}
+    assert rows[1] == {"statistic": "std", "R": 0, "G": 0, "B": 0}
+    assert rows[-1] == {"statistic": "pixels", "R": 6, "G": 6, "B": 6}
+
+
+@pytest.mark.parametrize(
+    "x, y, box",
+    [
+        ((10, 50), (20, 80), (10, 20, 50, 80)),  # y points up
+        ((50, 10), (80, 20), (10, 20, 50, 80)),  # reversed ranges
+        ((-30, 500), (-5, 150), (0, 0, 200, 100)),  # beyond the image
+        ((-30, -10), (20, 80), (0, 20, 0, 80)),  # left of the image
+        ((210, 250), (20, 80), (200, 20, 200, 80)),  # right of the image
+        ((10, 50), (120, 150), (10, 0, 50, 0)),  # above the image
+        ((10, 10), (20, 80), (10, 20, 10, 80)),  # empty
+    ],
+)
+def test_selection_box(x, y, box):
+    assert utils.selection_box(x, y, (200, 100)) == box
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import csv
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from colorcalibrator import transfer, video, workers
+from colorcalibrator.__main__ import main
+from colorcalibrator.charts import get_chart
+from colorcalibrator.detection import detect_swatch_samples
+from colorcalibrator.utils import fit_profile_from_samples
+
+
+@pytest.fixture
+def sequence(tmp_path, card_image):
+    """Four frames of the card, moving to the right"""
+    frames = tmp_path / "frames"
+    frames.mkdir()
+    for index in range(4):
+        frame = np.roll(card_image, 3 * index, axis=1)
+        Image.fromarray(frame).save(str(frames / "{:03}.png".format(index)))
+    return frames
+
+
+def test_calibrate_video(tmp_path, sequence):
+    output = str(tmp_path / "calibrated.mp4")
+    summary = video.calibrate_video(
+        str(sequence), output, roi=(10, 10, 50, 30), card="auto", keyframe_interval=2
+    )
+    assert summary["frames"] == 4 and summary["fps"] == video.DEFAULT_FPS
+    assert summary["keyframes"] == summary["detections"] == 2
+    assert summary["refits"] >= 1
+    assert summary["series"] == str(tmp_path / "calibrated.csv")
+
+    with open(summary["series"], newline="") as handle:
+        rows = list(csv.DictReader(handle))
+    assert list(rows[0]) == video.SERIES_COLUMNS + video.ROI_COLUMNS
+    assert [row["frame"] for row in rows] == ["0", "1", "2", "3"]
+    assert [row["keyframe"] for row in rows] == ["True", "False", "True", "False"]
+    assert {row["card"] for row in rows} == {"spyder24"}
+    assert all(float(row["delta_e"]) < 5 for row in rows)
+
+    capture = cv2.VideoCapture(output)
+    try:
+        assert capture.get(cv2.CAP_PROP_FRAME_COUNT) == 4
+    finally:
+        capture.release()
+
+
+def test_no_card_in_the_first_frame(tmp_path, card_image):
+    frames = tmp_path / "frames"
+    frames.mkdir()
+    Image.fromarray(np.zeros_like(card_image)).save(str(frames / "0.png"))
+    with pytest.raises(ValueError):
+        video.calibrate_video(str(frames), str(tmp_path / "out.mp4"))
+    with pytest.raises(ValueError):
+        list(video.iter_frames(str(tmp_path / "empty")))
+
+
+def test_prefetch():
+    assert list(video._prefetch(iter(range(10)))) == list(range(10))
+
+    def failing():
+        yield 1
+        raise OSError("truncated")
+
+    frames = video._prefetch(failing())
+    assert next(frames) == 1
+    with pytest.raises(OSError):
+        next(frames)
+
+
+def test_swatch_delta_e(card_image):
+    chart = get_chart("spyder24")
+    samples = detect_swatch_samples(transfer.decode(card_image))
+    profile = fit_profile_from_samples(samples, chart)
+    fitted = video.swatch_delta_e(profile, samples, chart)
+    assert 0 <= fitted < 5
+    # the mean over the halves of the swatches
+    first, second = list(range(12)), list(range(12, 24))
+    halves = [
+        video.swatch_delta_e(profile, samples, chart, half) for half in (first, second)
+    ]
+    assert np.mean(halves) == pytest.approx(fitted)
+
+
+@pytest.mark.parametrize("interval", [0, -1])
+def test_keyframe_interval_must_be_positive(tmp_path, sequence, capsys, interval):
+    output = str(tmp_path / "out.mp4")
+    with pytest.raises(ValueError):
+        video.calibrate_video(str(sequence), output, keyframe_interval=interval)
+    with pytest.raises(SystemExit):
+        main(
+            ["video", str(sequence), "-o", output, "--keyframe-interval", str(interval)]
+        )
+    assert "positive integer" in capsys.readouterr().err
+
+
+def test_roi_colour_in_the_process(monkeypatch):
+    """Large regions of interest do not start the pool"""
+
+    def offload(pixels):
+        raise AssertionError("the pool was used")
+
+    monkeypatch.setattr(workers, "_offload", offload)
+    frame = np.zeros((1000, 1200, 3), dtype=np.uint8)
+    frame[:, 600:] = (200, 100, 50)
+    colour = video._roi_colour((-10, 0, 1300, 1000), frame)
+    assert colour == {
+        "r": 100.0,
+        "g": 50.0,
+        "b": 25.0,
+        "r_std": 100.0,
+        "g_std": 50.0,
+        "b_std": 25.0,
+    }
+    assert video._roi_colour((700, 900, 600, 10), frame)["r"] == 200.0
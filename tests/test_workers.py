@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import re
+
+import numpy as np
+import pytest
+
+from colorcalibrator import server, timing, utils, workers
+
+
+def stage_count(stage):
+    """Count of the stage in the /metrics of this process"""
+    exposition = server.test_client().get("/metrics").get_data(as_text=True)
+    match = re.search(
+        r'colorcalibrator_stage_seconds_count\{{stage="{}"\}} (\d+)'.format(stage),
+        exposition,
+    )
+    return int(match.group(1)) if match else 0
+
+
+def test_pool_size():
+    assert workers.pool_size(0, 8) == 0
+    assert workers.pool_size(0.5, 8) == 4
+    assert workers.pool_size(0.01, 8) == 1
+    # the gunicorn workers share the cores
+    assert workers.pool_size(0.5, 8, workers=2) == 2
+    assert workers.pool_size(1, 8, workers=3) == 3
+    assert workers.pool_size(0.5, 2, workers=4) == 1
+
+
+@pytest.mark.parametrize("shared", [True, False])
+def test_shared_array_round_trip(monkeypatch, shared):
+    if not shared:
+        monkeypatch.setattr(workers, "shared_memory", None)
+    array = np.arange(24, dtype=np.float32).reshape(2, 4, 3)
+    with workers.SharedArray(array) as block:
+        with workers.attach(block.descriptor) as attached:
+            np.testing.assert_array_equal(attached, array)
+
+
+@pytest.mark.parametrize("shared", [True, False])
+def test_calibrate_image_in_pool(monkeypatch, card_image, shared):
+    """The pool gives the same image as the calibration in the process, also
+    without shared memory (python 3.7), where the pixels are pickled back"""
+    if not shared:
+        monkeypatch.setattr(workers, "shared_memory", None)
+    expected, expected_df = utils.calibrate_image(
+        card_image, "spyder24", only_white_point=False
+    )
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+        monkeypatch.setattr(workers, "_offload", lambda pixels: pool)
+        calibrated, merged_df = workers.calibrate_image(
+            card_image, "spyder24", only_white_point=False
+        )
+    np.testing.assert_array_equal(np.asarray(calibrated), np.asarray(expected))
+    np.testing.assert_allclose(merged_df["delta_e"], expected_df["delta_e"])
+
+
+def test_pool_timing_reaches_the_metrics(monkeypatch, card_image):
+    """The spans of a calibration in the pool are reported in this process"""
+    before = {stage: stage_count(stage) for stage in ("calibrate_image", "detect")}
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+        monkeypatch.setattr(workers, "_offload", lambda pixels: pool)
+        with timing.span("callback") as callback:
+            workers.calibrate_image(card_image, "spyder24")
+    assert {stage: stage_count(stage) - count for stage, count in before.items()} == {
+        "calibrate_image": 1,
+        "detect": 1,
+    }
+    assert callback.stages[0]["stage"] == "calibrate_image"
+
+
+def test_region_statistics_without_shared_memory(monkeypatch):
+    monkeypatch.setattr(workers, "shared_memory", None)
+    region = np.random.RandomState(0).randint(0, 256, (50, 40, 3)).astype(np.uint8)
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+        monkeypatch.setattr(workers, "_offload", lambda pixels: pool)
+        stats = workers.region_statistics(region)
+    np.testing.assert_allclose(stats["mean"], utils.region_statistics(region)["mean"])